@@ -0,0 +1,97 @@
+import collections
+import logging
+import time
+
+import requests
+
+from jam.libs.jenkins import Jenkins
+
+
+logger = logging.getLogger(__name__)
+
+
+def get_job_url(item):
+    """
+    :param dict item: The item of the queue.
+    :return str: The URL of the job of the item, ``None`` if Jenkins does not tell.
+    """
+    return (item.get('task') or {}).get('url')
+
+
+class AffinityIndex(object):
+    """Knows which agents recently built which jobs, and therefore hold a warm workspace and warm caches for them.
+
+    It is filled from the Jenkins build history, at most once every ``refresh_interval`` seconds. A job is active when
+    it has been built within ``active_period``: the most recent of its builders that is online does not get switched
+    off, so that the job always has a warm agent at hand.
+    """
+    DEFAULT_REFRESH_INTERVAL = 5 * 60
+    DEFAULT_ACTIVE_PERIOD = 60 * 60
+
+    def __init__(self, refresh_interval=DEFAULT_REFRESH_INTERVAL, active_period=DEFAULT_ACTIVE_PERIOD,
+                 depth=Jenkins.DEFAULT_BUILD_HISTORY_DEPTH):
+        """
+        :param float refresh_interval: How often to read the build history, in seconds.
+        :param float active_period: How long after its last build a job counts as active, in seconds.
+        :param int depth: How many builds to look at per job.
+        """
+        self.refresh_interval = refresh_interval
+        self.active_period = active_period
+        self.depth = depth
+        self.builders = {}
+        self.last_builds = {}
+        self.refreshed_at = None
+
+    def refresh(self, jenkins, now=None):
+        """Reads the build history again, if it is due.
+
+        The index stays as it was when Jenkins cannot be reached, or gives an unexpected answer: the affinity is only a
+        preference.
+
+        :param jam.libs.jenkins.Jenkins jenkins: Where to read the build history from.
+        :param float now: The current time, as a UNIX timestamp.
+        """
+        now = time.time() if now is None else now
+        if self.refreshed_at is not None and now - self.refreshed_at < self.refresh_interval:
+            return
+        try:
+            history = jenkins.get_build_history(depth=self.depth)
+        except requests.ConnectionError:
+            return
+        except (ValueError, KeyError):
+            logger.warning("[%s] Could not read the build history, the affinity stays as it was.",
+                           self.__class__.__name__, exc_info=True)
+            return
+        self.refreshed_at = now
+        builds = collections.defaultdict(dict)
+        for job_url, agent_name, started_at in history:
+            builds[job_url][agent_name] = max(started_at, builds[job_url].get(agent_name, started_at))
+        self.builders = {
+            job_url: tuple(sorted(agents, key=lambda agent_name: -agents[agent_name]))
+            for job_url, agents in builds.items()
+        }
+        self.last_builds = {job_url: max(agents.values()) for job_url, agents in builds.items()}
+
+    def get_preferred_nodes(self, item):
+        """
+        :param dict item: The item of the queue.
+        :return tuple(str): The names of the agents that recently built the job, the most recent first.
+        """
+        return self.builders.get(get_job_url(item), ())
+
+    def get_protected_nodes(self, online_node_names, now=None):
+        """
+        :param list(str) online_node_names: The names of the nodes that are online or switching on.
+        :param float now: The current time, as a UNIX timestamp.
+        :return frozenset(str): The names of the nodes that are the last warm agent of an active job.
+        """
+        now = time.time() if now is None else now
+        online_node_names = set(online_node_names)
+        protected = set()
+        for job_url, last_build in self.last_builds.items():
+            if now - last_build > self.active_period:
+                continue
+            name = next((name for name in self.builders[job_url] if name in online_node_names), None)
+            if name is not None:
+                protected.add(name)
+        return frozenset(protected)
@@ -1,8 +1,11 @@
 import collections
 import datetime
+import hashlib
 import json
 import logging
+import os
 import re
+import threading
 import time
 
 import enum
@@ -10,16 +13,25 @@ from typing import Dict, List, Tuple, Set, FrozenSet
 
 import googleapiclient
 import googleapiclient.discovery
+import googleapiclient.discovery_cache.base
 import googleapiclient.errors
+import httplib2
 import oauth2client.client
 
+from jam.libs.utils import Deadline, write_atomically
+
 
 logger = logging.getLogger(__name__)
 
 
-TIME_SLEEP_WAIT_FOR_OPERATION = 1
+TIME_SLEEP_WAIT_FOR_OPERATION = 0.5
+TIME_SLEEP_WAIT_FOR_OPERATION_MAX = 5
+BACKOFF_FACTOR_WAIT_FOR_OPERATION = 1.5
 TIME_SLEEP_WAIT_FOR_STATUS = 3
 
+# The HTTP transport of the API client is not thread-safe: requests are serialized, waits are not.
+API_LOCK = threading.RLock()
+
 
 class ComputeEngineError(Exception):
     pass
@@ -29,16 +41,80 @@ class InstanceNotFound(ComputeEngineError):
     pass
 
 
-def wait_for_operation(compute, project, gce_zone, operation):
+class PermissionDenied(ComputeEngineError):
+    pass
+
+
+BatchResult = collections.namedtuple('BatchResult', ['response', 'error'])
+
+
+def parse_timestamp(timestamp):
+    """Parses a timestamp of the API, such as ``2018-02-09T09:24:41.627-08:00``.
+
+    :param str timestamp: The RFC 3339 timestamp.
+    :return datetime.datetime: The timezone-aware date and time.
+    """
+    timestamp = re.sub(r'Z$', '+00:00', timestamp)
+    timestamp = re.sub(r'([+-]\d\d):(\d\d)$', r'\1\2', timestamp)
+    timestamp_format = '%Y-%m-%dT%H:%M:%S.%f%z' if '.' in timestamp else '%Y-%m-%dT%H:%M:%S%z'
+    return datetime.datetime.strptime(timestamp, timestamp_format)
+
+
+def build_name_filter(names):
+    """Builds an API filter matching the instances with one of the given names.
+
+    :param list(str) names: The names of the instances.
+    :return str: The filter, ``None`` if there is no name.
+    """
+    names = list(names)
+    if not names:
+        return None
+    return ' OR '.join(f'(name = "{name}")' for name in names)
+
+
+def execute(request, http=None):
+    """Executes an API request.
+
+    :param googleapiclient.http.HttpRequest request: The request to execute.
+    :param httplib2.Http http: A transport dedicated to this request. If none, the shared one is used, one request
+        at a time.
+    :return dict: The response.
+    """
+    if http is not None:
+        return request.execute(http=http)
+    with API_LOCK:
+        return request.execute()
+
+
+def wait_for_operation(compute, project, gce_zone, operation, http_factory=None, deadline=None):
+    """Waits for a zone operation to be done.
+
+    When a dedicated HTTP transport can be built and the API supports it, the operation is long-polled: the server
+    answers as soon as the operation is done. Otherwise, it is polled, less and less often.
+
+    :param compute: The Compute Engine API client.
+    :param str project: The project of the operation.
+    :param str gce_zone: The zone of the operation.
+    :param operation: The operation, or its name.
+    :param callable http_factory: Builds dedicated HTTP transports, needed to long-poll.
+    :param jam.libs.utils.Deadline deadline: How long to wait at most. Forever by default.
+    :return dict: The operation, once done.
+    :raise jam.libs.utils.DeadlineExceeded: The operation is still not done by the deadline.
+    """
     logger.debug('Waiting for operation to finish...')
     operation = operation['name'] if isinstance(operation, Dict) else operation
+    deadline = Deadline() if deadline is None else deadline
+    zone_operations = compute.zoneOperations()
+    http = None
+    if http_factory is not None and hasattr(zone_operations, 'wait'):
+        http = http_factory()
+    time_sleep = TIME_SLEEP_WAIT_FOR_OPERATION
     previous_status = None
     while True:
-        result = compute.zoneOperations().get(
-            project=project,
-            zone=gce_zone,
-            operation=operation,
-        ).execute()
+        if http is not None:
+            result = execute(zone_operations.wait(project=project, zone=gce_zone, operation=operation), http=http)
+        else:
+            result = execute(zone_operations.get(project=project, zone=gce_zone, operation=operation))
 
         if not previous_status == result['status']:
             logger.info("Operation %s is %s", result['operationType'], result['status'])
@@ -49,7 +125,10 @@ def wait_for_operation(compute, project, gce_zone, operation):
                 raise ComputeEngineError(result['error'])
             return result
 
-        time.sleep(TIME_SLEEP_WAIT_FOR_OPERATION)
+        deadline.check(f"operation {operation}")
+        if http is None:
+            time.sleep(deadline.get_sleep(time_sleep))
+            time_sleep = min(time_sleep * BACKOFF_FACTOR_WAIT_FOR_OPERATION, TIME_SLEEP_WAIT_FOR_OPERATION_MAX)
 
 
 class InstanceStatus(str, enum.Enum):
@@ -86,11 +165,79 @@ class InstanceStatus(str, enum.Enum):
     TERMINATED = 'TERMINATED'
 
 
+class DiscoveryCache(googleapiclient.discovery_cache.base.Cache):
+    """Keeps the discovery documents on disk, so that a new process does not have to download them again.
+
+    The documents are stored per version of the API client, and expire after ``ttl`` seconds.
+    """
+    DEFAULT_TTL = 24 * 60 * 60
+    DEFAULT_DIRECTORY = os.path.join(os.path.expanduser('~'), '.cache', 'jam', 'discovery')
+
+    def __init__(self, directory=DEFAULT_DIRECTORY, ttl=DEFAULT_TTL):
+        """
+        :param str directory: Where to store the discovery documents.
+        :param float ttl: How long a discovery document is valid, in seconds.
+        """
+        self.directory = directory
+        self.ttl = ttl
+
+    def get_path(self, url):
+        key = hashlib.sha256(f'{googleapiclient.__version__} {url}'.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, f'{key}.json')
+
+    def get(self, url):
+        path = self.get_path(url)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                return None
+            with open(path, 'r') as cached_file:
+                return cached_file.read()
+        except OSError:
+            return None
+
+    def set(self, url, content):
+        if isinstance(content, bytes):
+            content = content.decode('utf-8')
+        try:
+            write_atomically(self.get_path(url), content)
+        except OSError:
+            logger.warning("[%s] Could not cache the discovery document of %s in %s.",
+                           self.__class__.__name__, url, self.directory, exc_info=True)
+
+
+class PowerMode(str, enum.Enum):
+    """How an instance gets switched off."""
+
+    """The instance is shut down, and boots from scratch when started again."""
+    STOP = 'stop'
+
+    """The instance keeps its memory state, and carries on where it was when resumed."""
+    SUSPEND = 'suspend'
+
+
 class ComputeEngine(object):
-    def __init__(self, project, gce_zone, http=None):
+    MAX_BATCH_SIZE = 1000
+    # How long to wait for the API to answer, in seconds. A long-polled operation can take up to 2 minutes to answer.
+    HTTP_TIMEOUT = 60
+    LONG_POLL_HTTP_TIMEOUT = 3 * 60
+    DEFAULT_INSTANCE_FIELDS = 'name,status,selfLink,lastStartTimestamp'
+
+    def __init__(self, project, gce_zone, http=None, instance_fields=DEFAULT_INSTANCE_FIELDS, instance_filter=None,
+                 discovery_cache=None):
+        """
+        :param str project: The Google Compute Engine project.
+        :param str gce_zone: The zone of the instances.
+        :param httplib2.Http http: The HTTP transport to use, instead of an authorized one.
+        :param str instance_fields: The fields of the instances to retrieve (partial response), ``None`` for all.
+        :param str instance_filter: Which instances to list, ``None`` for all of them.
+        :param DiscoveryCache discovery_cache: Where to cache the discovery document, ``None`` not to cache it.
+        """
         self.project = project
         self.gce_zone = gce_zone
         self.http = http
+        self.instance_fields = instance_fields
+        self.instance_filter = instance_filter
+        self.discovery_cache = discovery_cache
         self.credentials = None
         self.__compute = None
         self.__instances = collections.OrderedDict()
@@ -98,51 +245,209 @@ class ComputeEngine(object):
     @property
     def compute(self):
         if self.__compute is None:
-            if self.http is None:
+            http = self.http
+            if http is None:
                 self.credentials = oauth2client.client.GoogleCredentials.get_application_default()  # pragma: no cover
+                http = self.credentials.authorize(httplib2.Http(timeout=self.HTTP_TIMEOUT))  # pragma: no cover
             self.__compute = googleapiclient.discovery.build(
-                'compute', 'v1', credentials=self.credentials, cache_discovery=False, http=self.http
+                'compute', 'v1', http=http,
+                cache_discovery=self.discovery_cache is not None, cache=self.discovery_cache,
             )
         return self.__compute
 
+    @property
+    def http_factory(self):
+        """Builds HTTP transports dedicated to a caller, ``None`` when an HTTP transport was injected."""
+        if self.http is not None:
+            return None
+        return self.__build_http  # pragma: no cover
+
+    def __build_http(self):
+        return self.credentials.authorize(httplib2.Http(timeout=self.LONG_POLL_HTTP_TIMEOUT))  # pragma: no cover
+
     def get_instance(self, name):
-        return self.__instances.setdefault(name, ComputeEngineInstance(
-            name=name,
-            compute=self.compute,
-            project=self.project,
-            gce_zone=self.gce_zone,
-        ))
+        if name not in self.__instances:
+            self.__instances[name] = ComputeEngineInstance(
+                name=name,
+                compute=self.compute,
+                project=self.project,
+                gce_zone=self.gce_zone,
+                http_factory=self.http_factory,
+                fields=self.instance_fields,
+            )
+        return self.__instances[name]
 
     def wait_for_operation(self, operation):
         return wait_for_operation(
-            compute=self.compute, project=self.project, gce_zone=self.gce_zone, operation=operation['name']
+            compute=self.compute, project=self.project, gce_zone=self.gce_zone, operation=operation['name'],
+            http_factory=self.http_factory,
         )
 
+    def execute_many(self, requests):
+        """Executes requests in as few round trips as possible.
+
+        :param dict requests: The requests to execute, by name.
+        :return dict: A :class:`BatchResult` by name, whose error is a :class:`googleapiclient.errors.HttpError`.
+        """
+        results = collections.OrderedDict()
+
+        def callback(request_id, response, exception):
+            results[request_id] = BatchResult(response=response, error=exception)
+
+        names = list(requests)
+        for index in range(0, len(names), self.MAX_BATCH_SIZE):
+            batch = self.compute.new_batch_http_request(callback=callback)
+            for name in names[index:index + self.MAX_BATCH_SIZE]:
+                batch.add(requests[name], request_id=name)
+            execute(batch)
+        return results
+
+    def __execute_on_instances(self, instances, method, **kwargs):
+        instances = list(instances)
+        results = self.execute_many(collections.OrderedDict(
+            (instance.name, getattr(self.compute.instances(), method)(
+                project=instance.project, zone=instance.gce_zone, instance=instance.name, **kwargs
+            ))
+            for instance in instances
+        ))
+        mapped_results = collections.OrderedDict()
+        for instance in instances:
+            response, error = results[instance.name]
+            mapped_results[instance.name] = BatchResult(
+                response=response, error=None if error is None else instance.map_error(error)
+            )
+        return mapped_results
+
+    def refresh_many(self, instances):
+        """Refreshes several instances in a single round trip.
+
+        :param list(ComputeEngineInstance) instances: The instances to refresh.
+        :return dict: A :class:`BatchResult` by instance name, whose response is the instance's information.
+        """
+        kwargs = {} if self.instance_fields is None else {'fields': self.instance_fields}
+        results = self.__execute_on_instances(instances=instances, method='get', **kwargs)
+        info_ts = datetime.datetime.now()
+        for instance in instances:
+            if results[instance.name].error is None:
+                instance.update_info(info=results[instance.name].response, info_ts=info_ts)
+        return results
+
+    def __transition_many(self, instances, method, wait):
+        instances = list(instances)
+        logger.info("[%s %s] Calling %s on instances %s.", self.__class__.__name__, self.project, method,
+                    ', '.join(instance.name for instance in instances))
+        results = self.__execute_on_instances(instances=instances, method=method)
+        if not wait:
+            return results
+        for instance in instances:
+            if results[instance.name].error is None:
+                try:
+                    results[instance.name] = BatchResult(
+                        response=instance.wait_for_operation(operation=results[instance.name].response), error=None
+                    )
+                except ComputeEngineError as err:
+                    results[instance.name] = BatchResult(response=None, error=err)
+        return results
+
+    def start_many(self, instances, wait=True):
+        """Starts several instances in a single round trip.
+
+        :param list(ComputeEngineInstance) instances: The instances to start.
+        :param bool wait: Whether to wait for the operations to be done.
+        :return dict: A :class:`BatchResult` by instance name, whose response is the operation.
+        """
+        return self.__transition_many(instances=instances, method='start', wait=wait)
+
+    def stop_many(self, instances, wait=True):
+        """Stops several instances in a single round trip.
+
+        :param list(ComputeEngineInstance) instances: The instances to stop.
+        :param bool wait: Whether to wait for the operations to be done.
+        :return dict: A :class:`BatchResult` by instance name, whose response is the operation.
+        """
+        return self.__transition_many(instances=instances, method='stop', wait=wait)
+
+    def suspend_many(self, instances, wait=True):
+        """Suspends several instances in a single round trip.
+
+        :param list(ComputeEngineInstance) instances: The instances to suspend.
+        :param bool wait: Whether to wait for the operations to be done.
+        :return dict: A :class:`BatchResult` by instance name, whose response is the operation.
+        """
+        return self.__transition_many(instances=instances, method='suspend', wait=wait)
+
+    def resume_many(self, instances, wait=True):
+        """Resumes several instances in a single round trip.
+
+        :param list(ComputeEngineInstance) instances: The instances to resume.
+        :param bool wait: Whether to wait for the operations to be done.
+        :return dict: A :class:`BatchResult` by instance name, whose response is the operation.
+        """
+        return self.__transition_many(instances=instances, method='resume', wait=wait)
+
     @property
     def instances(self):
-        result = self.compute.instances().list(project=self.project, zone=self.gce_zone).execute()
-        result_ts = datetime.datetime.now()
-        self.__instances = {
-            item['name']: ComputeEngineInstance.build_from_info(
-                compute=self.compute,
-                info=item,
-                info_ts=result_ts,
-            ) for item in result['items']
-        }
+        return self.list_instances()
+
+    def iter_instances(self, instance_filter=None):
+        """Iterates over the instances of the zone, one page of results at a time.
+
+        The instances that were already known get their information refreshed in place, so that everyone holding
+        them benefits from this call. The others are not kept: it is up to the caller to hold on to those it needs.
+
+        :param str instance_filter: Which instances to list. Defaults to the filter of this :class:`ComputeEngine`.
+        :return generator(ComputeEngineInstance): The listed instances.
+        """
+        kwargs = {}
+        if self.instance_fields is not None:
+            kwargs['fields'] = f'items({self.instance_fields}),nextPageToken'
+        instance_filter = self.instance_filter if instance_filter is None else instance_filter
+        if instance_filter is not None:
+            kwargs['filter'] = instance_filter
+        request = self.compute.instances().list(project=self.project, zone=self.gce_zone, **kwargs)
+        while request is not None:
+            result = execute(request)
+            result_ts = datetime.datetime.now()
+            for item in result.get('items', []):
+                instance = self.__instances.get(item['name'])
+                if instance is not None:
+                    instance.update_info(info=item, info_ts=result_ts)
+                else:
+                    instance = ComputeEngineInstance.build_from_info(
+                        compute=self.compute,
+                        info=item,
+                        info_ts=result_ts,
+                        http_factory=self.http_factory,
+                        fields=self.instance_fields,
+                    )
+                yield instance
+            request = self.compute.instances().list_next(previous_request=request, previous_response=result)
+
+    def list_instances(self, instance_filter=None):
+        """Lists the instances of the zone, following every page of results.
+
+        :param str instance_filter: Which instances to list. Defaults to the filter of this :class:`ComputeEngine`.
+        :return dict: The listed instances, by name.
+        """
+        instances = collections.OrderedDict(
+            (instance.name, instance) for instance in self.iter_instances(instance_filter=instance_filter)
+        )
         logger.info("[%s %s] Discovered the following instances: %s.",
                     self.__class__.__name__, self.project,
-                    ', '.join(name for name in self.__instances.keys()))
-        return self.__instances
+                    ', '.join(name for name in instances.keys()))
+        return instances
 
 
 class ComputeEngineInstance(object):
     DEFAULT_STALE_AFTER_MS = 1000
 
-    def __init__(self, name, compute, project, gce_zone, stale_after=None):
+    def __init__(self, name, compute, project, gce_zone, stale_after=None, http_factory=None, fields=None):
         self.name = name
         self.compute = compute
         self.project = project
         self.gce_zone = gce_zone
+        self.http_factory = http_factory
+        self.fields = fields
         self.info = None
         self.stale_after = datetime.timedelta(
             milliseconds=self.DEFAULT_STALE_AFTER_MS if stale_after is None else stale_after,
@@ -150,7 +455,7 @@ class ComputeEngineInstance(object):
         self.info_ts = datetime.datetime.min
 
     @classmethod
-    def build_from_info(cls, compute, info, info_ts=None, stale_after=None):
+    def build_from_info(cls, compute, info, info_ts=None, stale_after=None, http_factory=None, fields=None):
         regex = (r'https://www.googleapis.com/compute/(?:beta|v\d)'
                  r'/projects/(?P<project>.*)'
                  r'/zones/(?P<gce_zone>.*)'
@@ -162,29 +467,40 @@ class ComputeEngineInstance(object):
             project=match['project'],
             gce_zone=match['gce_zone'],
             stale_after=stale_after,
+            http_factory=http_factory,
+            fields=fields,
         )
-        instance.info = info
-        instance.info_ts = datetime.datetime.now() if info_ts is None else info_ts
+        instance.update_info(info=info, info_ts=info_ts)
         return instance
 
+    def update_info(self, info, info_ts=None):
+        self.info = info
+        self.info_ts = datetime.datetime.now() if info_ts is None else info_ts
+
     def refresh(self):
         try:
-            self.info = self.compute.instances().get(
-                project=self.project, zone=self.gce_zone, instance=self.name
-            ).execute()
-            self.info_ts = datetime.datetime.now()
+            kwargs = {} if self.fields is None else {'fields': self.fields}
+            self.update_info(info=execute(self.compute.instances().get(
+                project=self.project, zone=self.gce_zone, instance=self.name, **kwargs
+            )))
         except googleapiclient.errors.HttpError as err:
-            content = json.loads(err.content)
-            errors = content.get('error', {}).get('errors', [])
-            for error in errors:
-                if error['reason'] == 'notFound':
-                    raise InstanceNotFound(
-                        f"Instance {self.name} does not exist in project {self.project}"
-                    )
-                else:  # pragma: no cover
-                    pass  # These two lines are just for the branch coverage without deactivating the if branch.
-            else:  # pragma: no cover
-                raise ComputeEngineError(f"Unknown error with Instance {self.name} in project {self.project}: {errors}")
+            raise self.map_error(err)
+
+    def map_error(self, err):
+        """Translates an API error about this instance.
+
+        :param googleapiclient.errors.HttpError err: The error returned by the API.
+        :return ComputeEngineError: The error, :class:`InstanceNotFound` if the instance does not exist,
+                                    :class:`PermissionDenied` if the service account is not allowed to call the API.
+        """
+        content = json.loads(err.content)
+        errors = content.get('error', {}).get('errors', [])
+        if any(error['reason'] == 'notFound' for error in errors):
+            return InstanceNotFound(f"Instance {self.name} does not exist in project {self.project}")
+        if err.resp.status == 403:
+            return PermissionDenied(f"Not allowed to call the API on Instance {self.name} in project {self.project}: "
+                                    f"{errors}")
+        return ComputeEngineError(f"Unknown error with Instance {self.name} in project {self.project}: {errors}")
 
     @property
     def status(self):
@@ -192,13 +508,39 @@ class ComputeEngineInstance(object):
             self.refresh()
         return InstanceStatus(self.info['status'])
 
-    def wait_for_operation(self, operation):
+    @property
+    def last_known_status(self):
+        """The status as of the last refresh, without calling the API (``None`` if it was never refreshed)."""
+        return None if self.info is None else InstanceStatus(self.info['status'])
+
+    def get_serial_port_output(self, start=None, port=1):
+        """
+        :param int start: From which byte of the output to read, ``None`` for all of the output still available.
+        :param int port: Which serial port to read.
+        :return dict: The ``compute#serialPortOutput``, with the ``contents`` and the ``next`` byte to read.
+        """
+        kwargs = {} if start is None else {'start': start}
+        try:
+            return execute(self.compute.instances().getSerialPortOutput(
+                project=self.project, zone=self.gce_zone, instance=self.name, port=port, **kwargs
+            ))
+        except googleapiclient.errors.HttpError as err:
+            raise self.map_error(err)
+
+    def wait_for_operation(self, operation, deadline=None):
         return wait_for_operation(
-            compute=self.compute, project=self.project, gce_zone=self.gce_zone, operation=operation['name']
+            compute=self.compute, project=self.project, gce_zone=self.gce_zone, operation=operation['name'],
+            http_factory=self.http_factory, deadline=deadline,
         )
 
-    def wait_for_status(self, statuses):
+    def wait_for_status(self, statuses, deadline=None):
+        """
+        :param statuses: The status, or statuses, to wait for.
+        :param jam.libs.utils.Deadline deadline: How long to wait at most. Forever by default.
+        :raise jam.libs.utils.DeadlineExceeded: The instance still has another status by the deadline.
+        """
         statuses = self.format_status(statuses)
+        deadline = Deadline() if deadline is None else deadline
         previous_status = None
         while True:
             if not self.status == previous_status:
@@ -206,7 +548,8 @@ class ComputeEngineInstance(object):
             if self.status in statuses:
                 break
             previous_status = self.status
-            time.sleep(TIME_SLEEP_WAIT_FOR_STATUS)
+            deadline.check(f"instance {self.name} to be {'/'.join(sorted(status.value for status in statuses))}")
+            time.sleep(deadline.get_sleep(TIME_SLEEP_WAIT_FOR_STATUS))
 
     @staticmethod
     def format_status(statuses):
@@ -214,18 +557,51 @@ class ComputeEngineInstance(object):
             statuses = [statuses]
         return frozenset(InstanceStatus(status) for status in statuses)
 
-    def start(self):
-        logger.info("[%s %s] Starting Instance.", self.__class__.__name__, self.name)
-        operation = self.compute.instances().start(
+    def __operate(self, method, description, deadline=None, wait=True):
+        logger.info("[%s %s] %s Instance.", self.__class__.__name__, self.name, description)
+        operation = execute(getattr(self.compute.instances(), method)(
             project=self.project, zone=self.gce_zone, instance=self.name
-        ).execute()
-        self.wait_for_operation(operation=operation)
-        logger.info("[%s %s] Instance status: %s.", self.__class__.__name__, self.name, self.status)
-
-    def stop(self):
-        logger.info("[%s %s] Stopping Instance.", self.__class__.__name__, self.name)
-        operation = self.compute.instances().stop(
-            project=self.project, zone=self.gce_zone, instance=self.name
-        ).execute()
-        self.wait_for_operation(operation=operation)
-        logger.info("[%s %s] Instance status: %s.", self.__class__.__name__, self.name, self.status)
+        ))
+        if wait:
+            self.wait_for_operation(operation=operation, deadline=deadline)
+            logger.info("[%s %s] Instance status: %s.", self.__class__.__name__, self.name, self.status)
+
+    def start(self, deadline=None):
+        self.__operate(method='start', description='Starting', deadline=deadline)
+
+    def stop(self, deadline=None, wait=True):
+        """
+        :param jam.libs.utils.Deadline deadline: How long to wait at most. Forever by default.
+        :param bool wait: Whether to wait for the operation to be done.
+        """
+        self.__operate(method='stop', description='Stopping', deadline=deadline, wait=wait)
+
+    def suspend(self, deadline=None):
+        self.__operate(method='suspend', description='Suspending', deadline=deadline)
+
+    def resume(self, deadline=None):
+        self.__operate(method='resume', description='Resuming', deadline=deadline)
+
+
+class SerialConsole(object):
+    """Tails the serial port output of an instance: every read only gets what was written since the previous one."""
+
+    def __init__(self, instance, port=1):
+        """
+        :param ComputeEngineInstance instance: The instance.
+        :param int port: Which serial port to read.
+        """
+        self.instance = instance
+        self.port = port
+        self.next_start = None
+        self.partial_line = ''
+
+    def read_lines(self):
+        """
+        :return list(str): The lines written since the previous read. The last line may still be incomplete.
+        """
+        output = self.instance.get_serial_port_output(start=self.next_start, port=self.port)
+        self.next_start = output.get('next', self.next_start)
+        lines = (self.partial_line + output.get('contents', '')).split('\n')
+        self.partial_line = lines[-1]
+        return lines
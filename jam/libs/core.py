@@ -1,124 +1,350 @@
 import collections
+import datetime
 import logging
 import random
 
 import enum
 
 import jam.libs.compute_engine
-from jam.libs.compute_engine import InstanceStatus
+from jam.libs.compute_engine import InstanceStatus, PowerMode, build_name_filter, parse_timestamp
+from jam.libs.demand import DemandEstimate
 import jam.libs.jenkins
+from jam.libs.jenkins import ExecutorCount
+from jam.libs.policies import BootTimeSelectionPolicy, Quarantine, ScaleDownPolicy
+from jam.libs.pools import CapacityPlanner
+from jam.libs.transitions import TransitionAction, TransitionCancelled, TransitionPool
 import jam.libs.utils
 
 logger = logging.getLogger(__name__)
 
 
 class Jam(object):
-    def __init__(self, jenkins_url, jenkins_username, jenkins_api_token, project, gce_zone, usable_nodes):
+    def __init__(self, jenkins_url, jenkins_username, jenkins_api_token, project, gce_zone, usable_nodes,
+                 max_parallel_transitions=None,
+                 gce_instance_fields=jam.libs.compute_engine.ComputeEngine.DEFAULT_INSTANCE_FIELDS,
+                 gce_instance_filter=None, gce_discovery_cache=None, suspended_nodes=None, warm_pool=None,
+                 scale_down_policy=None, label_pools=None, forecaster=None, schedule=None, slo=None,
+                 selection_policy=None, affinity=None, readiness=None,
+                 transition_timeout=TransitionPool.DEFAULT_TIMEOUT, quarantine=None):
         self.jenkins_url = jenkins_url
         self.jenkins_username = jenkins_username
         self.jenkins_api_token = jenkins_api_token
         self.project = project
         self.gce_zone = gce_zone
-        self.compute_engine = jam.libs.compute_engine.ComputeEngine(project, gce_zone)
+        self.compute_engine = jam.libs.compute_engine.ComputeEngine(
+            project, gce_zone, instance_fields=gce_instance_fields, instance_filter=gce_instance_filter,
+            discovery_cache=gce_discovery_cache,
+        )
         self.jenkins = jam.libs.jenkins.Jenkins(jenkins_url, jenkins_username, jenkins_api_token)
         self.usable_node_names = usable_nodes
+        self.suspended_node_names = frozenset(suspended_nodes or [])
+        self.warm_pool = WarmPool() if warm_pool is None else warm_pool
+        self.scale_down_policy = ScaleDownPolicy() if scale_down_policy is None else scale_down_policy
+        self.label_pools = tuple(label_pools or [])
+        self.forecaster = forecaster
+        self.schedule = schedule
+        self.slo = slo
+        self.selection_policy = BootTimeSelectionPolicy() if selection_policy is None else selection_policy
+        self.affinity = affinity
+        self.readiness = readiness
+        self.quarantine = Quarantine() if quarantine is None else quarantine
+        self.__capacity_plan = None
+        self.snapshot = None
+        self.transition_pool = TransitionPool(max_workers=max_parallel_transitions, timeout=transition_timeout)
         self.__nodes = None
 
     @property
     def nodes(self):
         if self.__nodes is None:
             self.__nodes = collections.OrderedDict(
-                (name, Node(self.jenkins.get_agent(name), self.compute_engine.get_instance(name)))
+                (name, Node(
+                    self.jenkins.get_agent(name),
+                    self.compute_engine.get_instance(name),
+                    power_mode=PowerMode.SUSPEND if name in self.suspended_node_names else PowerMode.STOP,
+                    readiness=self.readiness,
+                ))
                 for name in self.usable_node_names
             )
         return self.__nodes
 
+    def take_snapshot(self):
+        """Reads the state of the whole fleet with a fixed amount of API calls.
+
+        Unless a filter has been configured, only the instances of the nodes get listed.
+        The nodes that are going through a transition are accounted as switching on or off, whatever the APIs say.
+        Only the jobs that a new agent could serve are accounted as jobs, the longest waiting first with a wait time
+        objective. The arrivals in the queue feed the forecaster, and the build history the affinity index.
+
+        :return FleetSnapshot: The state of the fleet, to be used for every decision of a tick.
+        """
+        instances = {}
+        if self.nodes:
+            self.jenkins.refresh_agents()
+            instances = self.compute_engine.list_instances(
+                instance_filter=self.compute_engine.instance_filter or build_name_filter(self.nodes)
+            )
+        jobs = self.jenkins.jobs
+        if self.forecaster is not None:
+            self.forecaster.observe(jobs)
+        if self.affinity is not None:
+            self.affinity.refresh(self.jenkins)
+        demand = DemandEstimate.estimate(jobs)
+        if demand.items:
+            logger.info("[Jam] Jobs in the queue: %s.", demand)
+        servable = demand.servable
+        if self.slo is not None:
+            servable = self.slo.prioritize(servable)
+            if servable:
+                logger.info("[Jam] p%s wait time: %.0fs (target: %ss).",
+                            self.slo.percentile, self.slo.get_wait_time(servable), self.slo.target)
+        self.snapshot = FleetSnapshot.take(
+            nodes=self.nodes.values(),
+            instances=instances,
+            jobs=servable,
+            transitions={name: transition.action for name, transition in self.transition_pool.switching.items()},
+        )
+        return self.snapshot
+
+    def __nodes_from_snapshot(self, snapshot_nodes):
+        return collections.OrderedDict((name, self.nodes[name]) for name in snapshot_nodes)
+
+    @property
+    def current_snapshot(self):
+        return self.take_snapshot() if self.snapshot is None else self.snapshot
+
     @property
     def idle_nodes(self):
-        return {k: v for k, v in self.nodes.items() if v.is_on and v.agent.is_idle}
+        return self.__nodes_from_snapshot(self.current_snapshot.idle_nodes)
 
     @property
     def busy_nodes(self):
-        return {k: v for k, v in self.nodes.items() if v.is_on and not v.agent.is_idle}
+        return self.__nodes_from_snapshot(self.current_snapshot.busy_nodes)
 
     @property
     def offline_nodes(self):
-        return {k: v for k, v in self.nodes.items() if v.is_off}
+        return self.__nodes_from_snapshot(self.current_snapshot.offline_nodes)
 
     @property
     def starting_nodes(self):
-        return {k: v for k, v in self.nodes.items() if v.is_switching_on}
+        return self.__nodes_from_snapshot(self.current_snapshot.starting_nodes)
 
     @property
     def stopping_nodes(self):
-        return {k: v for k, v in self.nodes.items() if v.is_switching_off}
+        return self.__nodes_from_snapshot(self.current_snapshot.stopping_nodes)
 
     def balance_nodes(self):
-        jobs = self.jenkins.jobs
+        """Performs one tick of reconciliation.
+
+        The transitions it decides are only started: they get collected by the following ticks, once they are over.
+        """
+        self.record_transitions(self.transition_pool.collect())
+        self.take_snapshot()
+        self.lift_stale_drains()
+        self.scale_down_policy.observe(self.snapshot)
+        self.selection_policy.observe(self.snapshot)
+        jobs = self.snapshot.jobs
         idle_or_starting_nodes = jam.libs.utils.merge_dicts(self.idle_nodes, self.starting_nodes)
-        if jobs:
-            if len(idle_or_starting_nodes) == len(jobs):
-                logger.info(
-                    "[Jam] There should be enough idle/starting nodes (%d) to take care of the jobs (%d) in queue.",
-                    len(idle_or_starting_nodes), len(jobs)
-                )
-            elif len(idle_or_starting_nodes) > len(jobs):
+        plan = self.capacity_plan
+        if plan.missing:
+            logger.info(
+                "[Jam] We do not have enough idle/starting nodes (%s) for the jobs in the queue (%d), the expected "
+                "jobs (%d), the wait time surge (%d), the warm pool (%d), the label pools and the capacity floors: %d "
+                "more needed.",
+                ', '.join(idle_or_starting_nodes.keys()),
+                len(jobs),
+                self.expected_jobs,
+                len(self.surge),
+                self.warm_pool.idle,
+                plan.missing,
+            )
+            self.scale_up()
+        if plan.spare:
+            if jobs:
                 logger.info(
                     "[Jam] We have too many idle/starting nodes (%s) for the amount of jobs in the queue (%d).",
                     ', '.join(idle_or_starting_nodes.keys()),
                     len(jobs),
                 )
-                self.scale_down()
             else:
                 logger.info(
-                    "[Jam] We do not have enough idle/starting nodes (%s) for the amount of jobs in the queue (%d).",
-                    ', '.join(idle_or_starting_nodes.keys()),
-                    len(jobs),
+                    "[Jam] We have no jobs in the queue and the following node(s) are idle/starting: %s",
+                    ', '.join(idle_or_starting_nodes.keys())
                 )
-                self.scale_up()
-        elif idle_or_starting_nodes:
+            self.scale_down()
+        elif jobs and not plan.missing:
             logger.info(
-                "[Jam] We have no jobs in the queue and the following node(s) are idle/starting: %s",
-                ', '.join(idle_or_starting_nodes.keys())
+                "[Jam] There should be enough idle/starting nodes (%d) to take care of the jobs (%d) in queue.",
+                len(idle_or_starting_nodes), len(jobs)
             )
-            self.scale_down()
+        self.refill_warm_pool()
+
+    def lift_stale_drains(self):
+        """Undrains the agents that a switch off interrupted midway left drained: they would stay offline for good.
+
+        They get back online by the next tick.
+        """
+        for name in self.current_snapshot.stale_drained_nodes:
+            logger.warning("[Jam] Node %s is running with its agent still drained: undraining it.", name)
+            try:
+                self.nodes[name].agent.undrain()
+            except Exception:
+                logger.exception("[Jam] Could not undrain node %s.", name)
+
+    @property
+    def expected_jobs(self):
+        """How many jobs the forecaster expects to arrive soon, 0 without a forecaster."""
+        return 0 if self.forecaster is None else self.forecaster.get_expected_jobs()
+
+    @property
+    def capacity_floors(self):
+        """The label pools enforcing the capacity floors that are active, or about to be."""
+        if self.schedule is None:
+            return ()
+        pools = tuple(self.schedule.get_pools())
+        if pools:
+            logger.info("[Jam] Active capacity floors: %s.",
+                        ', '.join(f"{pool.min_nodes} {pool.label or '<any>'}" for pool in pools))
+        return pools
+
+    @property
+    def surge(self):
+        """The labels needing extra executors to meet the wait time objective, once per executor."""
+        return () if self.slo is None else tuple(self.slo.get_surge(self.current_snapshot.jobs))
+
+    @property
+    def quarantined_node_names(self):
+        """The nodes that failed to switch too many times in a row, and that are left alone for now."""
+        names = self.quarantine.get_quarantined_nodes()
+        if names:
+            logger.info("[Jam] Nodes in quarantine: %s.", ', '.join(sorted(names)))
+        return names
+
+    @property
+    def capacity_planner(self):
+        return CapacityPlanner(pools=self.label_pools + self.capacity_floors, warm_idle=self.warm_pool.idle,
+                               expected_jobs=self.expected_jobs, surge=self.surge,
+                               selection_policy=self.selection_policy, affinity=self.affinity,
+                               excluded=self.quarantined_node_names)
+
+    @property
+    def capacity_plan(self):
+        """The plan matching the jobs of the current snapshot with the nodes, computed once per snapshot."""
+        snapshot = self.current_snapshot
+        if self.__capacity_plan is None or self.__capacity_plan[0] is not snapshot:
+            self.__capacity_plan = snapshot, self.capacity_planner.plan(snapshot)
+        return self.__capacity_plan[1]
 
     def scale_up(self):
-        jobs = self.jenkins.jobs
-        offline_nodes = self.offline_nodes
-        idle_or_starting_nodes = jam.libs.utils.merge_dicts(self.idle_nodes, self.starting_nodes)
-        if offline_nodes:
-            nb_to_start_up = max(min(len(offline_nodes), len(jobs) - len(idle_or_starting_nodes)), 0)
-            selected_offline_nodes = {
-                name: offline_nodes[name]
-                for name in random.sample(list(offline_nodes), nb_to_start_up)
-            }
-            logger.info(
-                "[Jam] The following nodes will be switched on: %s", ', '.join(selected_offline_nodes.keys())
-            )
-            for node in selected_offline_nodes.values():
-                node.on()  # TODO: put in thread
-        else:
+        plan = self.capacity_plan
+        if not self.offline_nodes:
             logger.info("[Jam] There are currently no offline nodes.")
             logger.info("[Jam] Currently busy nodes: %s", ', '.join(self.busy_nodes.keys()))
+            return
+        if plan.unserved:
+            logger.warning("[Jam] No offline node can be switched on for the label(s): %s",
+                           ', '.join(label or '<any>' for label in plan.unserved))
+        selected_offline_nodes = collections.OrderedDict((name, self.nodes[name]) for name in plan.to_start)
+        logger.info(
+            "[Jam] The following nodes will be switched on: %s", ', '.join(selected_offline_nodes.keys())
+        )
+        self.switch_on(selected_offline_nodes.values())
+        if selected_offline_nodes:
+            self.scale_down_policy.record_scale_up()
 
     def scale_down(self):
-        jobs = self.jenkins.jobs
         idle_nodes = self.idle_nodes
         if idle_nodes:
-            nb_to_shutdown = max(len(idle_nodes) - len(jobs), 0)
-            selected_idle_nodes = {
-                name: idle_nodes[name]
-                for name in random.sample(list(idle_nodes), nb_to_shutdown)
-            }
+            spare_nodes = [name for name in self.capacity_plan.spare if name in idle_nodes]
+            stoppable_nodes = self.scale_down_policy.get_stoppable_nodes(self.current_snapshot)
+            selected_idle_nodes = {name: idle_nodes[name] for name in spare_nodes if name in stoppable_nodes}
+            if len(selected_idle_nodes) < len(spare_nodes):
+                logger.info("[Jam] Only %d of the %d superfluous nodes may be switched off yet.",
+                            len(selected_idle_nodes), len(spare_nodes))
             logger.info(
                 "[Jam] The following nodes will be switched off: %s", ', '.join(selected_idle_nodes.keys())
             )
+            nb_to_suspend = max(self.warm_pool.suspended - len(self.warm_suspended_node_names), 0)
             for node in selected_idle_nodes.values():
-                node.off()  # TODO: put in thread
+                if node.power_mode == PowerMode.SUSPEND or nb_to_suspend > 0:
+                    nb_to_suspend -= 1
+                    self.transition_pool.submit(node, TransitionAction.SUSPEND)
+                else:
+                    self.transition_pool.submit(node, TransitionAction.OFF)
         else:
             logger.error("[Jam] There is an error in the algorithm!")
 
+    @property
+    def warm_suspended_node_names(self):
+        """The nodes that are suspended, or being suspended, and that are not being switched back on."""
+        switching = self.transition_pool.switching
+        return frozenset(
+            name for name in self.current_snapshot.suspended_nodes if name not in switching
+        ) | frozenset(
+            name for name, transition in switching.items()
+            if transition.action in [TransitionAction.SUSPEND, TransitionAction.PREWARM]
+        )
+
+    def refill_warm_pool(self):
+        """Prewarms stopped nodes in the background, until the warm pool holds enough suspended nodes."""
+        nb_missing = self.warm_pool.suspended - len(self.warm_suspended_node_names)
+        if nb_missing <= 0:
+            return
+        excluded = self.quarantine.get_quarantined_nodes() | frozenset(self.transition_pool.switching)
+        candidates = [
+            name for name in self.current_snapshot.offline_nodes
+            if name not in self.current_snapshot.suspended_nodes and name not in excluded
+        ]
+        selected = random.sample(candidates, min(nb_missing, len(candidates)))
+        if selected:
+            logger.info("[Jam] The following nodes will be prewarmed: %s", ', '.join(selected))
+        for name in selected:
+            self.transition_pool.submit(self.nodes[name], TransitionAction.PREWARM)
+
+    def switch_on(self, nodes):
+        """Starts (or resumes) the nodes' instances in a single round trip, then brings every node online in the
+        background.
+
+        :param list(Node) nodes: The nodes to switch on.
+        """
+        switching = self.transition_pool.switching
+        nodes = [node for node in nodes if node.name not in switching]
+        if not nodes:
+            return
+        suspended = [node.instance for node in nodes if node.instance.last_known_status == InstanceStatus.SUSPENDED]
+        stopped = [node.instance for node in nodes if node.instance not in suspended]
+        results = collections.OrderedDict()
+        if stopped:
+            results.update(self.compute_engine.start_many(stopped, wait=False))
+        if suspended:
+            results.update(self.compute_engine.resume_many(suspended, wait=False))
+        for node in nodes:
+            operation, error = results[node.name]
+            if error is None:
+                self.transition_pool.submit(node, TransitionAction.ON, operation=operation)
+            else:
+                logger.error("[Jam] Node %s could not be started: %s", node.name, error)
+
+    def wait_for_transitions(self, timeout=None):
+        """Waits for the transitions in flight to be over.
+
+        :param float timeout: How long to wait at most, in seconds. Forever by default.
+        """
+        self.record_transitions(self.transition_pool.wait(timeout=timeout))
+
+    def record_transitions(self, summary):
+        self.log_transitions(summary)
+        self.quarantine.record_transitions(summary)
+        if self.schedule is not None:
+            self.schedule.record_transitions(summary)
+
+    @staticmethod
+    def log_transitions(summary):
+        if not summary.results:
+            return
+        logger.info("[Jam] Transitions: %s.", summary)
+        for name, result in summary.failed.items():
+            logger.error("[Jam] Node %s could not be switched %s: %s", name, result.action.value, result.error)
+
 
 class NodeStatus(enum.Enum):
     ON = 'ON'
@@ -128,32 +354,180 @@ class NodeStatus(enum.Enum):
     UNKNOWN = 'UNKNOWN'
 
 
+class WarmPool(collections.namedtuple('WarmPool', ['idle', 'suspended'])):
+    """How many nodes to keep ready beyond the jobs in the queue: ``idle`` ones online, ``suspended`` ones suspended."""
+    __slots__ = ()
+
+
+WarmPool.__new__.__defaults__ = (0, 0)
+
+
+class NodeSnapshot(collections.namedtuple(
+        'NodeSnapshot', ['name', 'status', 'is_idle', 'labels', 'transition', 'instance_status', 'started_at',
+                         'executors', 'busy_executors', 'is_drained'])):
+    """The state of a :class:`Node` at a given time, classified once and for all."""
+    __slots__ = ()
+
+    TRANSITION_STATUSES = {
+        TransitionAction.ON: NodeStatus.SWITCHING_ON,
+        TransitionAction.OFF: NodeStatus.SWITCHING_OFF,
+        TransitionAction.SUSPEND: NodeStatus.SWITCHING_OFF,
+        TransitionAction.PREWARM: NodeStatus.SWITCHING_OFF,
+    }
+
+    @classmethod
+    def take(cls, node, instance_info, transition=None):
+        """Classifies a node from information that has already been fetched, without any API call.
+
+        :param Node node: The node to classify.
+        :param dict instance_info: The information about the node's instance, ``None`` if it is unknown.
+        :param TransitionAction transition: The transition the node is going through, if any.
+        :return NodeSnapshot: The snapshot of the node.
+        """
+        agent_info = node.agent.info
+        executors = ExecutorCount.from_info(agent_info)
+        is_agent_online = not any([agent_info.get('offline', True), agent_info.get('temporarilyOffline', False)])
+        instance_status = None if instance_info is None else InstanceStatus(instance_info['status'])
+        started_at = None
+        if instance_info is not None and 'lastStartTimestamp' in instance_info:
+            started_at = parse_timestamp(instance_info['lastStartTimestamp'])
+        if transition is None:
+            status = Node.get_status(is_agent_online=is_agent_online, instance_status=instance_status)
+        else:
+            status = cls.TRANSITION_STATUSES[transition]
+        return cls(
+            name=node.name,
+            status=status,
+            is_idle=agent_info.get('idle', False),
+            labels=frozenset(node.agent.labels),
+            transition=transition,
+            instance_status=instance_status,
+            started_at=started_at,
+            executors=executors.total,
+            busy_executors=executors.busy,
+            is_drained=jam.libs.jenkins.JenkinsAgent.get_is_drained(agent_info),
+        )
+
+    @property
+    def free_executors(self):
+        """The executors that can take a job, now or once the node is on."""
+        if self.status == NodeStatus.ON:
+            return self.executors - self.busy_executors
+        if self.status == NodeStatus.SWITCHING_ON:
+            return self.executors
+        return 0
+
+
+NodeSnapshot.__new__.__defaults__ = (None, None, 1, 0, False)
+
+
+class FleetSnapshot(collections.namedtuple('FleetSnapshot', ['nodes', 'jobs', 'taken_at'])):
+    """An immutable view of the whole fleet, built once per tick.
+
+    Every node is classified exactly once, so that all the decisions of a tick are consistent with each other and
+    none of them hits an API.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def take(cls, nodes, instances, jobs, transitions=None):
+        """
+        :param list(Node) nodes: The nodes to classify, whose agents have just been refreshed.
+        :param dict instances: The freshly listed instances, by name.
+        :param list(dict) jobs: The jobs in the queue.
+        :param dict transitions: The transitions in flight, by node name.
+        :return FleetSnapshot: The snapshot of the fleet.
+        """
+        transitions = {} if transitions is None else transitions
+        node_snapshots = []
+        for node in nodes:
+            instance_info = instances[node.name].info if node.name in instances else None
+            if instance_info is None:
+                logger.warning("[%s] Instance %s could not be found.", cls.__name__, node.name)
+            node_snapshots.append(
+                NodeSnapshot.take(node=node, instance_info=instance_info, transition=transitions.get(node.name))
+            )
+        return cls(nodes=tuple(node_snapshots), jobs=tuple(jobs), taken_at=datetime.datetime.now())
+
+    def __select(self, predicate):
+        return collections.OrderedDict((node.name, node) for node in self.nodes if predicate(node))
+
+    @property
+    def nodes_by_name(self):
+        return self.__select(lambda node: True)
+
+    @property
+    def idle_nodes(self):
+        return self.__select(lambda node: node.status == NodeStatus.ON and node.is_idle)
+
+    @property
+    def busy_nodes(self):
+        return self.__select(lambda node: node.status == NodeStatus.ON and not node.is_idle)
+
+    @property
+    def offline_nodes(self):
+        return self.__select(lambda node: node.status == NodeStatus.OFF)
+
+    @property
+    def starting_nodes(self):
+        return self.__select(lambda node: node.status == NodeStatus.SWITCHING_ON)
+
+    @property
+    def stopping_nodes(self):
+        return self.__select(lambda node: node.status == NodeStatus.SWITCHING_OFF)
+
+    @property
+    def suspended_nodes(self):
+        return self.__select(
+            lambda node: node.instance_status in [InstanceStatus.SUSPENDING, InstanceStatus.SUSPENDED]
+        )
+
+    @property
+    def stale_drained_nodes(self):
+        """The running nodes whose agent is still drained, although no transition is switching them off."""
+        return self.__select(
+            lambda node: node.is_drained and node.transition is None and node.instance_status == InstanceStatus.RUNNING
+        )
+
+
+class DrainCancelled(TransitionCancelled):
+    """A build landed on the agent while it was being drained: the node stays on."""
+
+
 class Node(object):
-    def __init__(self, agent, instance):
+    def __init__(self, agent, instance, power_mode=PowerMode.STOP, readiness=None):
         """
 
         :param libs.jenkins.JenkinsAgent agent:
         :param libs.compute_engine.ComputeEngineInstance instance:
+        :param libs.compute_engine.PowerMode power_mode: How the instance gets switched off.
+        :param libs.readiness.ReadinessDetector readiness: How to tell the instance has booted, ``None`` to only poll
+                                                           the agent.
         """
         if not agent.name == instance.name:
             raise ValueError(f"Agent and Instance must have the same name ({agent.name} is not {instance.name})")
         self.name = agent.name
         self.agent = agent
         self.instance = instance
+        self.power_mode = PowerMode(power_mode)
+        self.readiness = readiness
         self.__status = None
 
+    @staticmethod
+    def get_status(is_agent_online, instance_status):
+        if is_agent_online and instance_status == InstanceStatus.RUNNING:
+            return NodeStatus.ON
+        elif instance_status in [InstanceStatus.STOPPED, InstanceStatus.SUSPENDED, InstanceStatus.TERMINATED]:
+            return NodeStatus.OFF
+        elif instance_status in [InstanceStatus.PROVISIONING, InstanceStatus.STAGING]:
+            return NodeStatus.SWITCHING_ON
+        elif instance_status in [InstanceStatus.STOPPING, InstanceStatus.SUSPENDING]:
+            return NodeStatus.SWITCHING_OFF
+        return NodeStatus.UNKNOWN
+
     @property
     def status(self):
-        if self.agent.is_online and self.instance.status == InstanceStatus.RUNNING:
-            self.__status = NodeStatus.ON
-        elif self.instance.status in [InstanceStatus.STOPPED, InstanceStatus.SUSPENDED, InstanceStatus.TERMINATED]:
-            self.__status = NodeStatus.OFF
-        elif self.instance.status in [InstanceStatus.PROVISIONING, InstanceStatus.STAGING]:
-            self.__status = NodeStatus.SWITCHING_ON
-        elif self.instance.status in [InstanceStatus.STOPPING, InstanceStatus.SUSPENDING]:
-            self.__status = NodeStatus.SWITCHING_OFF
-        else:
-            self.__status = NodeStatus.UNKNOWN  # pragma: no cover
+        self.__status = self.get_status(is_agent_online=self.agent.is_online, instance_status=self.instance.status)
         return self.__status
 
     @property
@@ -172,21 +546,114 @@ class Node(object):
     def is_switching_off(self):
         return self.status == NodeStatus.SWITCHING_OFF
 
-    def on(self):
+    def on(self, operation=None, deadline=None):
+        """Switches the node on.
+
+        A suspended instance gets resumed rather than started, whatever the power mode of the node.
+
+        When the node does not make it on, its instance gets stopped as a best effort: an instance running without
+        its agent online would be billed for nothing, with nobody to switch it off.
+
+        :param dict operation: The operation starting the instance, if it has already been started.
+        :param libs.utils.Deadline deadline: How long the whole transition may take. Forever by default.
+        """
         logger.info("[%s %s] Switching on.", self.__class__.__name__, self.name)
-        if not self.instance.status == InstanceStatus.RUNNING:
-            self.instance.start()
-            self.instance.wait_for_status(InstanceStatus.RUNNING)
-        self.agent.force_launch()
+        try:
+            self.__switch_on(operation=operation, deadline=deadline)
+        except Exception:
+            self.__give_up_on()
+            raise
         logger.info("[%s %s] The Node is on.", self.__class__.__name__, self.name)
 
-    def off(self):
+    def __switch_on(self, operation=None, deadline=None):
+        was_suspended = self.instance.last_known_status in [InstanceStatus.SUSPENDING, InstanceStatus.SUSPENDED]
+        if operation is not None:
+            self.instance.wait_for_operation(operation=operation, deadline=deadline)
+        elif self.instance.status in [InstanceStatus.SUSPENDING, InstanceStatus.SUSPENDED]:
+            self.instance.wait_for_status(InstanceStatus.SUSPENDED, deadline=deadline)
+            self.instance.resume(deadline=deadline)
+        elif not self.instance.status == InstanceStatus.RUNNING:
+            self.instance.start(deadline=deadline)
+        self.instance.wait_for_status(InstanceStatus.RUNNING, deadline=deadline)
+        if self.agent.is_drained:
+            # A drain that got interrupted would keep the agent offline for good.
+            self.agent.undrain()
+        if self.readiness is None:
+            self.agent.force_launch(deadline=deadline)
+        else:
+            self.readiness.bring_online(self.instance, self.agent, tail_console=not was_suspended, deadline=deadline)
+
+    def __give_up_on(self):
+        try:
+            if self.agent.is_online:
+                return
+            if self.instance.status in [InstanceStatus.PROVISIONING, InstanceStatus.STAGING, InstanceStatus.RUNNING]:
+                logger.warning("[%s %s] Could not switch on: stopping the instance.",
+                               self.__class__.__name__, self.name)
+                self.instance.stop(wait=False)
+        except Exception:
+            logger.exception("[%s %s] Could not stop the instance after failing to switch on.",
+                             self.__class__.__name__, self.name)
+
+    def off(self, power_mode=None, deadline=None):
+        """Switches the node off.
+
+        An online agent gets drained first: the node stays on if a build landed on it since it was seen idle.
+
+        :param libs.compute_engine.PowerMode power_mode: How to switch the instance off, instead of the node's mode.
+        :param libs.utils.Deadline deadline: How long the whole transition may take. Forever by default.
+        :raise DrainCancelled: A build landed on the agent, which is back online.
+        """
+        power_mode = self.power_mode if power_mode is None else PowerMode(power_mode)
         logger.info("[%s %s] Switching off.", self.__class__.__name__, self.name)
         if self.agent.is_online:
-            self.agent.stop()
-        if self.instance.status in [InstanceStatus.PROVISIONING, InstanceStatus.STAGING, InstanceStatus.RUNNING]:
-            self.instance.stop()
+            self.drain()
+            try:
+                self.agent.stop()
+            finally:
+                # The drain mark must not outlive the switch off, even a failed one: the agent would stay offline.
+                self.agent.undrain()
+        if power_mode == PowerMode.SUSPEND and self.instance.status == InstanceStatus.RUNNING:
+            self.instance.suspend(deadline=deadline)
+            self.instance.wait_for_status(InstanceStatus.SUSPENDED, deadline=deadline)
+        elif self.instance.status in [InstanceStatus.PROVISIONING, InstanceStatus.STAGING, InstanceStatus.RUNNING]:
+            self.instance.stop(deadline=deadline)
             self.instance.wait_for_status(
-                [InstanceStatus.STOPPED, InstanceStatus.SUSPENDED, InstanceStatus.TERMINATED]
+                [InstanceStatus.STOPPED, InstanceStatus.SUSPENDED, InstanceStatus.TERMINATED], deadline=deadline
             )
         logger.info("[%s %s] The Node is off.", self.__class__.__name__, self.name)
+
+    def drain(self):
+        """Stops Jenkins from giving new builds to the agent, then checks on a fresh read that it is still idle.
+
+        :raise DrainCancelled: The agent could not be drained, or a build landed on it and it is back online.
+        """
+        self.agent.drain()
+        self.agent.refresh()
+        if not self.agent.is_drained:
+            raise DrainCancelled(f"Agent {self.name} is not drained: something else changed its offline mark.")
+        if not self.agent.is_idle:
+            self.agent.undrain()
+            raise DrainCancelled(f"A build landed on agent {self.name} while draining it.")
+
+    def suspend(self, deadline=None):
+        self.off(power_mode=PowerMode.SUSPEND, deadline=deadline)
+
+    def prewarm(self, deadline=None):
+        """Boots the instance and suspends it once it has booted, without bringing the agent online.
+
+        Resuming it later skips the boot of the instance. Without a readiness detector, or when the serial console
+        cannot tell, the instance gets suspended as soon as it runs.
+
+        :param libs.utils.Deadline deadline: How long the whole transition may take. Forever by default.
+        """
+        logger.info("[%s %s] Prewarming.", self.__class__.__name__, self.name)
+        if self.instance.status in [InstanceStatus.STOPPED, InstanceStatus.TERMINATED]:
+            self.instance.start(deadline=deadline)
+        self.instance.wait_for_status([InstanceStatus.RUNNING, InstanceStatus.SUSPENDED], deadline=deadline)
+        if self.instance.status == InstanceStatus.RUNNING:
+            if self.readiness is not None:
+                self.readiness.wait_for_boot(self.instance, deadline=deadline)
+            self.instance.suspend(deadline=deadline)
+            self.instance.wait_for_status(InstanceStatus.SUSPENDED, deadline=deadline)
+        logger.info("[%s %s] The Node is prewarmed.", self.__class__.__name__, self.name)
@@ -0,0 +1,98 @@
+import collections
+import logging
+import re
+
+import enum
+
+
+logger = logging.getLogger(__name__)
+
+
+class QueueItemState(str, enum.Enum):
+    """Why an item of the Jenkins queue is waiting."""
+
+    """The item could start right away, if only there was an executor for it: a new agent would help."""
+    WAITING_FOR_EXECUTOR = 'waiting_for_executor'
+
+    """The item has already been handed over to an executor."""
+    PENDING = 'pending'
+
+    """The item waits for something else than an executor, such as another build of the same job."""
+    BLOCKED = 'blocked'
+
+    """The item waits for its quiet period to be over."""
+    QUIET_PERIOD = 'quiet_period'
+
+    """The item waits for an executor that none of the agents could ever provide, such as an unknown label."""
+    UNSERVABLE = 'unservable'
+
+
+BLOCKED_ITEM_CLASS = 'hudson.model.Queue$BlockedItem'
+WAITING_ITEM_CLASS = 'hudson.model.Queue$WaitingItem'
+UNSERVABLE_REASONS = re.compile(
+    r"There are no nodes with the label|doesn.t have label|No nodes? (?:with|have) label", re.IGNORECASE
+)
+
+
+def classify(item):
+    """Tells why a queue item is waiting, from the ``_class``, ``blocked``, ``buildable``, ``pending``, ``stuck`` and
+    ``why`` fields of ``queue/api/json``.
+
+    :param dict item: The item of the queue.
+    :return QueueItemState: The state of the item.
+    """
+    if item.get('_class') == BLOCKED_ITEM_CLASS or item.get('blocked', False):
+        return QueueItemState.BLOCKED
+    if item.get('_class') == WAITING_ITEM_CLASS or not item.get('buildable', True):
+        return QueueItemState.QUIET_PERIOD
+    if item.get('pending', False):
+        return QueueItemState.PENDING
+    if UNSERVABLE_REASONS.search(item.get('why') or ''):
+        if item.get('stuck', False):
+            logger.warning("Queue item %s is stuck: %s", item.get('id'), item.get('why'))
+        return QueueItemState.UNSERVABLE
+    return QueueItemState.WAITING_FOR_EXECUTOR
+
+
+class DemandEstimate(collections.namedtuple('DemandEstimate', ['items'])):
+    """The items of the queue, each one with why it is waiting."""
+    __slots__ = ()
+
+    @classmethod
+    def estimate(cls, items):
+        """
+        :param list(dict) items: The items of the queue.
+        :return DemandEstimate: The estimate of the demand.
+        """
+        return cls(items=tuple((item, classify(item)) for item in items))
+
+    def get_items(self, state):
+        return tuple(item for item, item_state in self.items if item_state == state)
+
+    @property
+    def servable(self):
+        """The items that a new agent would serve: the actual demand."""
+        return self.get_items(QueueItemState.WAITING_FOR_EXECUTOR)
+
+    def __str__(self):
+        counts = collections.Counter(state for _, state in self.items)
+        return ', '.join(f'{counts[state]} {state.value}' for state in QueueItemState if counts[state])
+
+
+REQUIRED_LABEL_REASONS = re.compile(
+    r"(?:Waiting for next available executor on|All nodes of label|There are no nodes with the label|"
+    r"doesn.t have label) [‘'\"](?P<label>[^’'\"]+)[’'\"]"
+    r"|^[‘'\"](?P<node>[^’'\"]+)[’'\"] is offline"
+)
+
+
+def get_required_label(item):
+    """Tells which label a queue item waits for, from its ``why`` field.
+
+    :param dict item: The item of the queue.
+    :return str: The label expression, ``None`` if any agent would do.
+    """
+    match = REQUIRED_LABEL_REASONS.search(item.get('why') or '')
+    if match is None:
+        return None
+    return match.group('label') or match.group('node')
@@ -0,0 +1,249 @@
+import json
+import logging
+import math
+import os
+import time
+
+from jam.libs.utils import write_atomically
+
+
+logger = logging.getLogger(__name__)
+
+
+class ForecastModel(object):
+    """An online model of the arrival rate of the jobs in the queue.
+
+    Subclasses get registered in :data:`MODELS` under their ``name``, so that they can be selected from the command
+    line, and their state must be JSON-serializable so that it survives restarts.
+    """
+    name = None
+
+    def update(self, at, arrivals, elapsed):
+        """
+        :param float at: When the arrivals were observed, as a UNIX timestamp.
+        :param int arrivals: How many jobs arrived in the queue since the previous observation.
+        :param float elapsed: How long ago the previous observation was, in seconds.
+        """
+        raise NotImplementedError
+
+    def predict(self, at, horizon):
+        """
+        :param float at: From when to predict, as a UNIX timestamp.
+        :param float horizon: How far to predict, in seconds.
+        :return float: The expected number of arrivals within the horizon.
+        """
+        raise NotImplementedError
+
+    def get_state(self):
+        raise NotImplementedError
+
+    def set_state(self, state):
+        raise NotImplementedError
+
+
+class EwmaModel(ForecastModel):
+    """Exponentially weighted moving average of the arrival rate.
+
+    The weight of an observation decays with time rather than with the number of ticks, with a ``time_constant`` in
+    seconds: the model behaves the same whatever the duration of a tick.
+    """
+    name = 'ewma'
+    DEFAULT_TIME_CONSTANT = 10 * 60
+
+    def __init__(self, time_constant=DEFAULT_TIME_CONSTANT):
+        """
+        :param float time_constant: How long it takes for an observation to lose most of its weight, in seconds.
+        """
+        self.time_constant = time_constant
+        self.rate = None
+
+    def update(self, at, arrivals, elapsed):
+        observed_rate = arrivals / elapsed
+        if self.rate is None:
+            self.rate = observed_rate
+        else:
+            alpha = 1 - math.exp(-elapsed / self.time_constant)
+            self.rate += alpha * (observed_rate - self.rate)
+
+    def predict(self, at, horizon):
+        return (self.rate or 0) * horizon
+
+    def get_state(self):
+        return {'rate': self.rate}
+
+    def set_state(self, state):
+        self.rate = state.get('rate')
+
+
+class SeasonalModel(ForecastModel):
+    """A lightweight take on Holt-Winters: a short-term EWMA level, blended with the rates seen at the same hour of the
+    day and of the week.
+
+    The seasonal rates are smoothed once per slot, when it is over, with ``seasonal_smoothing``. The weekly rate of a
+    slot is preferred over its daily rate, once it has been seen at least once.
+    """
+    name = 'seasonal'
+    SLOT_DURATION = 60 * 60
+    SEASONS = (('weekly', 7 * 24), ('daily', 24))
+    DEFAULT_SEASONAL_SMOOTHING = 0.3
+    DEFAULT_SEASONAL_WEIGHT = 0.5
+
+    def __init__(self, time_constant=EwmaModel.DEFAULT_TIME_CONSTANT, seasonal_smoothing=DEFAULT_SEASONAL_SMOOTHING,
+                 seasonal_weight=DEFAULT_SEASONAL_WEIGHT):
+        """
+        :param float time_constant: The time constant of the level, in seconds.
+        :param float seasonal_smoothing: The weight of a new slot in its seasonal rates, between 0 and 1.
+        :param float seasonal_weight: The weight of the seasonal rates in the prediction, between 0 and 1.
+        """
+        self.level = EwmaModel(time_constant=time_constant)
+        self.seasonal_smoothing = seasonal_smoothing
+        self.seasonal_weight = seasonal_weight
+        self.rates = {season: {} for season, _ in self.SEASONS}
+        self.current_slot = None
+        self.current_arrivals = 0
+        self.current_elapsed = 0
+
+    def get_slot(self, at):
+        return int(at // self.SLOT_DURATION)
+
+    def update(self, at, arrivals, elapsed):
+        self.level.update(at, arrivals, elapsed)
+        slot = self.get_slot(at)
+        if self.current_slot is not None and slot != self.current_slot:
+            self.__close_slot()
+        self.current_slot = slot
+        self.current_arrivals += arrivals
+        self.current_elapsed += elapsed
+
+    def __close_slot(self):
+        if self.current_elapsed > 0:
+            observed_rate = self.current_arrivals / self.current_elapsed
+            for season, nb_slots in self.SEASONS:
+                position = self.current_slot % nb_slots
+                previous_rate = self.rates[season].get(position)
+                self.rates[season][position] = observed_rate if previous_rate is None else (
+                    previous_rate + self.seasonal_smoothing * (observed_rate - previous_rate)
+                )
+        self.current_arrivals = 0
+        self.current_elapsed = 0
+
+    def get_rate(self, slot):
+        level = self.level.rate or 0
+        for season, nb_slots in self.SEASONS:
+            seasonal_rate = self.rates[season].get(slot % nb_slots)
+            if seasonal_rate is not None:
+                return self.seasonal_weight * seasonal_rate + (1 - self.seasonal_weight) * level
+        return level
+
+    def predict(self, at, horizon):
+        expected, end = 0, at + horizon
+        while at < end:
+            slot = self.get_slot(at)
+            slot_end = min((slot + 1) * self.SLOT_DURATION, end)
+            expected += self.get_rate(slot) * (slot_end - at)
+            at = slot_end
+        return expected
+
+    def get_state(self):
+        return {
+            'level': self.level.get_state(),
+            'rates': self.rates,
+            'current_slot': self.current_slot,
+            'current_arrivals': self.current_arrivals,
+            'current_elapsed': self.current_elapsed,
+        }
+
+    def set_state(self, state):
+        self.level.set_state(state.get('level', {}))
+        # JSON only has string keys.
+        self.rates = {
+            season: {int(position): rate for position, rate in state.get('rates', {}).get(season, {}).items()}
+            for season, _ in self.SEASONS
+        }
+        self.current_slot = state.get('current_slot')
+        self.current_arrivals = state.get('current_arrivals', 0)
+        self.current_elapsed = state.get('current_elapsed', 0)
+
+
+MODELS = {model.name: model for model in [EwmaModel, SeasonalModel]}
+
+
+class QueueForecaster(object):
+    """Counts the jobs arriving in the queue at every tick, and predicts how many will arrive within ``horizon``.
+
+    The horizon should span a few boot durations: the nodes switched on for the predicted jobs are then online by the
+    time the jobs arrive. The state of the model is saved to ``state_path`` after every update.
+    """
+    DEFAULT_HORIZON = 5 * 60
+    DEFAULT_STATE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'jam', 'forecast.json')
+
+    def __init__(self, model=None, horizon=DEFAULT_HORIZON, state_path=None):
+        """
+        :param ForecastModel model: The model of the arrivals, an :class:`EwmaModel` by default.
+        :param float horizon: How far to predict the arrivals, in seconds.
+        :param str state_path: Where to save the state of the model, ``None`` not to save it.
+        """
+        self.model = EwmaModel() if model is None else model
+        self.horizon = horizon
+        self.state_path = state_path
+        self.seen_items = None
+        self.last_observation = None
+        self.load()
+
+    def observe(self, items, at=None):
+        """Counts the items of the queue that were not there at the previous tick, and feeds them to the model.
+
+        The first observation only serves as a reference: the items already in the queue did not just arrive.
+
+        :param list(dict) items: The items of the queue.
+        :param float at: When the queue was read, as a UNIX timestamp.
+        """
+        at = time.time() if at is None else at
+        item_ids = {item.get('id') for item in items}
+        if self.seen_items is not None and at > self.last_observation:
+            arrivals = len(item_ids - self.seen_items)
+            self.model.update(at, arrivals, at - self.last_observation)
+            self.save()
+        self.seen_items = item_ids
+        self.last_observation = at
+
+    def predict(self, at=None):
+        """
+        :param float at: From when to predict, as a UNIX timestamp.
+        :return float: The expected number of arrivals within the horizon.
+        """
+        return self.model.predict(time.time() if at is None else at, self.horizon)
+
+    def get_expected_jobs(self, at=None):
+        """
+        :param float at: From when to predict, as a UNIX timestamp.
+        :return int: How many whole jobs are expected within the horizon.
+        """
+        return int(self.predict(at))
+
+    def load(self):
+        if self.state_path is None:
+            return
+        try:
+            with open(self.state_path, 'r') as state_file:
+                state = json.load(state_file)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError):
+            logger.warning("[%s] Could not read the forecast state from %s.",
+                           self.__class__.__name__, self.state_path, exc_info=True)
+            return
+        if state.get('model') != self.model.name:
+            logger.info("[%s] The saved forecast state is for model %s, not %s: starting afresh.",
+                        self.__class__.__name__, state.get('model'), self.model.name)
+            return
+        self.model.set_state(state.get('state', {}))
+
+    def save(self):
+        if self.state_path is None:
+            return
+        try:
+            write_atomically(self.state_path, json.dumps({'model': self.model.name, 'state': self.model.get_state()}))
+        except OSError:
+            logger.warning("[%s] Could not save the forecast state to %s.",
+                           self.__class__.__name__, self.state_path, exc_info=True)
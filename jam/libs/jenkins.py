@@ -1,19 +1,78 @@
 import collections
+import datetime
 import logging
 import os
 import re
+import threading
 import time
 
 import requests
+import requests.adapters
+
+from jam.libs.utils import Deadline
 
 logger = logging.getLogger(__name__)
 
 
+class ApiSession(object):
+    """A long-lived HTTP session, shared by every API caller talking to the same Jenkins server.
+
+    The underlying :class:`requests.Session` pools its connections, so that consecutive calls do not pay for a new
+    TCP/TLS handshake. It also holds the Jenkins crumb, which only gets issued again when the session is replaced
+    or when Jenkins rejects it. Every call gives up after ``timeout`` seconds without an answer, rather than hanging
+    the caller forever.
+    """
+    POOL_MAXSIZE = 10
+    TIMEOUT = 60
+
+    def __init__(self, pool_maxsize=None, timeout=TIMEOUT):
+        """
+        :param int pool_maxsize: How many connections to keep open at most.
+        :param float timeout: How long to wait for Jenkins to connect, then to answer, in seconds.
+        """
+        self.pool_maxsize = self.POOL_MAXSIZE if pool_maxsize is None else pool_maxsize
+        self.timeout = timeout
+        self.lock = threading.RLock()
+        self.crumb = None
+        self.__session = None
+
+    @property
+    def session(self):
+        with self.lock:
+            if self.__session is None:
+                adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize)
+                self.__session = requests.Session()
+                self.__session.mount('http://', adapter)
+                self.__session.mount('https://', adapter)
+                self.crumb = None
+            return self.__session
+
+    def invalidate_crumb(self, crumb):
+        """Forgets about the cached crumb, unless another caller already replaced it.
+
+        :param dict crumb: The crumb that has been rejected.
+        """
+        with self.lock:
+            if self.crumb is crumb:
+                self.crumb = None
+
+    def reset(self):
+        """Closes the current session. The next call will open a new one and issue a new crumb."""
+        with self.lock:
+            if self.__session is not None:
+                self.__session.close()
+            self.__session = None
+            self.crumb = None
+
+
 class ApiCallMixin(object):
-    ApiCallSettings = collections.namedtuple('ApiCallSettings', ['base_url', 'auth', 'crumb_url'])
+    ApiCallSettings = collections.namedtuple('ApiCallSettings', ['base_url', 'auth', 'crumb_url', 'session'])
+    ApiCallSettings.__new__.__defaults__ = (None,)
 
-    def __perform_crumb_call(self, session):
-        crumb_response = session.get(url=self.api_settings.crumb_url, auth=self.api_settings.auth)
+    def __perform_crumb_call(self, api_session):
+        crumb_response = api_session.session.get(
+            url=self.api_settings.crumb_url, auth=self.api_settings.auth, timeout=api_session.timeout,
+        )
         if crumb_response.status_code != 200:
             logger.error(
                 "url=%s\nheaders=%s\nbody=%s\n",
@@ -24,12 +83,35 @@ class ApiCallMixin(object):
             raise requests.ConnectionError('Could not issue Jenkins crumb.', response=crumb_response)
         return crumb_response.json()
 
+    def __get_crumb(self, api_session):
+        with api_session.lock:
+            if api_session.crumb is None:
+                api_session.crumb = self.__perform_crumb_call(api_session=api_session)
+            return api_session.crumb
+
+    def __perform_call(self, api_session, method, url):
+        crumb = self.__get_crumb(api_session=api_session)
+        response = api_session.session.request(method=method, url=url, auth=self.api_settings.auth, headers={
+            crumb['crumbRequestField']: crumb['crumb'],
+        }, timeout=api_session.timeout)
+        if response.status_code == 403:
+            logger.info("API call %s %s was forbidden, issuing a new crumb.", method.upper(), url)
+            api_session.invalidate_crumb(crumb)
+            crumb = self.__get_crumb(api_session=api_session)
+            response = api_session.session.request(method=method, url=url, auth=self.api_settings.auth, headers={
+                crumb['crumbRequestField']: crumb['crumb'],
+            }, timeout=api_session.timeout)
+        return response
+
     def api_call(self, method, api, retries=3):
         if not hasattr(self, 'api_settings') or not isinstance(self.api_settings, self.ApiCallSettings):
             raise AttributeError(
                 f"Class {self.__class__.__name__} must have a member called 'api_settings' "
                 f"which should be a {self.ApiCallSettings.__name__}!"
             )
+        if self.api_settings.session is None:
+            self.api_settings = self.api_settings._replace(session=ApiSession())
+        api_session = self.api_settings.session
         url = f'{self.api_settings.base_url}/{api}'
         header = '[%s %s]' if hasattr(self, 'name') else '[%s]'
         args = [self.__class__.__name__, self.name] if hasattr(self, 'name') else [self.__class__.__name__]
@@ -37,22 +119,27 @@ class ApiCallMixin(object):
         logger.debug(f"{header} External API call %s %s", *args_full)
         exc_info = None
         for retry in range(retries):
-            with requests.session() as session:
-                try:
-                    crumb = self.__perform_crumb_call(session=session)
-                    return session.request(method=method, url=url, auth=self.api_settings.auth, headers={
-                        crumb['crumbRequestField']: crumb['crumb'],
-                    })
-                except requests.ConnectionError as err:
-                    args_retry_fail = args + [retry + 1, retries]
-                    logger.exception(f"{header} Try %d/%d failed.", *args_retry_fail)
-                    exc_info = err
+            try:
+                return self.__perform_call(api_session=api_session, method=method, url=url)
+            except requests.ConnectionError as err:
+                args_retry_fail = args + [retry + 1, retries]
+                logger.exception(f"{header} Try %d/%d failed.", *args_retry_fail)
+                api_session.reset()
+                exc_info = err
         else:
             logger.error(f"{header} API call %s %s failed!", *args_full)
             raise exc_info
 
 
 class Jenkins(ApiCallMixin):
+    AGENTS_TREE = (
+        'computer[displayName,idle,offline,temporarilyOffline,offlineCause[*],offlineCauseReason,'
+        'assignedLabels[name],numExecutors,executors[idle]]'
+    )
+    BUILD_FIELDS = 'url,builds[builtOn,timestamp]{{0,{depth}}}'
+    DEFAULT_BUILD_HISTORY_DEPTH = 5
+    DEFAULT_FOLDER_DEPTH = 3
+
     def __init__(self, url, username, api_token):
         url_match = re.match(r'^(?P<protocol>.*://)?(?P<bare_url>.*)/?$', url).groupdict()
         self.url = f"{url_match.get('protocol', 'http://')}{url_match['bare_url']}"
@@ -60,12 +147,72 @@ class Jenkins(ApiCallMixin):
         self.agents = collections.OrderedDict()
         self.auth = (username, api_token)
         self.job_url = os.getenv('JOB_URL', f'{self.url}/job/Jam/')
-        self.api_settings = self.ApiCallSettings(base_url=self.url, auth=self.auth, crumb_url=self.crumb_url)
+        self.api_session = ApiSession()
+        self.api_settings = self.ApiCallSettings(
+            base_url=self.url, auth=self.auth, crumb_url=self.crumb_url, session=self.api_session
+        )
 
     def get_agent(self, name):
-        return self.agents.setdefault(
-            name, JenkinsAgent(url=self.url, name=name, auth=self.auth, crumb_url=self.crumb_url)
-        )
+        if name not in self.agents:
+            self.agents[name] = JenkinsAgent(
+                url=self.url, name=name, auth=self.auth, crumb_url=self.crumb_url, api_session=self.api_session
+            )
+        return self.agents[name]
+
+    def refresh_agents(self):
+        """Refreshes every registered agent at once, using a single API call."""
+        try:
+            computers = self.api_call('get', f'computer/api/json?tree={self.AGENTS_TREE}').json()['computer']
+        except requests.ConnectionError:
+            logger.exception("[%s] Impossible to get information about the agents!", self.__class__.__name__)
+            raise
+        info_ts = datetime.datetime.now()
+        computers = {computer['displayName']: computer for computer in computers}
+        for name, agent in self.agents.items():
+            if name in computers:
+                agent.update_info(info=computers[name], info_ts=info_ts)
+            else:
+                logger.warning("[%s] Agent %s is unknown to Jenkins.", self.__class__.__name__, name)
+
+    @classmethod
+    def get_builds_tree(cls, depth, folder_depth):
+        """
+        :param int depth: How many builds to look at per job.
+        :param int folder_depth: How many levels of folders to look into.
+        :return str: The ``tree`` parameter reading the builds of the jobs, and of the jobs of the folders.
+        """
+        fields = cls.BUILD_FIELDS.format(depth=depth)
+        tree = fields
+        for _ in range(folder_depth):
+            tree = f'{fields},jobs[{tree}]'
+        return f'jobs[{tree}]'
+
+    def get_build_history(self, depth=DEFAULT_BUILD_HISTORY_DEPTH, folder_depth=DEFAULT_FOLDER_DEPTH):
+        """Lists where the last builds of every job ran, using a single API call.
+
+        The jobs of the folders, such as the branches of a multibranch project, get listed down to ``folder_depth``
+        levels. Only the builds that tell which agent they ran on get listed: the pipelines run on no agent as a whole.
+
+        :param int depth: How many builds to look at per job, the most recent ones.
+        :param int folder_depth: How many levels of folders to look into.
+        :return list(tuple): The URL of the job, the name of the agent and when the build started, as a UNIX
+                             timestamp, of every build.
+        """
+        tree = self.get_builds_tree(depth=depth, folder_depth=folder_depth)
+        try:
+            jobs = self.api_call('get', f'api/json?tree={tree}').json()['jobs']
+        except requests.ConnectionError:
+            logger.exception("[%s] Impossible to retrieve the build history.", self.__class__.__name__)
+            raise
+        history, jobs = [], collections.deque(jobs)
+        while jobs:
+            job = jobs.popleft()
+            jobs.extend(job.get('jobs') or [])
+            history += [
+                (job['url'], build['builtOn'], build['timestamp'] / 1000)
+                for build in job.get('builds') or [] if build.get('builtOn')
+            ]
+        return history
 
     @property
     def jobs(self):
@@ -77,52 +224,116 @@ class Jenkins(ApiCallMixin):
             raise
 
 
+class ExecutorCount(collections.namedtuple('ExecutorCount', ['total', 'busy'])):
+    __slots__ = ()
+
+    @classmethod
+    def from_info(cls, info):
+        """Counts the executors of an agent, from its ``numExecutors``, ``executors[idle]`` and ``idle`` fields.
+
+        When the state of the executors is not part of the information, an agent that is not idle is considered fully
+        busy.
+
+        :param dict info: The information about the agent.
+        :return ExecutorCount: The executors of the agent.
+        """
+        total = info.get('numExecutors', 1)
+        executors = info.get('executors', [])
+        if any('idle' in executor for executor in executors):
+            busy = sum(1 for executor in executors if executor.get('idle') is False)
+        else:
+            busy = 0 if info.get('idle', True) else total
+        return cls(total=total, busy=min(busy, total))
+
+    @property
+    def free(self):
+        return self.total - self.busy
+
+
 class JenkinsAgent(ApiCallMixin):
     QUIET_OFFLINE_CAUSES = {
         'hudson.slaves.OfflineCause$ChannelTermination',
     }
     WAIT_TIME_FORCE_LAUNCH = 15
+    DRAIN_MESSAGE = 'jam.drain'
+    STOP_MESSAGE = 'jam.stop'
+    DEFAULT_STALE_AFTER_MS = 1000
 
-    def __init__(self, url, name, auth=None, crumb_url=None):
+    def __init__(self, url, name, auth=None, crumb_url=None, api_session=None, stale_after=None):
         self.url = f'{url}/computer/{name}'
         self.name = name
         self.labels = set()
         self.info = {}
+        self.stale_after = datetime.timedelta(
+            milliseconds=self.DEFAULT_STALE_AFTER_MS if stale_after is None else stale_after,
+        )
+        self.info_ts = datetime.datetime.min
         self.auth = auth
         self.crumb_url = crumb_url
-        self.api_settings = self.ApiCallSettings(base_url=self.url, auth=self.auth, crumb_url=self.crumb_url)
+        self.api_settings = self.ApiCallSettings(
+            base_url=self.url, auth=self.auth, crumb_url=self.crumb_url, session=api_session
+        )
 
     @property
     def is_idle(self):
-        self.refresh()
+        self.refresh_if_stale()
         return self.info['idle']
 
+    @property
+    def executors(self):
+        self.refresh_if_stale()
+        return ExecutorCount.from_info(self.info)
+
     @property
     def is_online(self):
-        self.refresh()
+        self.refresh_if_stale()
         return not any([self.info['offline'], self.info['temporarilyOffline']])
 
     @property
     def is_offline(self):
-        self.refresh()
+        self.refresh_if_stale()
         return self.info['offline']
 
     @property
     def is_temporarily_offline(self):
-        self.refresh()
+        self.refresh_if_stale()
         return self.info['temporarilyOffline']
 
+    @property
+    def is_drained(self):
+        """Whether the agent has been marked temporarily offline by :meth:`drain`, and maybe disconnected since."""
+        self.refresh_if_stale()
+        return self.get_is_drained(self.info)
+
+    @classmethod
+    def get_is_drained(cls, info):
+        """
+        :param dict info: The information about an agent, as returned by the API.
+        :return bool: Whether the agent has been marked temporarily offline by :meth:`drain`.
+        """
+        return bool(info.get('temporarilyOffline')) and info.get('offlineCauseReason') in [
+            cls.DRAIN_MESSAGE, cls.STOP_MESSAGE,
+        ]
+
     @property
     def offline_cause_reason(self):
-        self.refresh()
+        self.refresh_if_stale()
         if not self.info['offlineCauseReason']:
             return None
         if self.info['offlineCause']['_class'] in self.QUIET_OFFLINE_CAUSES:
             return self.info['offlineCause']['_class']
         return f"{self.info['offlineCause']['_class']} || {self.info['offlineCauseReason']}"
 
-    def force_launch(self):
+    def force_launch(self, deadline=None):
+        """Launches the agent until it is online.
+
+        :param jam.libs.utils.Deadline deadline: How long to wait at most. Forever by default.
+        :raise jam.libs.utils.DeadlineExceeded: The agent is still not online by the deadline.
+        """
+        deadline = Deadline() if deadline is None else deadline
+        self.refresh()
         while not self.is_online:
+            deadline.check(f"agent {self.name} to be online")
             logger.info("[%s %s] Agent is not launched.", self.__class__.__name__, self.name)
             offline_cause_reason = self.offline_cause_reason
             if offline_cause_reason is not None:
@@ -130,16 +341,29 @@ class JenkinsAgent(ApiCallMixin):
                     "[%s %s] Agent is offline because %s.", self.__class__.__name__, self.name, offline_cause_reason
                 )
                 self.launch()
-            time.sleep(self.WAIT_TIME_FORCE_LAUNCH)
+            time.sleep(deadline.get_sleep(self.WAIT_TIME_FORCE_LAUNCH))
+            self.refresh()
         logger.info("[%s %s] Agent is launched.", self.__class__.__name__, self.name)
 
     def _update_labels(self):
         self.labels = set(label_data['name'] for label_data in self.info.get('assignedLabels', []))
 
+    def update_info(self, info, info_ts=None):
+        self.info = info
+        self.info_ts = datetime.datetime.now() if info_ts is None else info_ts
+        self._update_labels()
+
+    def invalidate(self):
+        """Marks the information as stale, so that the next read gets it fresh from Jenkins."""
+        self.info_ts = datetime.datetime.min
+
+    def refresh_if_stale(self):
+        if datetime.datetime.now() - self.info_ts > self.stale_after:
+            self.refresh()
+
     def refresh(self):
         try:
-            self.info = self.api_call('get', 'api/json').json()
-            self._update_labels()
+            self.update_info(info=self.api_call('get', 'api/json').json())
         except requests.ConnectionError:
             logger.exception("[%s %s] Impossible to get information about this agent!",
                              self.__class__.__name__, self.name)
@@ -148,7 +372,38 @@ class JenkinsAgent(ApiCallMixin):
     def launch(self):
         logger.info("[%s %s] Launching Agent.", self.__class__.__name__, self.name)
         self.api_call('post', 'launchSlaveAgent')
+        self.invalidate()
 
     def stop(self):
         logger.info("[%s %s] Stopping Agent.", self.__class__.__name__, self.name)
-        self.api_call('post', 'doDisconnect?offlineMessage=jam.stop')
+        self.api_call('post', f'doDisconnect?offlineMessage={self.STOP_MESSAGE}')
+        self.invalidate()
+
+    def drain(self):
+        """Marks the agent temporarily offline, so that Jenkins gives it no new build. The running builds go on.
+
+        :raise requests.HTTPError: Jenkins did not mark the agent temporarily offline.
+        """
+        logger.info("[%s %s] Draining Agent.", self.__class__.__name__, self.name)
+        self.__toggle_offline(f'toggleOffline?offlineMessage={self.DRAIN_MESSAGE}')
+
+    def undrain(self):
+        """Marks a drained agent back online.
+
+        ``toggleOffline`` flips the mark whatever it is: an agent that is not drained, according to a fresh read, is
+        left as it is.
+
+        :raise requests.HTTPError: Jenkins did not mark the agent back online.
+        """
+        self.refresh()
+        if not self.is_drained:
+            logger.info("[%s %s] Agent is not drained.", self.__class__.__name__, self.name)
+            return
+        logger.info("[%s %s] Undraining Agent.", self.__class__.__name__, self.name)
+        self.__toggle_offline('toggleOffline')
+
+    def __toggle_offline(self, api):
+        try:
+            self.api_call('post', api).raise_for_status()
+        finally:
+            self.invalidate()
@@ -0,0 +1,152 @@
+import collections
+import functools
+import re
+
+
+class LabelExpressionError(ValueError):
+    pass
+
+
+# Atoms may contain dashes, but not the -> operator: Jenkins reads linux->docker as an implication.
+TOKENS = re.compile(
+    r'\s*(?:(?P<operator><->|->|&&|\|\||!|\(|\))|"(?P<quoted>(?:[^"\\]|\\.)*)"'
+    r'|(?P<atom>(?:(?!->)[^\s&|!()<>"])+))'
+)
+
+
+def tokenize(expression):
+    position, tokens = 0, []
+    expression = expression.rstrip()
+    while position < len(expression):
+        match = TOKENS.match(expression, position)
+        if match is None or match.end() == position:
+            raise LabelExpressionError(f"Unexpected character at position {position} of {expression!r}.")
+        if match.group('operator') is not None:
+            tokens.append(('operator', match.group('operator')))
+        elif match.group('quoted') is not None:
+            tokens.append(('atom', re.sub(r'\\(.)', r'\1', match.group('quoted'))))
+        else:
+            tokens.append(('atom', match.group('atom')))
+        position = match.end()
+    return tokens
+
+
+class LabelIndex(object):
+    """Knows which nodes have which labels, as bitsets: bit ``i`` stands for the ``i``-th node."""
+
+    def __init__(self, labels_by_node):
+        """
+        :param dict labels_by_node: The labels of every node, by node name.
+        """
+        self.names = list(labels_by_node)
+        self.bits = {name: 1 << position for position, name in enumerate(self.names)}
+        self.all = (1 << len(self.names)) - 1
+        self.masks = collections.defaultdict(int)
+        for name, labels in labels_by_node.items():
+            for label in labels:
+                self.masks[label] |= self.bits[name]
+
+    def get_mask(self, label):
+        return self.masks.get(label, 0)
+
+    def get_names(self, mask):
+        return [name for name in self.names if mask & self.bits[name]]
+
+    def contains(self, mask, name):
+        return bool(mask & self.bits[name])
+
+
+class LabelExpression(object):
+    """A compiled Jenkins label expression, such as ``linux && (docker || podman) && !arm``.
+
+    Evaluating it against a :class:`LabelIndex` gives the bitset of the matching nodes, in a few integer operations.
+    """
+
+    def __init__(self, expression, evaluate):
+        self.expression = expression
+        self.__evaluate = evaluate
+
+    def evaluate(self, index):
+        """
+        :param LabelIndex index: The labels of the nodes.
+        :return int: The bitset of the nodes matching the expression.
+        """
+        return self.__evaluate(index) & index.all
+
+    def matches(self, labels):
+        """
+        :param set(str) labels: The labels of one node.
+        :return bool: Whether a node with these labels matches the expression.
+        """
+        return bool(self.evaluate(LabelIndex({None: labels})))
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.expression!r})'
+
+
+class Parser(object):
+    """Recursive descent parser of the label expressions, from the loosest operator to the tightest one:
+    ``<->``, ``->``, ``||``, ``&&``, ``!``.
+    """
+
+    BINARY_OPERATORS = collections.OrderedDict([
+        ('<->', lambda left, right, index: ~(left(index) ^ right(index))),
+        ('->', lambda left, right, index: ~left(index) | right(index)),
+        ('||', lambda left, right, index: left(index) | right(index)),
+        ('&&', lambda left, right, index: left(index) & right(index)),
+    ])
+
+    def __init__(self, expression):
+        self.expression = expression
+        self.tokens = tokenize(expression)
+        self.position = 0
+
+    def parse(self):
+        if not self.tokens:
+            raise LabelExpressionError("The label expression is empty.")
+        evaluate = self.parse_binary(0)
+        if self.position < len(self.tokens):
+            raise LabelExpressionError(f"Unexpected {self.tokens[self.position][1]!r} in {self.expression!r}.")
+        return evaluate
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def parse_binary(self, level):
+        operators = list(self.BINARY_OPERATORS)
+        if level == len(operators):
+            return self.parse_unary()
+        operator = operators[level]
+        left = self.parse_binary(level + 1)
+        while self.peek() == ('operator', operator):
+            self.position += 1
+            right = self.parse_binary(level + 1)
+            left = functools.partial(self.BINARY_OPERATORS[operator], left, right)
+        return left
+
+    def parse_unary(self):
+        kind, value = self.peek()
+        self.position += 1
+        if (kind, value) == ('operator', '!'):
+            operand = self.parse_unary()
+            return lambda index: ~operand(index)
+        if (kind, value) == ('operator', '('):
+            inner = self.parse_binary(0)
+            if self.peek() != ('operator', ')'):
+                raise LabelExpressionError(f"Missing closing parenthesis in {self.expression!r}.")
+            self.position += 1
+            return inner
+        if kind == 'atom':
+            return lambda index: index.get_mask(value)
+        raise LabelExpressionError(f"Unexpected {value or 'end'!r} in {self.expression!r}.")
+
+
+@functools.lru_cache(maxsize=4096)
+def compile_expression(expression):
+    """Compiles a label expression once and for all.
+
+    :param str expression: The label expression.
+    :return LabelExpression: The compiled expression.
+    :raise LabelExpressionError: The expression is not valid.
+    """
+    return LabelExpression(expression=expression, evaluate=Parser(expression).parse())
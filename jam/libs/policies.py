@@ -0,0 +1,241 @@
+import collections
+import datetime
+import logging
+import random
+
+
+logger = logging.getLogger(__name__)
+
+
+class ScaleDownPolicy(object):
+    """Decides which idle nodes may be switched off, so that bursts of jobs do not make nodes boot and stop over and
+    over again.
+
+    An idle node may only be switched off:
+        * once it has been idle for ``min_idle_time``,
+        * once ``cooldown`` has passed since the last scale up,
+        * once its instance has been running for ``min_run_time``: Compute Engine bills at least one minute anyway.
+    """
+    DEFAULT_MIN_IDLE_TIME = 120
+    DEFAULT_COOLDOWN = 60
+    DEFAULT_MIN_RUN_TIME = 60
+
+    def __init__(self, min_idle_time=None, cooldown=None, min_run_time=None):
+        """
+        :param float min_idle_time: How long a node has to be idle before being switched off, in seconds.
+        :param float cooldown: How long to wait after a scale up before switching any node off, in seconds.
+        :param float min_run_time: How long an instance has to run before being switched off, in seconds.
+        """
+        self.min_idle_time = datetime.timedelta(
+            seconds=self.DEFAULT_MIN_IDLE_TIME if min_idle_time is None else min_idle_time
+        )
+        self.cooldown = datetime.timedelta(seconds=self.DEFAULT_COOLDOWN if cooldown is None else cooldown)
+        self.min_run_time = datetime.timedelta(
+            seconds=self.DEFAULT_MIN_RUN_TIME if min_run_time is None else min_run_time
+        )
+        self.idle_since = {}
+        self.last_scale_up = datetime.datetime.min
+
+    def observe(self, snapshot):
+        """Keeps track of how long every node has been idle.
+
+        :param jam.libs.core.FleetSnapshot snapshot: The state of the fleet.
+        """
+        idle_nodes = snapshot.idle_nodes
+        for name in list(self.idle_since):
+            if name not in idle_nodes:
+                del self.idle_since[name]
+        for name in idle_nodes:
+            self.idle_since.setdefault(name, snapshot.taken_at)
+
+    def record_scale_up(self, at=None):
+        self.last_scale_up = datetime.datetime.now() if at is None else at
+
+    def get_stoppable_nodes(self, snapshot, now=None):
+        """
+        :param jam.libs.core.FleetSnapshot snapshot: The state of the fleet.
+        :param datetime.datetime now: The current time.
+        :return dict: The snapshots of the idle nodes that may be switched off, by name.
+        """
+        now = datetime.datetime.now() if now is None else now
+        if now - self.last_scale_up < self.cooldown:
+            logger.info("[%s] No node gets switched off less than %s after a scale up.",
+                        self.__class__.__name__, self.cooldown)
+            return collections.OrderedDict()
+        return collections.OrderedDict(
+            (name, node) for name, node in snapshot.idle_nodes.items() if self.__is_stoppable(node, now)
+        )
+
+    def __is_stoppable(self, node, now):
+        idle_for = now - self.idle_since.get(node.name, now)
+        if idle_for < self.min_idle_time:
+            logger.info("[%s] Node %s has only been idle for %s.", self.__class__.__name__, node.name, idle_for)
+            return False
+        if node.started_at is not None:
+            running_for = now.astimezone(datetime.timezone.utc) - node.started_at
+            if running_for < self.min_run_time:
+                logger.info("[%s] Node %s has only been running for %s.",
+                            self.__class__.__name__, node.name, running_for)
+                return False
+        return True
+
+
+class Quarantine(object):
+    """Keeps the nodes that fail to switch ``max_failures`` times in a row away from the scaler for ``period``.
+
+    A quarantined node does not get switched on, and does not count as capacity while it is switching on: one bad
+    instance must not hold the scaling of the whole fleet.
+    """
+    DEFAULT_MAX_FAILURES = 3
+    DEFAULT_PERIOD = 30 * 60
+
+    def __init__(self, max_failures=DEFAULT_MAX_FAILURES, period=DEFAULT_PERIOD):
+        """
+        :param int max_failures: How many failed transitions in a row put a node in quarantine.
+        :param float period: How long a node stays in quarantine, in seconds.
+        """
+        self.max_failures = max_failures
+        self.period = datetime.timedelta(seconds=period)
+        self.failures = collections.Counter()
+        self.released_at = {}
+
+    def record_transitions(self, summary, now=None):
+        """
+        :param jam.libs.transitions.TransitionSummary summary: The transitions that are over.
+        :param datetime.datetime now: The current time.
+        """
+        now = datetime.datetime.now() if now is None else now
+        for name in summary.succeeded:
+            del self.failures[name]
+        for name, result in summary.failed.items():
+            self.failures[name] += 1
+            if self.failures[name] >= self.max_failures:
+                del self.failures[name]
+                self.released_at[name] = now + self.period
+                logger.warning("[%s] Node %s failed to switch %d times in a row, the last time because of %r: "
+                               "it is left alone until %s.", self.__class__.__name__, name, self.max_failures,
+                               result.error, self.released_at[name])
+
+    def get_quarantined_nodes(self, now=None):
+        """
+        :param datetime.datetime now: The current time.
+        :return frozenset(str): The names of the nodes in quarantine.
+        """
+        now = datetime.datetime.now() if now is None else now
+        for name in [name for name, released_at in self.released_at.items() if released_at <= now]:
+            logger.info("[%s] Node %s is released from quarantine.", self.__class__.__name__, name)
+            del self.released_at[name]
+        return frozenset(self.released_at)
+
+
+class NodeSelectionPolicy(object):
+    """Decides which nodes to switch on or off first, when there is a choice.
+
+    The capacity planner only asks for an order: which nodes may be switched, and how many, stays up to the pools and
+    to the jobs. Both orders are asked for at every tick, after :meth:`observe`, so a policy may learn from the fleet.
+    """
+    name = None
+
+    def observe(self, snapshot):
+        """Learns from the state of the fleet, once per tick.
+
+        :param jam.libs.core.FleetSnapshot snapshot: The state of the fleet.
+        """
+
+    def sort_to_start(self, nodes):
+        """
+        :param list(jam.libs.core.NodeSnapshot) nodes: The offline nodes.
+        :return list(jam.libs.core.NodeSnapshot): The nodes, the ones to switch on first coming first.
+        """
+        raise NotImplementedError
+
+    def sort_to_stop(self, nodes):
+        """
+        :param list(jam.libs.core.NodeSnapshot) nodes: The idle nodes.
+        :return list(jam.libs.core.NodeSnapshot): The nodes, the ones to switch off first coming first.
+        """
+        raise NotImplementedError
+
+
+class RandomSelectionPolicy(NodeSelectionPolicy):
+    """Any node will do: spreads the uptime over the whole fleet."""
+    name = 'random'
+
+    def sort_to_start(self, nodes):
+        return random.sample(list(nodes), len(nodes))
+
+    def sort_to_stop(self, nodes):
+        return random.sample(list(nodes), len(nodes))
+
+
+class BootTimeSelectionPolicy(RandomSelectionPolicy):
+    """Switches the fastest nodes on first, and the most expensive then slowest ones off first.
+
+    The boot time of a node is measured from the first snapshot where it is switching on to the first one where its
+    agent is online, and smoothed over its boots. Until a node has booted once, it is expected to be as fast as the
+    average node. The ties are broken randomly.
+    """
+    name = 'boot-time'
+    DEFAULT_SMOOTHING = 0.3
+
+    def __init__(self, costs=None, smoothing=DEFAULT_SMOOTHING):
+        """
+        :param dict costs: How much every node costs to run, relatively to each other, by name. ``1`` by default.
+        :param float smoothing: The weight of a new boot in the boot time of a node, between 0 and 1.
+        """
+        self.costs = dict(costs or {})
+        self.smoothing = smoothing
+        self.boot_times = {}
+        self.switching_on_since = {}
+
+    @staticmethod
+    def parse_cost(value):
+        """
+        :param str value: The cost of a node, as ``NODE=COST``.
+        :return tuple: The name of the node and its cost.
+        """
+        name, _, cost = value.partition('=')
+        if not name or not cost:
+            raise ValueError(f"The cost of a node is described as NODE=COST, not {value}.")
+        return name, float(cost)
+
+    def observe(self, snapshot):
+        starting_nodes = snapshot.starting_nodes
+        online_nodes = set(snapshot.idle_nodes) | set(snapshot.busy_nodes)
+        for name in starting_nodes:
+            self.switching_on_since.setdefault(name, snapshot.taken_at)
+        for name in [name for name in self.switching_on_since if name not in starting_nodes]:
+            since = self.switching_on_since.pop(name)
+            if name in online_nodes:
+                self.record_boot(name, (snapshot.taken_at - since).total_seconds())
+
+    def record_boot(self, name, duration):
+        """
+        :param str name: The name of the node.
+        :param float duration: How long it took for the agent to be online, in seconds.
+        """
+        previous = self.boot_times.get(name)
+        self.boot_times[name] = duration if previous is None else previous + self.smoothing * (duration - previous)
+        logger.info("[%s] Node %s booted in %.0fs (%.0fs on average).",
+                    self.__class__.__name__, name, duration, self.boot_times[name])
+
+    def get_boot_time(self, name):
+        if name in self.boot_times:
+            return self.boot_times[name]
+        if self.boot_times:
+            return sum(self.boot_times.values()) / len(self.boot_times)
+        return 0
+
+    def get_cost(self, name):
+        return self.costs.get(name, 1)
+
+    def sort_to_start(self, nodes):
+        return sorted(super().sort_to_start(nodes),
+                      key=lambda node: (self.get_boot_time(node.name), self.get_cost(node.name)))
+
+    def sort_to_stop(self, nodes):
+        return sorted(super().sort_to_stop(nodes),
+                      key=lambda node: (-self.get_cost(node.name), -self.get_boot_time(node.name)))
+
+
+SELECTION_POLICIES = {policy.name: policy for policy in [RandomSelectionPolicy, BootTimeSelectionPolicy]}
@@ -0,0 +1,261 @@
+import collections
+import logging
+
+from jam.libs.compute_engine import InstanceStatus
+from jam.libs.demand import get_required_label
+from jam.libs.labels import LabelExpressionError, LabelIndex, compile_expression
+from jam.libs.policies import RandomSelectionPolicy
+
+
+logger = logging.getLogger(__name__)
+
+
+class LabelPool(collections.namedtuple('LabelPool', ['label', 'min_nodes', 'max_nodes'])):
+    """The nodes having a given label, of which at least ``min_nodes`` and at most ``max_nodes`` are online."""
+    __slots__ = ()
+
+    @classmethod
+    def parse(cls, value):
+        """
+        :param str value: The pool, as ``label[:min_nodes[:max_nodes]]``.
+        :return LabelPool: The pool.
+        """
+        label, *bounds = value.split(':')
+        if not label or len(bounds) > 2:
+            raise ValueError(f"A label pool is described as label[:min_nodes[:max_nodes]], not {value}.")
+        min_nodes = int(bounds[0]) if bounds and bounds[0] else 0
+        max_nodes = int(bounds[1]) if len(bounds) > 1 and bounds[1] else None
+        if min_nodes < 0 or max_nodes is not None and max_nodes < min_nodes:
+            raise ValueError(f"The bounds of label pool {label} are not consistent: {value}.")
+        return cls(label=label, min_nodes=min_nodes, max_nodes=max_nodes)
+
+
+LabelPool.__new__.__defaults__ = (0, None)
+
+
+def merge_pools(pools):
+    """Merges the pools having the same label, such as overlapping capacity floors, which would otherwise count every
+    node once per pool.
+
+    :param list(LabelPool) pools: The label pools.
+    :return tuple(LabelPool): One pool per label, with the highest minimum and the lowest maximum. The maximum wins
+                              when they conflict.
+    """
+    merged = collections.OrderedDict()
+    for pool in pools:
+        previous = merged.get(pool.label)
+        if previous is not None:
+            maxima = [bound for bound in [previous.max_nodes, pool.max_nodes] if bound is not None]
+            max_nodes = min(maxima) if maxima else None
+            min_nodes = max(previous.min_nodes, pool.min_nodes)
+            pool = LabelPool(
+                label=pool.label,
+                min_nodes=min_nodes if max_nodes is None else min(min_nodes, max_nodes),
+                max_nodes=max_nodes,
+            )
+        merged[pool.label] = pool
+    return tuple(merged.values())
+
+
+def get_mask(index, label):
+    """
+    :param LabelIndex index: The labels of the nodes.
+    :param str label: The label expression required by a job, ``None`` if any node would do.
+    :return int: The bitset of the nodes able to run the job.
+    """
+    if label is None:
+        return index.all
+    try:
+        return compile_expression(label).evaluate(index)
+    except LabelExpressionError:
+        logger.warning("Label expression %r is not valid.", label, exc_info=True)
+        return 0
+
+
+class CapacityPlan(collections.namedtuple('CapacityPlan', ['assignments', 'to_start', 'unserved', 'spare'])):
+    """What the fleet should look like to serve the queue.
+
+    * ``assignments``: the jobs that the online or starting nodes are expected to take right away, by node name.
+      The nodes only reserved for the surge or the expected jobs do not appear here, but are not spare either.
+    * ``to_start``: the offline nodes to switch on, by order of preference.
+    * ``unserved``: the labels for which an executor is needed but no node can be switched on.
+    * ``spare``: the idle or starting nodes that are not needed.
+    """
+    __slots__ = ()
+
+    @property
+    def missing(self):
+        return len(self.to_start) + len(self.unserved)
+
+
+class CapacityPlanner(object):
+    """Matches the jobs in the queue with the free executors able to run them, pool by pool.
+
+    The label expressions are evaluated once per plan against a bitset index of the fleet.
+    """
+
+    def __init__(self, pools=(), warm_idle=0, expected_jobs=0, surge=(), selection_policy=None, affinity=None,
+                 excluded=frozenset()):
+        """
+        :param list(LabelPool) pools: The label pools, with their bounds. The pools of a same label get merged.
+        :param int warm_idle: How many nodes to keep idle beyond the jobs in the queue.
+        :param int expected_jobs: How many jobs, with no particular label, are expected to arrive soon.
+        :param list(str) surge: The label expressions needing extra executors, once per executor.
+        :param jam.libs.policies.NodeSelectionPolicy selection_policy: Which nodes to switch on or off first.
+        :param jam.libs.affinity.AffinityIndex affinity: Which nodes recently built which jobs, ``None`` to ignore it.
+        :param frozenset(str) excluded: The nodes neither to switch on nor to count on while they are switching on.
+        """
+        self.pools = merge_pools(pools)
+        self.warm_idle = warm_idle
+        self.expected_jobs = expected_jobs
+        self.surge = tuple(surge)
+        self.selection_policy = RandomSelectionPolicy() if selection_policy is None else selection_policy
+        self.affinity = affinity
+        self.excluded = frozenset(excluded)
+
+    def plan(self, snapshot):
+        """
+        :param jam.libs.core.FleetSnapshot snapshot: The state of the fleet.
+        :return CapacityPlan: What to switch on and what could be switched off.
+        """
+        index = LabelIndex(collections.OrderedDict((node.name, node.labels) for node in snapshot.nodes))
+        masks = {}
+
+        def matches(node, label):
+            if label not in masks:
+                masks[label] = get_mask(index, label)
+            return index.contains(masks[label], node.name)
+
+        online = list(snapshot.idle_nodes.values()) + list(snapshot.busy_nodes.values())
+        online += list(snapshot.starting_nodes.values())
+        pool_sizes = {pool: sum(1 for node in online if matches(node, pool.label)) for pool in self.pools}
+
+        # Jobs get packed on the partially busy nodes first, then on the idle ones, then on the starting ones. The idle
+        # nodes to switch off first come last, so that they are the ones left spare.
+        available = [node for node in snapshot.busy_nodes.values() if node.free_executors > 0]
+        available += reversed(self.selection_policy.sort_to_stop(snapshot.idle_nodes.values()))
+        available += [node for node in snapshot.starting_nodes.values() if node.name not in self.excluded]
+        free_executors = {node.name: node.free_executors for node in available}
+        assignments = collections.OrderedDict()
+        needs = []
+        # The jobs needing a label get served first: the others can run anywhere. The extra executors of the surge and
+        # of the expected jobs come last, and are only reserved.
+        jobs = sorted(snapshot.jobs, key=lambda job: get_required_label(job) is None)
+        demand = [(job, get_required_label(job)) for job in jobs]
+        demand += [(None, label) for label in self.surge] + [(None, None)] * self.expected_jobs
+        for job, label in demand:
+            node = next((node for node in available if free_executors[node.name] > 0 and matches(node, label)), None)
+            if node is None:
+                needs.append((job, label))
+                continue
+            free_executors[node.name] -= 1
+            node_jobs = assignments.setdefault(node.name, [])
+            if job is not None:
+                node_jobs.append(job)
+        unassigned = [node for node in available
+                      if node.name not in assignments and node.name not in snapshot.busy_nodes]
+
+        to_start, unserved = self.__pick(snapshot, needs, max(self.warm_idle - len(unassigned), 0), pool_sizes,
+                                         matches)
+        protected = frozenset() if self.affinity is None else self.affinity.get_protected_nodes(
+            [node.name for node in online]
+        )
+        spare = self.__get_spare(unassigned, snapshot.starting_nodes, pool_sizes, matches, protected)
+        return CapacityPlan(
+            assignments=collections.OrderedDict((name, tuple(jobs)) for name, jobs in assignments.items() if jobs),
+            to_start=tuple(to_start),
+            unserved=tuple(unserved),
+            spare=spare,
+        )
+
+    def __pick(self, snapshot, needs, nb_warm_nodes, pool_sizes, matches):
+        selection = _Selection(snapshot=snapshot, pools=self.pools, pool_sizes=pool_sizes, matches=matches,
+                               selection_policy=self.selection_policy, excluded=self.excluded)
+        for job, label in needs:
+            preferred = () if job is None or self.affinity is None else self.affinity.get_preferred_nodes(job)
+            selection.take_executor(label, preferred=preferred)
+        for _ in range(nb_warm_nodes):
+            selection.start(None)
+        for pool in self.pools:
+            while pool_sizes[pool] < pool.min_nodes and selection.start(pool.label) is not None:
+                pass
+        return selection.to_start, selection.unserved
+
+    def __get_spare(self, unassigned, starting_nodes, pool_sizes, matches, protected):
+        pool_sizes = dict(pool_sizes)
+        # The starting nodes are the first ones kept warm: they are on their way anyway.
+        kept = sorted(unassigned, key=lambda node: node.name not in starting_nodes)[:self.warm_idle]
+        spare = []
+        # The idle nodes come in the order they should be switched off, so that the pool minimums keep the nodes the
+        # selection policy prefers to keep. The starting nodes come last.
+        for node in sorted(reversed(unassigned), key=lambda node: node.name in starting_nodes):
+            # The last warm agent of an active job is kept as well.
+            if node in kept or node.name in protected:
+                continue
+            pools = [pool for pool in self.pools if matches(node, pool.label)]
+            if any(pool_sizes[pool] <= pool.min_nodes for pool in pools):
+                continue
+            for pool in pools:
+                pool_sizes[pool] -= 1
+            spare.append(node.name)
+        return tuple(spare)
+
+
+class _Selection(object):
+    """The offline nodes selected to be switched on, with their executors that are not needed yet."""
+
+    def __init__(self, snapshot, pools, pool_sizes, matches, selection_policy, excluded):
+        self.nodes = snapshot.nodes_by_name
+        self.pools = pools
+        self.pool_sizes = pool_sizes
+        self.matches = matches
+        # Suspended nodes come first: they are ready much sooner than the ones that have to boot.
+        offline = selection_policy.sort_to_start(
+            [node for node in snapshot.offline_nodes.values() if node.name not in excluded]
+        )
+        self.candidates = [node for node in offline if node.instance_status == InstanceStatus.SUSPENDED]
+        self.candidates += [node for node in offline if node.instance_status != InstanceStatus.SUSPENDED]
+        self.candidates_by_name = {node.name: node for node in self.candidates}
+        self.to_start = []
+        self.unserved = []
+        self.free_executors = collections.OrderedDict()
+
+    def fits(self, node):
+        return all(pool.max_nodes is None or self.pool_sizes[pool] < pool.max_nodes
+                   for pool in self.pools if self.matches(node, pool.label))
+
+    def start(self, label, preferred=()):
+        """Selects one more node able to run jobs with the given label.
+
+        :param str label: The label expression, ``None`` for any node.
+        :param tuple(str) preferred: The names of the nodes to select first, if they can.
+        :return jam.libs.core.NodeSnapshot: The selected node, ``None`` if there is none.
+        """
+        candidates = [self.candidates_by_name[name] for name in preferred if name in self.candidates_by_name]
+        node = next((node for node in candidates + self.candidates
+                     if node.name not in self.to_start and self.matches(node, label) and self.fits(node)), None)
+        if node is None:
+            self.unserved.append(label)
+            return None
+        self.to_start.append(node.name)
+        self.free_executors[node.name] = node.executors
+        for pool in self.pools:
+            if self.matches(node, pool.label):
+                self.pool_sizes[pool] += 1
+        return node
+
+    def take_executor(self, label, preferred=()):
+        """Finds an executor for a job on the selected nodes, selecting one more node if needed.
+
+        :param str label: The label expression required by the job, ``None`` if any node would do.
+        :param tuple(str) preferred: The names of the nodes to take an executor from first, if they can.
+        """
+        selected = sorted(self.free_executors, key=lambda name: name not in preferred)
+        name = next((name for name in selected
+                     if self.free_executors[name] > 0 and self.matches(self.nodes[name], label)), None)
+        if name is None:
+            node = self.start(label, preferred=preferred)
+            if node is None:
+                return
+            name = node.name
+        self.free_executors[name] -= 1
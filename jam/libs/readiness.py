@@ -0,0 +1,142 @@
+import logging
+import re
+import time
+
+from jam.libs.compute_engine import ComputeEngineError, PermissionDenied, SerialConsole
+from jam.libs.utils import Deadline
+
+
+logger = logging.getLogger(__name__)
+
+
+class ReadinessDetector(object):
+    """Brings the agent of a booting node online as soon as its instance has booted.
+
+    The serial console of the instance gets tailed every ``console_interval`` seconds, until a line matches
+    ``marker``: the agent is then launched right away, and polled every ``min_poll`` seconds, backing off up to
+    ``max_poll`` seconds. Meanwhile, the agent keeps being checked, and launched when Jenkins says it is offline, as
+    often as it was without the detector: a marker that never shows up delays nothing. The console is given up on
+    after ``boot_timeout`` seconds, and for good once the API denies reading it. Prewarmed instances wait for the
+    marker the same way before getting suspended.
+    """
+    DEFAULT_MARKER = r'Startup finished|Finished running startup scripts'
+    DEFAULT_BOOT_TIMEOUT = 10 * 60
+    CONSOLE_INTERVAL = 2
+    MIN_POLL = 1
+    MAX_POLL = 5
+    POLL_BACKOFF = 1.5
+
+    def __init__(self, marker=DEFAULT_MARKER, boot_timeout=DEFAULT_BOOT_TIMEOUT, console_interval=CONSOLE_INTERVAL,
+                 min_poll=MIN_POLL, max_poll=MAX_POLL):
+        """
+        :param str marker: The regular expression matching the line the instances write once they have booted.
+        :param float boot_timeout: How long to tail the serial console at most, in seconds.
+        :param float console_interval: How often to read the serial console, in seconds.
+        :param float min_poll: How soon to check the agent again after launching it, in seconds.
+        :param float max_poll: How long to wait at most between two checks of a launched agent, in seconds.
+        """
+        self.marker = re.compile(marker)
+        self.boot_timeout = boot_timeout
+        self.console_interval = console_interval
+        self.min_poll = min_poll
+        self.max_poll = max_poll
+        self.console_denied = False
+
+    def bring_online(self, instance, agent, tail_console=True, deadline=None):
+        """Waits for the agent of a running instance to be online, launching it when needed.
+
+        :param jam.libs.compute_engine.ComputeEngineInstance instance: The instance, which is running.
+        :param jam.libs.jenkins.JenkinsAgent agent: The agent.
+        :param bool tail_console: Whether the instance is booting. A resumed instance does not boot again.
+        :param jam.libs.utils.Deadline deadline: How long to wait at most. Forever by default.
+        :raise jam.libs.utils.DeadlineExceeded: The agent is still not online by the deadline.
+        """
+        deadline = Deadline() if deadline is None else deadline
+        console = SerialConsole(instance) if tail_console and not self.console_denied else None
+        give_up_console_at = time.monotonic() + self.boot_timeout
+        next_check, poll = time.monotonic(), None
+        while True:
+            booted = False
+            if console is not None:
+                console, booted = self.tail(console, agent.name, give_up_console_at)
+            if booted:
+                next_check, poll = time.monotonic(), self.min_poll
+            if time.monotonic() >= next_check:
+                if self.check(agent, launch=booted):
+                    return
+                # Until the instance has booted, the agent is checked as often as it was without the detector.
+                delay, poll = (agent.WAIT_TIME_FORCE_LAUNCH, None) if poll is None else (
+                    poll, min(poll * self.POLL_BACKOFF, self.max_poll)
+                )
+                next_check = time.monotonic() + delay
+            deadline.check(f"agent {agent.name} to be online")
+            wait = max(next_check - time.monotonic(), 0)
+            time.sleep(deadline.get_sleep(wait if console is None else min(wait, self.console_interval)))
+
+    def wait_for_boot(self, instance, deadline=None):
+        """Waits for a running instance to write the marker on its serial console.
+
+        :param jam.libs.compute_engine.ComputeEngineInstance instance: The instance, which is running.
+        :param jam.libs.utils.Deadline deadline: How long to wait at most. Forever by default.
+        :return bool: Whether the instance has booted, ``False`` once the console has been given up on.
+        :raise jam.libs.utils.DeadlineExceeded: The instance has still not booted by the deadline.
+        """
+        deadline = Deadline() if deadline is None else deadline
+        console = None if self.console_denied else SerialConsole(instance)
+        give_up_console_at = time.monotonic() + self.boot_timeout
+        while console is not None:
+            console, booted = self.tail(console, instance.name, give_up_console_at)
+            if booted:
+                return True
+            if console is not None:
+                deadline.check(f"instance {instance.name} to boot")
+                time.sleep(deadline.get_sleep(self.console_interval))
+        return False
+
+    def tail(self, console, name, give_up_at):
+        """Reads what the instance wrote on its serial console since the previous read.
+
+        :param SerialConsole console: The serial console of the instance.
+        :param str name: The name of the node, for the logs.
+        :param float give_up_at: When to give up on the console, as a :func:`time.monotonic` time.
+        :return tuple: The console, ``None`` once it is no longer worth reading, and whether the instance has booted.
+        """
+        try:
+            lines = console.read_lines()
+        except PermissionDenied as err:
+            logger.warning("[%s %s] Not allowed to read the serial console, only polling the agents from now on: %s",
+                           self.__class__.__name__, name, err)
+            self.console_denied = True
+            return None, False
+        except ComputeEngineError:
+            logger.warning("[%s %s] Could not read the serial console.", self.__class__.__name__, name,
+                           exc_info=True)
+            lines = []
+        if any(self.marker.search(line) for line in lines):
+            logger.info("[%s %s] The instance has booted.", self.__class__.__name__, name)
+            return None, True
+        if time.monotonic() > give_up_at:
+            logger.warning("[%s %s] No boot marker on the serial console after %ss.",
+                           self.__class__.__name__, name, self.boot_timeout)
+            return None, False
+        return console, False
+
+    @staticmethod
+    def check(agent, launch=False):
+        """Checks the agent once, and launches it if Jenkins says it is offline.
+
+        :param jam.libs.jenkins.JenkinsAgent agent: The agent.
+        :param bool launch: Whether to launch the agent if it is not online, whatever Jenkins says.
+        :return bool: Whether the agent is online.
+        """
+        agent.refresh()
+        if agent.is_online:
+            logger.info("[%s %s] Agent is launched.", agent.__class__.__name__, agent.name)
+            return True
+        offline_cause_reason = agent.offline_cause_reason
+        if offline_cause_reason is not None:
+            logger.info("[%s %s] Agent is offline because %s.", agent.__class__.__name__, agent.name,
+                        offline_cause_reason)
+        if launch or offline_cause_reason is not None:
+            agent.launch()
+        return False
@@ -0,0 +1,133 @@
+import collections
+import datetime
+import logging
+
+from jam.libs.pools import LabelPool
+from jam.libs.transitions import TransitionAction
+
+
+logger = logging.getLogger(__name__)
+
+
+DAYS = ['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun']
+
+
+def parse_days(value):
+    """
+    :param str value: The days, as ``*``, or a comma-separated list of days (``mon``) and ranges of days (``mon-fri``).
+    :return frozenset(int): The days, as :meth:`datetime.date.weekday` does.
+    """
+    if value == '*':
+        return frozenset(range(len(DAYS)))
+    days = set()
+    for part in value.lower().split(','):
+        first, _, last = part.partition('-')
+        if first not in DAYS or last and last not in DAYS:
+            raise ValueError(f"Days are described as *, mon, mon-fri or mon,wed,fri, not {value}.")
+        first, last = DAYS.index(first), DAYS.index(last or first)
+        # Ranges may wrap around the end of the week, such as fri-mon.
+        days.update(day % len(DAYS) for day in range(first, last + (len(DAYS) if last < first else 0) + 1))
+    return frozenset(days)
+
+
+def parse_time(value):
+    try:
+        return datetime.datetime.strptime(value, '%H:%M').time()
+    except ValueError:
+        raise ValueError(f"Times are described as HH:MM, not {value}.")
+
+
+class CapacityFloor(collections.namedtuple('CapacityFloor', ['min_nodes', 'days', 'start', 'end', 'label'])):
+    """At least ``min_nodes`` nodes with ``label`` online from ``start`` to ``end`` (local time) on ``days``.
+
+    A window ending before it starts, such as ``22:00-02:00``, ends on the following day.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def parse(cls, value):
+        """
+        :param str value: The floor, as ``MIN DAYS HH:MM-HH:MM [LABEL]``, such as ``6 mon-fri 08:45-18:00``.
+        :return CapacityFloor: The floor.
+        """
+        fields = value.split(None, 3)
+        if len(fields) < 3 or '-' not in fields[2]:
+            raise ValueError(f"A capacity floor is described as MIN DAYS HH:MM-HH:MM [LABEL], not {value}.")
+        min_nodes = int(fields[0])
+        if min_nodes < 0:
+            raise ValueError(f"The minimum number of nodes of a capacity floor cannot be negative: {value}.")
+        start, end = fields[2].split('-', 1)
+        return cls(
+            min_nodes=min_nodes,
+            days=parse_days(fields[1]),
+            start=parse_time(start),
+            end=parse_time(end),
+            label=fields[3].strip() if len(fields) > 3 else None,
+        )
+
+    def is_active(self, at, lead_time=datetime.timedelta(0)):
+        """
+        :param datetime.datetime at: The local time.
+        :param datetime.timedelta lead_time: How long before its start the window counts as active.
+        :return bool: Whether the window is active.
+        """
+        for day in [at.date() - datetime.timedelta(days=1), at.date()]:
+            if day.weekday() not in self.days:
+                continue
+            start = datetime.datetime.combine(day, self.start)
+            end = datetime.datetime.combine(day + datetime.timedelta(days=1 if self.end <= self.start else 0), self.end)
+            if start - lead_time <= at < end:
+                return True
+        return False
+
+
+CapacityFloor.__new__.__defaults__ = (None,)
+
+
+class CapacitySchedule(object):
+    """Schedule of capacity floors, which get active ahead of their windows by the time it takes to boot a node.
+
+    The boot time is measured on the nodes switched on: the longest of the last ``BOOT_SAMPLES`` boots is the lead
+    time, so that the nodes are online by the start of the window. Until a boot has been measured, ``boot_time``
+    is used instead.
+    """
+    DEFAULT_BOOT_TIME = 3 * 60
+    BOOT_SAMPLES = 20
+
+    def __init__(self, floors, boot_time=DEFAULT_BOOT_TIME):
+        """
+        :param list(CapacityFloor) floors: The capacity floors.
+        :param float boot_time: How long it takes to boot a node until measured, in seconds.
+        """
+        self.floors = tuple(floors)
+        self.boot_time = datetime.timedelta(seconds=boot_time)
+        self.boot_durations = collections.deque(maxlen=self.BOOT_SAMPLES)
+
+    @property
+    def lead_time(self):
+        return max(self.boot_durations) if self.boot_durations else self.boot_time
+
+    def record_transitions(self, summary):
+        """Measures how long the nodes took to boot.
+
+        :param jam.libs.transitions.TransitionSummary summary: The transitions that are over.
+        """
+        self.boot_durations.extend(
+            result.duration for result in summary.succeeded.values() if result.action == TransitionAction.ON
+        )
+
+    def get_active_floors(self, at=None):
+        """
+        :param datetime.datetime at: The local time.
+        :return list(CapacityFloor): The floors whose window is active, or about to be.
+        """
+        at = datetime.datetime.now() if at is None else at
+        lead_time = self.lead_time
+        return [floor for floor in self.floors if floor.is_active(at, lead_time=lead_time)]
+
+    def get_pools(self, at=None):
+        """
+        :param datetime.datetime at: The local time.
+        :return list(LabelPool): The minimum number of nodes to keep online, as label pools.
+        """
+        return [LabelPool(label=floor.label, min_nodes=floor.min_nodes) for floor in self.get_active_floors(at)]
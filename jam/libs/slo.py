@@ -0,0 +1,96 @@
+import collections
+import logging
+import math
+import time
+
+from jam.libs.demand import get_required_label
+
+
+logger = logging.getLogger(__name__)
+
+
+def get_age(item, now):
+    """
+    :param dict item: The item of the queue.
+    :param float now: The current time, as a UNIX timestamp.
+    :return float: How long the item has been in the queue, in seconds, ``0`` if Jenkins does not tell.
+    """
+    in_queue_since = item.get('inQueueSince')
+    if in_queue_since is None:
+        return 0
+    # Jenkins gives milliseconds.
+    return max(now - in_queue_since / 1000, 0)
+
+
+def get_percentile(values, percentile):
+    """
+    :param list(float) values: The values.
+    :param float percentile: The percentile, between 0 and 100.
+    :return float: The nearest-rank percentile of the values, ``0`` if there is none.
+    """
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[max(math.ceil(percentile / 100 * len(values)) - 1, 0)]
+
+
+class WaitTimeSlo(object):
+    """Objective on the time the jobs wait in the queue, such as a 90th percentile under 60 seconds.
+
+    The percentile of the queue age is computed per label expression: the labels whose jobs wait the longest get extra
+    executors, proportionally to how close they are to the target. Below ``surge_threshold`` times the target, there
+    is no extra executor; once the target is reached, there is one extra executor per job waiting for the label.
+    """
+    DEFAULT_PERCENTILE = 90
+    DEFAULT_SURGE_THRESHOLD = 0.5
+
+    def __init__(self, target, percentile=DEFAULT_PERCENTILE, surge_threshold=DEFAULT_SURGE_THRESHOLD):
+        """
+        :param float target: How long the jobs should wait at most, in seconds.
+        :param float percentile: Which percentile of the wait time should stay under the target, between 0 and 100.
+        :param float surge_threshold: From which fraction of the target extra executors are requested, below 1.
+        """
+        if target <= 0 or not 0 < percentile <= 100 or not 0 <= surge_threshold < 1:
+            raise ValueError(f"Inconsistent wait time objective: p{percentile} under {target}s, "
+                             f"surging from {surge_threshold}.")
+        self.target = target
+        self.percentile = percentile
+        self.surge_threshold = surge_threshold
+
+    def get_wait_time(self, items, now=None):
+        """
+        :param list(dict) items: The items of the queue.
+        :param float now: The current time, as a UNIX timestamp.
+        :return float: The percentile of the queue age, in seconds.
+        """
+        now = time.time() if now is None else now
+        return get_percentile([get_age(item, now) for item in items], self.percentile)
+
+    def prioritize(self, items, now=None):
+        """
+        :param list(dict) items: The items of the queue.
+        :param float now: The current time, as a UNIX timestamp.
+        :return list(dict): The items, the ones that have been waiting the longest first.
+        """
+        now = time.time() if now is None else now
+        return sorted(items, key=lambda item: -get_age(item, now))
+
+    def get_surge(self, items, now=None):
+        """
+        :param list(dict) items: The items of the queue, waiting for an executor.
+        :param float now: The current time, as a UNIX timestamp.
+        :return list(str): The labels needing extra executors, once per executor, ``None`` for any node.
+        """
+        now = time.time() if now is None else now
+        items_by_label = collections.OrderedDict()
+        for item in self.prioritize(items, now):
+            items_by_label.setdefault(get_required_label(item), []).append(item)
+        surge = []
+        for label, label_items in items_by_label.items():
+            pressure = self.get_wait_time(label_items, now) / self.target
+            if pressure >= 1:
+                logger.warning("[%s] The p%s wait time for label %s is over %ss.",
+                               self.__class__.__name__, self.percentile, label or '<any>', self.target)
+            ratio = min(max(pressure - self.surge_threshold, 0) / (1 - self.surge_threshold), 1)
+            surge += [label] * math.ceil(ratio * len(label_items))
+        return surge
@@ -0,0 +1,233 @@
+import collections
+import concurrent.futures
+import datetime
+import functools
+import logging
+
+import enum
+
+from jam.libs.utils import Deadline, DeadlineExceeded
+
+
+logger = logging.getLogger(__name__)
+
+
+class TransitionAction(str, enum.Enum):
+    ON = 'on'
+    OFF = 'off'
+    # Switches the node off, suspending its instance whatever its power mode.
+    SUSPEND = 'suspend'
+    # Boots the node's instance and suspends it once booted, without bringing the agent online.
+    PREWARM = 'prewarm'
+
+
+class TransitionCancelled(Exception):
+    """A transition that the node decided not to go through, which is neither a success nor a failure."""
+
+
+TransitionResult = collections.namedtuple('TransitionResult', ['name', 'action', 'error', 'duration'])
+InFlightTransition = collections.namedtuple(
+    'InFlightTransition', ['name', 'action', 'future', 'started_at', 'deadline', 'task']
+)
+InFlightTransition.__new__.__defaults__ = (None, None)
+
+
+class TransitionSummary(collections.namedtuple('TransitionSummary', ['results'])):
+    """The outcome of a batch of transitions, one :class:`TransitionResult` per node."""
+    __slots__ = ()
+
+    @property
+    def succeeded(self):
+        return collections.OrderedDict((result.name, result) for result in self.results if result.error is None)
+
+    @property
+    def failed(self):
+        return collections.OrderedDict(
+            (result.name, result) for result in self.results
+            if result.error is not None and not isinstance(result.error, TransitionCancelled)
+        )
+
+    @property
+    def cancelled(self):
+        return collections.OrderedDict(
+            (result.name, result) for result in self.results if isinstance(result.error, TransitionCancelled)
+        )
+
+    def __str__(self):
+        description = (f"{len(self.succeeded)} succeeded ({', '.join(self.succeeded.keys())}), "
+                       f"{len(self.failed)} failed ({', '.join(self.failed.keys())})")
+        if self.cancelled:
+            description += f", {len(self.cancelled)} cancelled ({', '.join(self.cancelled.keys())})"
+        return description
+
+
+def perform_transition(node, action, deadline=None, **kwargs):
+    """Switches a node on or off, and reports how it went instead of raising.
+
+    :param jam.libs.core.Node node: The node to switch.
+    :param TransitionAction action: The transition to perform.
+    :param jam.libs.utils.Deadline deadline: How long the transition may take, from now on. Forever by default.
+    :param kwargs: Extra arguments of the transition.
+    :return TransitionResult: The result of the transition, whose error is a :class:`TransitionCancelled` if the node
+                              decided not to go through it.
+    """
+    action = TransitionAction(action)
+    started_at = datetime.datetime.now()
+    deadline = Deadline() if deadline is None else deadline
+    error = None
+    try:
+        # The time spent waiting for a worker does not count, but a cancellation in the meantime does.
+        deadline.start()
+        deadline.check(f"node {node.name} to start switching {action.value}")
+        getattr(node, action.value)(deadline=deadline, **kwargs)
+    except TransitionCancelled as err:
+        logger.info("[%s %s] Switching %s was cancelled: %s", node.__class__.__name__, node.name, action.value, err)
+        error = err
+    except Exception as err:
+        logger.exception("[%s %s] Could not switch %s.", node.__class__.__name__, node.name, action.value)
+        error = err
+    return TransitionResult(name=node.name, action=action, error=error, duration=datetime.datetime.now() - started_at)
+
+
+class TransitionPool(object):
+    """Runs node transitions in the background, with at most ``max_workers`` of them at the same time.
+
+    Submitting a transition returns immediately. The transition stays in flight until it is collected, once it is
+    over, so that the caller can account for it in the meantime.
+
+    Every transition gets a deadline of ``timeout`` seconds from when a worker picks it up, which it checks while it
+    waits. A transition still running ``WATCHDOG_GRACE`` seconds after its deadline, stuck where it does not check
+    it, gets cancelled by the watchdog and collected as failed. Its node is then abandoned rather than in flight, and
+    still counts as being switched until its worker is over: it does not get switched again meanwhile. Its worker is
+    replaced, and the transitions still waiting for one move to the new workers, so that stuck workers never hold
+    back the others.
+    """
+    DEFAULT_MAX_WORKERS = 4
+    DEFAULT_TIMEOUT = 15 * 60
+    WATCHDOG_GRACE = 60
+
+    def __init__(self, max_workers=None, timeout=DEFAULT_TIMEOUT):
+        """
+        :param int max_workers: How many transitions may run at the same time.
+        :param float timeout: How long a transition may take, in seconds, ``None`` for forever.
+        """
+        self.max_workers = self.DEFAULT_MAX_WORKERS if max_workers is None else max_workers
+        if self.max_workers < 1:
+            raise ValueError(f"At least one worker is needed (got {self.max_workers}).")
+        self.timeout = timeout
+        self.in_flight = collections.OrderedDict()
+        self.abandoned = collections.OrderedDict()
+        self.__executor = None
+
+    @property
+    def executor(self):
+        if self.__executor is None:
+            self.__executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers)
+        return self.__executor
+
+    @property
+    def switching(self):
+        """The transitions of every node being switched: the ones in flight, and the abandoned ones still running."""
+        return collections.OrderedDict(list(self.abandoned.items()) + list(self.in_flight.items()))
+
+    def submit(self, node, action, **kwargs):
+        """Starts a transition in the background, unless the node is already in flight.
+
+        :param jam.libs.core.Node node: The node to switch.
+        :param TransitionAction action: The transition to perform.
+        :param kwargs: Extra arguments of the transition.
+        :return InFlightTransition: The transition the node is going through.
+        """
+        action = TransitionAction(action)
+        switching = self.switching
+        if node.name in switching:
+            logger.warning("[%s] Node %s is already being switched %s.",
+                           self.__class__.__name__, node.name, switching[node.name].action.value)
+            return switching[node.name]
+        deadline = Deadline(self.timeout, started=False)
+        task = functools.partial(perform_transition, node, action, deadline=deadline, **kwargs)
+        self.in_flight[node.name] = InFlightTransition(
+            name=node.name,
+            action=action,
+            future=self.executor.submit(task),
+            started_at=datetime.datetime.now(),
+            deadline=deadline,
+            task=task,
+        )
+        return self.in_flight[node.name]
+
+    def collect(self, names=None):
+        """Forgets about the transitions that are over, and about the ones that the watchdog cancels.
+
+        :param list(str) names: Only collect the transitions of these nodes. All of them by default.
+        :return TransitionSummary: The result of every transition that was over.
+        """
+        for name in [name for name, transition in self.abandoned.items() if transition.future.done()]:
+            logger.info("[%s] The abandoned transition of node %s is finally over.", self.__class__.__name__, name)
+            del self.abandoned[name]
+        names = [name for name in (list(self.in_flight) if names is None else names) if name in self.in_flight]
+        results = []
+        for name in names:
+            transition = self.in_flight[name]
+            if transition.future.done():
+                results.append(self.in_flight.pop(name).future.result())
+            elif transition.deadline is not None and transition.deadline.overdue(self.WATCHDOG_GRACE):
+                results.append(self.cancel(name))
+        return TransitionSummary(results=tuple(results))
+
+    def cancel(self, name):
+        """Gives up on a transition: it does not run if it is still queued, or its worker stops at its next check of
+        the deadline.
+
+        :param str name: The name of the node.
+        :return TransitionResult: The result of the transition, as a failure.
+        """
+        transition = self.in_flight.pop(name)
+        transition.deadline.cancel()
+        if not transition.future.cancel():
+            self.abandoned[name] = transition
+            self.__replace_executor()
+        logger.error("[%s] Node %s is stuck switching %s since %s: giving up.",
+                     self.__class__.__name__, name, transition.action.value, transition.started_at)
+        return TransitionResult(
+            name=name,
+            action=transition.action,
+            error=DeadlineExceeded(f"Node {name} got stuck switching {transition.action.value}."),
+            duration=datetime.datetime.now() - transition.started_at,
+        )
+
+    def __replace_executor(self):
+        """Moves the transitions waiting for a worker to new workers, away from the one that is stuck."""
+        executor, self.__executor = self.__executor, None
+        for name, transition in list(self.in_flight.items()):
+            if transition.future.cancel():
+                self.in_flight[name] = transition._replace(future=self.executor.submit(transition.task))
+        # The stuck worker exits once its transition is over, the others right away.
+        executor.shutdown(wait=False)
+
+    def wait(self, names=None, timeout=None):
+        """Waits for transitions to be over, and collects them.
+
+        :param list(str) names: Only wait for the transitions of these nodes. All of them by default.
+        :param float timeout: How long to wait at most, in seconds. Forever by default.
+        :return TransitionSummary: The result of every transition that was over.
+        """
+        names = list(self.in_flight) if names is None else names
+        concurrent.futures.wait(
+            [self.in_flight[name].future for name in names if name in self.in_flight], timeout=timeout
+        )
+        return self.collect(names=names)
+
+    def run(self, nodes, action):
+        """Performs the same transition on every node, and waits for all of them to be over.
+
+        :param list(jam.libs.core.Node) nodes: The nodes to switch.
+        :param TransitionAction action: The transition to perform.
+        :return TransitionSummary: The result of every transition, in the same order as ``nodes``.
+        """
+        return self.wait(names=[self.submit(node, action).name for node in nodes])
+
+    def shutdown(self):
+        if self.__executor is not None:
+            self.__executor.shutdown()
+            self.__executor = None
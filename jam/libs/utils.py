@@ -1,3 +1,9 @@
+import os
+import tempfile
+import threading
+import time
+
+
 def merge_dicts(*dict_args):
     """ Merges any number of ``dict``s.
 
@@ -11,3 +17,92 @@ def merge_dicts(*dict_args):
     for dictionary in dict_args:
         result.update(dictionary)
     return result
+
+
+def write_atomically(path, content):
+    """Writes a file through a temporary file in the same directory, so that readers never see a partial content.
+
+    :param str path: Path to the file, whose directory gets created if needed.
+    :param str content: The content of the file.
+    :raise OSError: The file could not be written.
+    """
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    file_descriptor, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(file_descriptor, 'w') as tmp_file:
+            tmp_file.write(content)
+        os.replace(tmp_path, path)
+    except OSError:
+        os.remove(tmp_path)
+        raise
+
+
+class DeadlineExceeded(Exception):
+    """An operation took longer than its deadline, or got cancelled."""
+
+
+class Deadline(object):
+    """How long an operation may take at most, shared by every wait it goes through.
+
+    A deadline can also be cancelled from another thread: the operation then gives up at its next check. A deadline
+    that is not started yet never expires, until it gets cancelled.
+    """
+
+    def __init__(self, timeout=None, started=True):
+        """
+        :param float timeout: How long the operation may take, in seconds. Forever by default.
+        :param bool started: Whether the clock starts now, rather than with :meth:`start`.
+        """
+        self.timeout = timeout
+        self.started_at = None
+        self.expires_at = None
+        self.__cancelled = threading.Event()
+        if started:
+            self.start()
+
+    def start(self):
+        """Starts the clock, once the operation actually begins."""
+        self.started_at = time.monotonic()
+        self.expires_at = None if self.timeout is None else self.started_at + self.timeout
+
+    @property
+    def remaining(self):
+        """How long is left, in seconds, ``None`` without a timeout."""
+        return None if self.expires_at is None else max(self.expires_at - time.monotonic(), 0)
+
+    @property
+    def cancelled(self):
+        return self.__cancelled.is_set()
+
+    @property
+    def expired(self):
+        return self.cancelled or self.remaining == 0
+
+    def overdue(self, grace):
+        """
+        :param float grace: How long the operation may run after the deadline, in seconds.
+        :return bool: Whether the operation has been running for longer than its deadline and the grace period.
+        """
+        return self.expires_at is not None and time.monotonic() > self.expires_at + grace
+
+    def cancel(self):
+        self.__cancelled.set()
+
+    def check(self, description):
+        """
+        :param str description: What the operation is waiting for, to report it.
+        :raise DeadlineExceeded: The deadline has expired, or has been cancelled.
+        """
+        if self.cancelled:
+            raise DeadlineExceeded(f"Cancelled while waiting for {description}.")
+        if self.remaining == 0:
+            raise DeadlineExceeded(f"Still waiting for {description} after {self.timeout}s.")
+
+    def get_sleep(self, seconds):
+        """
+        :param float seconds: How long the operation would like to sleep.
+        :return float: How long it may sleep without overshooting the deadline.
+        """
+        remaining = self.remaining
+        return seconds if remaining is None else min(seconds, remaining)
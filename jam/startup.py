@@ -1,7 +1,16 @@
 import argparse
 import time
 
+import jam.libs.affinity
+import jam.libs.compute_engine
 import jam.libs.core as core
+import jam.libs.forecast
+import jam.libs.policies
+import jam.libs.pools
+import jam.libs.readiness
+import jam.libs.schedule
+import jam.libs.slo
+import jam.libs.transitions
 
 
 LOOP_TIME = 5
@@ -16,6 +25,17 @@ def parse_args():
     gce_group.add_argument('-z', '--gce-zone', action='store', type=str, default='europe-west1-b', dest='gce_zone',
                            help="Google Compute Engine zone (see https://cloud.google.com/compute/docs/regions-zones/ )"
                            )
+    gce_group.add_argument('--instance-fields', action='store', type=str, dest='instance_fields',
+                           default=jam.libs.compute_engine.ComputeEngine.DEFAULT_INSTANCE_FIELDS,
+                           help="Fields of the instances to retrieve (empty to retrieve them all)")
+    gce_group.add_argument('--instance-filter', action='store', type=str, dest='instance_filter', default=None,
+                           help="Filter of the instances to list (defaults to the names of the nodes)")
+    gce_group.add_argument('--discovery-cache-dir', action='store', type=str, dest='discovery_cache_dir',
+                           default=jam.libs.compute_engine.DiscoveryCache.DEFAULT_DIRECTORY,
+                           help="Where to cache the API discovery document (empty not to cache it)")
+    gce_group.add_argument('--discovery-cache-ttl', action='store', type=int, dest='discovery_cache_ttl',
+                           default=jam.libs.compute_engine.DiscoveryCache.DEFAULT_TTL,
+                           help="How long the cached API discovery document is valid, in seconds")
 
     j_group = parser.add_argument_group(title="Jenkins", description="Jenkins-related arguments")
     j_group.add_argument('-l', '--jenkins-url', action='store', required=True, type=str, dest='jenkins_url',
@@ -25,6 +45,88 @@ def parse_args():
     j_group.add_argument('-t', '--jenkins-api-token', action='store', type=str,
                          help="The Jenkins API Token")
 
+    s_group = parser.add_argument_group(title="Scaling", description="Scaling-related arguments")
+    s_group.add_argument('--max-parallel-transitions', action='store', type=int, dest='max_parallel_transitions',
+                         default=jam.libs.transitions.TransitionPool.DEFAULT_MAX_WORKERS,
+                         help="Maximum number of nodes being switched on or off at the same time")
+    s_group.add_argument('--suspend-node', action='append', type=str, dest='suspended_nodes', default=[],
+                         metavar='NODE', help="Suspend this node instead of stopping it (can be repeated)")
+    s_group.add_argument('--warm-idle-nodes', action='store', type=int, dest='warm_idle_nodes', default=0,
+                         help="Number of nodes to keep online and idle beyond the jobs in the queue")
+    s_group.add_argument('--warm-suspended-nodes', action='store', type=int, dest='warm_suspended_nodes', default=0,
+                         help="Number of nodes to keep suspended, ready to be resumed")
+    s_group.add_argument('--label-pool', action='append', type=jam.libs.pools.LabelPool.parse, dest='label_pools',
+                         default=[], metavar='LABEL[:MIN[:MAX]]',
+                         help="Keep between MIN and MAX nodes with this label online (can be repeated)")
+    s_group.add_argument('--min-idle-time', action='store', type=float, dest='min_idle_time',
+                         default=jam.libs.policies.ScaleDownPolicy.DEFAULT_MIN_IDLE_TIME,
+                         help="How long a node has to be idle before being switched off, in seconds")
+    s_group.add_argument('--scale-up-cooldown', action='store', type=float, dest='scale_up_cooldown',
+                         default=jam.libs.policies.ScaleDownPolicy.DEFAULT_COOLDOWN,
+                         help="How long to wait after switching nodes on before switching any off, in seconds")
+    s_group.add_argument('--min-run-time', action='store', type=float, dest='min_run_time',
+                         default=jam.libs.policies.ScaleDownPolicy.DEFAULT_MIN_RUN_TIME,
+                         help="How long an instance has to run before being switched off, in seconds")
+    s_group.add_argument('--forecast-model', action='store', type=str, dest='forecast_model', default=None,
+                         choices=sorted(jam.libs.forecast.MODELS),
+                         help="Model of the queue arrivals, to switch nodes on before the jobs arrive (no forecast by "
+                              "default)")
+    s_group.add_argument('--forecast-horizon', action='store', type=float, dest='forecast_horizon',
+                         default=jam.libs.forecast.QueueForecaster.DEFAULT_HORIZON,
+                         help="How far to forecast the queue arrivals, in seconds (a few boot durations)")
+    s_group.add_argument('--forecast-state', action='store', type=str, dest='forecast_state',
+                         default=jam.libs.forecast.QueueForecaster.DEFAULT_STATE_PATH,
+                         help="Where to save the state of the forecast model (empty not to save it)")
+    s_group.add_argument('--capacity-floor', action='append', type=jam.libs.schedule.CapacityFloor.parse,
+                         dest='capacity_floors', default=[], metavar="'MIN DAYS HH:MM-HH:MM [LABEL]'",
+                         help="Keep at least MIN nodes (with LABEL) online during this window, local time, such as "
+                              "'6 mon-fri 08:45-18:00' (can be repeated)")
+    s_group.add_argument('--boot-time', action='store', type=float, dest='boot_time',
+                         default=jam.libs.schedule.CapacitySchedule.DEFAULT_BOOT_TIME,
+                         help="How long a node takes to boot until it is measured, in seconds: the capacity floors "
+                              "get active that long before their windows")
+    s_group.add_argument('--wait-time-target', action='store', type=float, dest='wait_time_target', default=None,
+                         help="How long the jobs should wait in the queue at most, in seconds: the labels getting "
+                              "close to it get extra nodes (no objective by default)")
+    s_group.add_argument('--wait-time-percentile', action='store', type=float, dest='wait_time_percentile',
+                         default=jam.libs.slo.WaitTimeSlo.DEFAULT_PERCENTILE,
+                         help="Which percentile of the wait time should stay under the target")
+    s_group.add_argument('--selection-policy', action='store', type=str, dest='selection_policy',
+                         default=jam.libs.policies.BootTimeSelectionPolicy.name,
+                         choices=sorted(jam.libs.policies.SELECTION_POLICIES),
+                         help="How to choose the nodes to switch on or off")
+    s_group.add_argument('--node-cost', action='append', type=jam.libs.policies.BootTimeSelectionPolicy.parse_cost,
+                         dest='node_costs', default=[], metavar='NODE=COST',
+                         help="How much a node costs to run, relatively to the others (1 by default): the most "
+                              "expensive nodes get switched off first (can be repeated)")
+    s_group.add_argument('--workspace-affinity', action='store_true', dest='workspace_affinity', default=False,
+                         help="Switch on the nodes that recently built the queued jobs first, and keep the last one "
+                              "of every active job online (jobs building on a single agent, such as freestyle "
+                              "jobs, down to 3 levels of folders: pipeline builds do not tell their agent)")
+    s_group.add_argument('--affinity-refresh-interval', action='store', type=float, dest='affinity_refresh_interval',
+                         default=jam.libs.affinity.AffinityIndex.DEFAULT_REFRESH_INTERVAL,
+                         help="How often to read the build history, in seconds")
+    s_group.add_argument('--affinity-active-period', action='store', type=float, dest='affinity_active_period',
+                         default=jam.libs.affinity.AffinityIndex.DEFAULT_ACTIVE_PERIOD,
+                         help="How long after its last build a job keeps a warm node online, in seconds")
+    s_group.add_argument('--boot-marker', action='store', type=str, dest='boot_marker',
+                         default=jam.libs.readiness.ReadinessDetector.DEFAULT_MARKER,
+                         help="Regular expression matching the serial console line written once an instance has "
+                              "booted, to launch its agent right away (empty to only poll the agent)")
+    s_group.add_argument('--boot-marker-timeout', action='store', type=float, dest='boot_marker_timeout',
+                         default=jam.libs.readiness.ReadinessDetector.DEFAULT_BOOT_TIMEOUT,
+                         help="How long to tail the serial console of a booting instance at most, in seconds")
+    s_group.add_argument('--transition-timeout', action='store', type=float, dest='transition_timeout',
+                         default=jam.libs.transitions.TransitionPool.DEFAULT_TIMEOUT,
+                         help="How long switching a node on or off may take before giving up, in seconds "
+                              "(0 to wait forever)")
+    s_group.add_argument('--quarantine-failures', action='store', type=int, dest='quarantine_failures',
+                         default=jam.libs.policies.Quarantine.DEFAULT_MAX_FAILURES,
+                         help="How many failed transitions in a row put a node in quarantine")
+    s_group.add_argument('--quarantine-period', action='store', type=float, dest='quarantine_period',
+                         default=jam.libs.policies.Quarantine.DEFAULT_PERIOD,
+                         help="How long a node stays in quarantine, neither switched on nor counted on, in seconds")
+
     parser.add_argument('nodes', action='store', metavar='NODE_LIST', nargs='+',
                         help="Names of the nodes to use")
 
@@ -37,6 +139,64 @@ def keep_running():
     return True  # pragma: no cover
 
 
+def build_discovery_cache(args):
+    if not args.discovery_cache_dir:
+        return None
+    return jam.libs.compute_engine.DiscoveryCache(directory=args.discovery_cache_dir, ttl=args.discovery_cache_ttl)
+
+
+def build_scale_down_policy(args):
+    return jam.libs.policies.ScaleDownPolicy(
+        min_idle_time=args.min_idle_time, cooldown=args.scale_up_cooldown, min_run_time=args.min_run_time,
+    )
+
+
+def build_forecaster(args):
+    if args.forecast_model is None:
+        return None
+    return jam.libs.forecast.QueueForecaster(
+        model=jam.libs.forecast.MODELS[args.forecast_model](),
+        horizon=args.forecast_horizon,
+        state_path=args.forecast_state or None,
+    )
+
+
+def build_schedule(args):
+    if not args.capacity_floors:
+        return None
+    return jam.libs.schedule.CapacitySchedule(floors=args.capacity_floors, boot_time=args.boot_time)
+
+
+def build_slo(args):
+    if args.wait_time_target is None:
+        return None
+    return jam.libs.slo.WaitTimeSlo(target=args.wait_time_target, percentile=args.wait_time_percentile)
+
+
+def build_selection_policy(args):
+    if args.selection_policy == jam.libs.policies.BootTimeSelectionPolicy.name:
+        return jam.libs.policies.BootTimeSelectionPolicy(costs=dict(args.node_costs))
+    return jam.libs.policies.SELECTION_POLICIES[args.selection_policy]()
+
+
+def build_affinity(args):
+    if not args.workspace_affinity:
+        return None
+    return jam.libs.affinity.AffinityIndex(
+        refresh_interval=args.affinity_refresh_interval, active_period=args.affinity_active_period,
+    )
+
+
+def build_readiness(args):
+    if not args.boot_marker:
+        return None
+    return jam.libs.readiness.ReadinessDetector(marker=args.boot_marker, boot_timeout=args.boot_marker_timeout)
+
+
+def build_quarantine(args):
+    return jam.libs.policies.Quarantine(max_failures=args.quarantine_failures, period=args.quarantine_period)
+
+
 def monitor():
     args = parse_args()
     jam = core.Jam(
@@ -46,6 +206,22 @@ def monitor():
         project=args.project,
         gce_zone=args.gce_zone,
         usable_nodes=args.nodes,
+        max_parallel_transitions=args.max_parallel_transitions,
+        suspended_nodes=args.suspended_nodes,
+        warm_pool=core.WarmPool(idle=args.warm_idle_nodes, suspended=args.warm_suspended_nodes),
+        scale_down_policy=build_scale_down_policy(args),
+        label_pools=args.label_pools,
+        forecaster=build_forecaster(args),
+        schedule=build_schedule(args),
+        slo=build_slo(args),
+        selection_policy=build_selection_policy(args),
+        affinity=build_affinity(args),
+        readiness=build_readiness(args),
+        transition_timeout=args.transition_timeout or None,
+        quarantine=build_quarantine(args),
+        gce_instance_fields=args.instance_fields or None,
+        gce_instance_filter=args.instance_filter,
+        gce_discovery_cache=build_discovery_cache(args),
     )
 
     while keep_running():
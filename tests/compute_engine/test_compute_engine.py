@@ -1,8 +1,14 @@
+import datetime
+import json
+import urllib.parse
+
+import mock
 import pytest
 from googleapiclient.errors import HttpError
 
 import jam.libs.compute_engine
 from jam.libs.compute_engine import InstanceStatus
+from jam.libs.utils import Deadline, DeadlineExceeded
 import tests.helpers.helpers_compute_engine
 
 
@@ -17,6 +23,47 @@ def test_compute_engine_wait_for_operation(compute_engine, http_sequence_factory
             compute_engine.wait_for_operation({'name': 'invalid_id'})
 
 
+def test_compute_engine_wait_for_operation_long_poll(compute_engine, http_sequence_factory):
+    http = http_sequence_factory([
+        ({'status': '200'}, tests.helpers.helpers_compute_engine.get_discovery(
+            tests.helpers.helpers_compute_engine.ExtraMethod(
+                resource='zoneOperations', name='wait', like='get',
+                path='{project}/zones/{zone}/operations/{operation}/wait',
+            ),
+        )),
+        ({'status': '200'}, 'file:tests/http/compute.operations.get-start-done.json'),
+    ])
+    compute_engine.http = http
+    with mock.patch.object(http, 'request', wraps=http.request) as mocked_request, \
+            mock.patch('jam.libs.compute_engine.time.sleep') as mocked_sleep:
+        result = jam.libs.compute_engine.wait_for_operation(
+            compute=compute_engine.compute, project=compute_engine.project, gce_zone=compute_engine.gce_zone,
+            operation={'name': 'operation-1521135498939-5678cd8d81ab8-8f40d8a2-b9ab6e3d'},
+            http_factory=lambda: http,
+        )
+    assert result['status'] == 'DONE'
+    mocked_sleep.assert_not_called()
+    uri, method = mocked_request.call_args[0][:2]
+    assert uri.split('?')[0].endswith('/wait')
+    assert method == 'POST'
+
+
+def test_compute_engine_wait_for_operation_backoff(compute_engine, http_sequence_factory):
+    http = http_sequence_factory([
+        ({'status': '200'}, 'file:tests/http/compute-discovery.json'),
+        ({'status': '200'}, 'file:tests/http/compute.operations.get-start-running.json'),
+        ({'status': '200'}, 'file:tests/http/compute.operations.get-start-running.json'),
+        ({'status': '200'}, 'file:tests/http/compute.operations.get-start-running.json'),
+        ({'status': '200'}, 'file:tests/http/compute.operations.get-start-done.json'),
+    ])
+    compute_engine.http = http
+    with mock.patch('jam.libs.compute_engine.time.sleep') as mocked_sleep, \
+            mock.patch('jam.libs.compute_engine.TIME_SLEEP_WAIT_FOR_OPERATION', 1), \
+            mock.patch('jam.libs.compute_engine.TIME_SLEEP_WAIT_FOR_OPERATION_MAX', 3):
+        compute_engine.wait_for_operation({'name': 'operation-1521135498939-5678cd8d81ab8-8f40d8a2-b9ab6e3d'})
+    assert [call[0][0] for call in mocked_sleep.call_args_list] == [1, 1.5, 2.25]
+
+
 def test_compute_engine_list_all_instances(compute_engine, http_sequence_factory):
     http = http_sequence_factory([
         ({'status': '200'}, 'file:tests/http/compute-discovery.json'),
@@ -27,6 +74,110 @@ def test_compute_engine_list_all_instances(compute_engine, http_sequence_factory
         assert {'build1', 'master'} <= set(compute_engine.instances.keys())
 
 
+def test_compute_engine_list_instances_pages(compute_engine, http_sequence_factory):
+    http = http_sequence_factory([
+        ({'status': '200'}, 'file:tests/http/compute-discovery.json'),
+        ({'status': '200'}, tests.helpers.helpers_compute_engine.get_instance_list(
+            ['tests/http/compute.instances.get.build1-running.json'], next_page_token='page-2',
+        )),
+        ({'status': '200'}, tests.helpers.helpers_compute_engine.get_instance_list(
+            ['tests/http/compute.instances.get.build2-terminated.json'],
+        )),
+    ])
+    compute_engine.http = http
+    with mock.patch.object(http, 'request', wraps=http.request) as mocked_request:
+        instances = compute_engine.list_instances()
+    assert list(instances.keys()) == ['build1', 'build2']
+    assert instances['build2'].status == InstanceStatus.TERMINATED
+    query = urllib.parse.parse_qs(urllib.parse.urlparse(mocked_request.call_args[0][0]).query)
+    assert query['pageToken'] == ['page-2']
+
+
+def test_compute_engine_iter_instances_is_lazy(compute_engine, http_sequence_factory):
+    http = http_sequence_factory([
+        ({'status': '200'}, 'file:tests/http/compute-discovery.json'),
+        ({'status': '200'}, tests.helpers.helpers_compute_engine.get_instance_list(
+            ['tests/http/compute.instances.get.build1-running.json'], next_page_token='page-2',
+        )),
+    ])
+    compute_engine.http = http
+    instances = compute_engine.iter_instances()
+    assert next(instances).name == 'build1'
+    instances.close()
+
+
+def test_compute_engine_list_instances_only_refreshes_known_instances(compute_engine, http_sequence_factory):
+    http = http_sequence_factory([
+        ({'status': '200'}, 'file:tests/http/compute-discovery.json'),
+        ({'status': '200'}, tests.helpers.helpers_compute_engine.get_instance_list([
+            'tests/http/compute.instances.get.build1-running.json',
+            'tests/http/compute.instances.get.build2-terminated.json',
+        ])),
+    ])
+    compute_engine.http = http
+    build1 = compute_engine.get_instance('build1')
+    instances = compute_engine.list_instances()
+    assert instances['build1'] is build1
+    assert build1.info is not None
+    assert compute_engine.get_instance('build2') is not instances['build2']
+
+
+def test_compute_engine_list_instances_empty_zone(compute_engine, http_sequence_factory):
+    http = http_sequence_factory([
+        ({'status': '200'}, 'file:tests/http/compute-discovery.json'),
+        ({'status': '200'}, tests.helpers.helpers_compute_engine.get_instance_list([])),
+    ])
+    compute_engine.http = http
+    assert compute_engine.list_instances() == {}
+
+
+def test_compute_engine_list_instances_partial_and_filtered(compute_engine, http_sequence_factory):
+    http = http_sequence_factory([
+        ({'status': '200'}, 'file:tests/http/compute-discovery.json'),
+        ({'status': '200'}, 'file:tests/http/compute.instances.list.json')],
+    )
+    compute_engine.http = http
+    with mock.patch.object(http, 'request', wraps=http.request) as mocked_request:
+        compute_engine.list_instances(
+            instance_filter=jam.libs.compute_engine.build_name_filter(['build1', 'build2'])
+        )
+    query = urllib.parse.parse_qs(urllib.parse.urlparse(mocked_request.call_args[0][0]).query)
+    assert query['fields'] == ['items(name,status,selfLink,lastStartTimestamp),nextPageToken']
+    assert query['filter'] == ['(name = "build1") OR (name = "build2")']
+
+
+def test_compute_engine_list_instances_full(http_sequence_factory):
+    compute_engine = jam.libs.compute_engine.ComputeEngine(
+        project='jam-project', gce_zone='europe-west1-b', instance_fields=None,
+    )
+    http = http_sequence_factory([
+        ({'status': '200'}, 'file:tests/http/compute-discovery.json'),
+        ({'status': '200'}, 'file:tests/http/compute.instances.list.json')],
+    )
+    compute_engine.http = http
+    with mock.patch.object(http, 'request', wraps=http.request) as mocked_request:
+        compute_engine.list_instances()
+    query = urllib.parse.parse_qs(urllib.parse.urlparse(mocked_request.call_args[0][0]).query)
+    assert 'fields' not in query
+    assert 'filter' not in query
+
+
+def test_build_name_filter_without_names():
+    assert jam.libs.compute_engine.build_name_filter([]) is None
+
+
+def test_compute_engine_get_instance_partial(compute_engine, http_sequence_factory):
+    http = http_sequence_factory([
+        ({'status': '200'}, 'file:tests/http/compute-discovery.json'),
+        ({'status': '200'}, 'file:tests/http/compute.instances.get.build1-running.json'),
+    ])
+    compute_engine.http = http
+    with mock.patch.object(http, 'request', wraps=http.request) as mocked_request:
+        compute_engine.get_instance('build1').refresh()
+    query = urllib.parse.parse_qs(urllib.parse.urlparse(mocked_request.call_args[0][0]).query)
+    assert query['fields'] == ['name,status,selfLink,lastStartTimestamp']
+
+
 def test_compute_engine_get_instance_exists(compute_engine, http_sequence_factory):
     http = http_sequence_factory([
         ({'status': '200'}, 'file:tests/http/compute-discovery.json'),
@@ -70,6 +221,18 @@ def test_compute_engine_wait_for_status(compute_engine, http_sequence_factory):
         assert instance.status is InstanceStatus.RUNNING
 
 
+def test_compute_engine_wait_for_status_deadline(compute_engine, http_sequence_factory):
+    http = http_sequence_factory([
+        ({'status': '200'}, 'file:tests/http/compute-discovery.json'),
+        ({'status': '200'}, 'file:tests/http/compute.instances.get.build1-provisioning.json'),
+    ])
+    compute_engine.http = http
+    with tests.helpers.helpers_compute_engine.no_pause():
+        instance = compute_engine.get_instance('build1')
+        with pytest.raises(DeadlineExceeded, match='instance build1 to be RUNNING'):
+            instance.wait_for_status(InstanceStatus.RUNNING, deadline=Deadline(0))
+
+
 def test_compute_engine_start_instance(compute_engine, http_sequence_factory):
     http = http_sequence_factory([
         ({'status': '200'}, 'file:tests/http/compute-discovery.json'),
@@ -107,6 +270,114 @@ def test_compute_engine_stop_instance(compute_engine, http_sequence_factory):
         assert instance.status is InstanceStatus.TERMINATED
 
 
+def test_compute_engine_stop_instance_without_waiting(compute_engine, http_sequence_factory):
+    http = http_sequence_factory([
+        ({'status': '200'}, 'file:tests/http/compute-discovery.json'),
+        ({'status': '200'}, 'file:tests/http/compute.instances.stop.build1.json'),
+    ])
+    compute_engine.http = http
+    with mock.patch.object(http, 'request', wraps=http.request) as mocked_request:
+        compute_engine.get_instance('build1').stop(wait=False)
+    assert [urllib.parse.urlparse(call[0][0]).path.rsplit('/', 1)[-1] for call in mocked_request.call_args_list][-1:] \
+        == ['stop']
+
+
+def test_compute_engine_suspend_instance(compute_engine, http_sequence_factory):
+    http = http_sequence_factory([
+        ({'status': '200'}, tests.helpers.helpers_compute_engine.get_discovery(
+            tests.helpers.helpers_compute_engine.SUSPEND,
+        )),
+        ({'status': '200'}, 'file:tests/http/compute.instances.get.build1-running.json'),
+        ({'status': '200'}, 'file:tests/http/compute.instances.stop.build1.json'),
+        ({'status': '200'}, 'file:tests/http/compute.operations.get-stop-done.json'),
+        ({'status': '200'}, tests.helpers.helpers_compute_engine.get_instance_with_status(
+            'tests/http/compute.instances.get.build1-terminated.json', 'SUSPENDED',
+        )),
+    ])
+    compute_engine.http = http
+    with tests.helpers.helpers_compute_engine.no_pause(), \
+            mock.patch.object(http, 'request', wraps=http.request) as mocked_request:
+        instance = compute_engine.get_instance('build1')
+        assert instance.status is InstanceStatus.RUNNING
+        instance.suspend()
+        assert any(call[0][0].split('?')[0].endswith('/instances/build1/suspend')
+                   for call in mocked_request.call_args_list)
+        tests.helpers.helpers_compute_engine.make_info_instantly_stale(instance)
+        assert instance.status is InstanceStatus.SUSPENDED
+        assert instance.last_known_status is InstanceStatus.SUSPENDED
+
+
+def test_compute_engine_resume_many(compute_engine, http_sequence_factory):
+    http = http_sequence_factory([
+        ({'status': '200'}, tests.helpers.helpers_compute_engine.get_discovery(
+            tests.helpers.helpers_compute_engine.RESUME,
+        )),
+        tests.helpers.helpers_compute_engine.get_batch_response([
+            ('build1', 200, 'tests/http/compute.instances.start.build1.json'),
+        ]),
+    ])
+    compute_engine.http = http
+    with mock.patch.object(http, 'request', wraps=http.request) as mocked_request:
+        results = compute_engine.resume_many([compute_engine.get_instance('build1')], wait=False)
+    assert results['build1'].error is None
+    assert '/instances/build1/resume' in mocked_request.call_args[1]['body']
+
+
+def test_compute_engine_refresh_many(compute_engine, http_sequence_factory):
+    http = http_sequence_factory([
+        ({'status': '200'}, 'file:tests/http/compute-discovery.json'),
+        tests.helpers.helpers_compute_engine.get_batch_response([
+            ('build1', 200, 'tests/http/compute.instances.get.build1-running.json'),
+            ('nonexistentnode', 404, 'tests/http/compute.instances.get.nonexistentnode.json'),
+            ('build2', 200, 'tests/http/compute.instances.get.build2-terminated.json'),
+        ]),
+    ])
+    compute_engine.http = http
+    instances = [compute_engine.get_instance(name) for name in ['build1', 'nonexistentnode', 'build2']]
+    with mock.patch.object(http, 'request', wraps=http.request) as mocked_request:
+        results = compute_engine.refresh_many(instances)
+    assert mocked_request.call_count == 1
+    assert list(results) == ['build1', 'nonexistentnode', 'build2']
+    assert results['build1'].error is None
+    assert isinstance(results['nonexistentnode'].error, jam.libs.compute_engine.InstanceNotFound)
+    assert results['build2'].error is None
+    assert instances[0].status is InstanceStatus.RUNNING
+    assert instances[1].info is None
+    assert instances[2].status is InstanceStatus.TERMINATED
+
+
+def test_compute_engine_start_many(compute_engine, http_sequence_factory):
+    http = http_sequence_factory([
+        ({'status': '200'}, 'file:tests/http/compute-discovery.json'),
+        tests.helpers.helpers_compute_engine.get_batch_response([
+            ('build1', 200, 'tests/http/compute.instances.start.build1.json'),
+            ('nonexistentnode', 404, 'tests/http/compute.instances.get.nonexistentnode.json'),
+        ]),
+        ({'status': '200'}, 'file:tests/http/compute.operations.get-start-running.json'),
+        ({'status': '200'}, 'file:tests/http/compute.operations.get-start-done.json'),
+    ])
+    compute_engine.http = http
+    instances = [compute_engine.get_instance(name) for name in ['build1', 'nonexistentnode']]
+    with tests.helpers.helpers_compute_engine.no_pause():
+        results = compute_engine.start_many(instances)
+    assert results['build1'].error is None
+    assert results['build1'].response['status'] == 'DONE'
+    assert isinstance(results['nonexistentnode'].error, jam.libs.compute_engine.InstanceNotFound)
+
+
+def test_compute_engine_stop_many_without_waiting(compute_engine, http_sequence_factory):
+    http = http_sequence_factory([
+        ({'status': '200'}, 'file:tests/http/compute-discovery.json'),
+        tests.helpers.helpers_compute_engine.get_batch_response([
+            ('build1', 200, 'tests/http/compute.instances.stop.build1.json'),
+        ]),
+    ])
+    compute_engine.http = http
+    results = compute_engine.stop_many([compute_engine.get_instance('build1')], wait=False)
+    assert results['build1'].error is None
+    assert results['build1'].response['operationType'] == 'stop'
+
+
 @pytest.mark.parametrize(['status', 'expected_statuses'], [
     pytest.param(
         InstanceStatus.RUNNING,
@@ -153,4 +424,44 @@ def test_format_status(status, expected_statuses):
     assert jam.libs.compute_engine.ComputeEngineInstance.format_status(status) == expected_statuses
 
 
+def test_serial_console_is_tailed(compute_engine, http_sequence_factory):
+    http = http_sequence_factory([
+        ({'status': '200'}, 'file:tests/http/compute-discovery.json'),
+        ({'status': '200'}, json.dumps({'kind': 'compute#serialPortOutput', 'contents': 'Booting\nStartup fin',
+                                        'start': '0', 'next': '20'})),
+        ({'status': '200'}, json.dumps({'kind': 'compute#serialPortOutput', 'contents': 'ished in 12s\n',
+                                        'start': '20', 'next': '33'})),
+    ])
+    compute_engine.http = http
+    console = jam.libs.compute_engine.SerialConsole(compute_engine.get_instance('build1'))
+    with mock.patch.object(http, 'request', wraps=http.request) as mocked_request:
+        assert console.read_lines() == ['Booting', 'Startup fin']
+        assert console.read_lines() == ['Startup finished in 12s', '']
+    queries = [urllib.parse.parse_qs(urllib.parse.urlparse(call[0][0]).query) for call in mocked_request.call_args_list]
+    assert [query.get('start') for query in queries] == [None, ['20']]
+    assert console.next_start == '33'
+
+
+def test_serial_console_is_forbidden(compute_engine, http_sequence_factory):
+    http = http_sequence_factory([
+        ({'status': '200'}, 'file:tests/http/compute-discovery.json'),
+        ({'status': '403'}, json.dumps({'error': {'code': 403, 'errors': [{
+            'domain': 'global', 'reason': 'forbidden',
+            'message': "Required 'compute.instances.getSerialPortOutput' permission"}]}})),
+    ])
+    compute_engine.http = http
+    console = jam.libs.compute_engine.SerialConsole(compute_engine.get_instance('build1'))
+    with tests.helpers.helpers_compute_engine.no_pause():
+        with pytest.raises(jam.libs.compute_engine.PermissionDenied):
+            console.read_lines()
+
+
 # TODO: Add tests for when things are failing
+
+
+@pytest.mark.parametrize(['timestamp', 'expected'], [
+    pytest.param('2018-02-09T09:24:41.627-08:00', datetime.datetime(2018, 2, 9, 17, 24, 41, 627000), id='offset'),
+    pytest.param('2018-02-09T17:24:41Z', datetime.datetime(2018, 2, 9, 17, 24, 41), id='utc'),
+])
+def test_parse_timestamp(timestamp, expected):
+    assert jam.libs.compute_engine.parse_timestamp(timestamp) == expected.replace(tzinfo=datetime.timezone.utc)
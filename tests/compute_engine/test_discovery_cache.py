@@ -0,0 +1,54 @@
+import os
+
+import jam.libs.compute_engine
+
+
+URL = 'https://www.googleapis.com/discovery/v1/apis/compute/v1/rest'
+
+
+def test_discovery_cache_miss(tmpdir):
+    cache = jam.libs.compute_engine.DiscoveryCache(directory=str(tmpdir.join('discovery')))
+    assert cache.get(URL) is None
+
+
+def test_discovery_cache_hit(tmpdir):
+    cache = jam.libs.compute_engine.DiscoveryCache(directory=str(tmpdir.join('discovery')))
+    cache.set(URL, b'{"kind": "discovery#restDescription"}')
+    assert cache.get(URL) == '{"kind": "discovery#restDescription"}'
+    assert jam.libs.compute_engine.DiscoveryCache(directory=str(tmpdir.join('discovery'))).get(URL) is not None
+
+
+def test_discovery_cache_expired(tmpdir):
+    cache = jam.libs.compute_engine.DiscoveryCache(directory=str(tmpdir), ttl=60)
+    cache.set(URL, '{}')
+    os.utime(cache.get_path(URL), (0, 0))
+    assert cache.get(URL) is None
+
+
+def test_discovery_cache_per_version(tmpdir, monkeypatch):
+    cache = jam.libs.compute_engine.DiscoveryCache(directory=str(tmpdir))
+    cache.set(URL, '{}')
+    monkeypatch.setattr(jam.libs.compute_engine.googleapiclient, '__version__', '0.0.0')
+    assert cache.get(URL) is None
+
+
+def test_discovery_cache_not_writable(tmpdir):
+    tmpdir.join('discovery').write('not a directory')
+    cache = jam.libs.compute_engine.DiscoveryCache(directory=str(tmpdir.join('discovery')))
+    cache.set(URL, '{}')
+    assert cache.get(URL) is None
+
+
+def test_compute_engine_uses_discovery_cache(tmpdir, http_sequence_factory):
+    cache = jam.libs.compute_engine.DiscoveryCache(directory=str(tmpdir))
+    compute_engine = jam.libs.compute_engine.ComputeEngine(
+        project='jam-project', gce_zone='europe-west1-b', discovery_cache=cache,
+        http=http_sequence_factory([({'status': '200'}, 'file:tests/http/compute-discovery.json')]),
+    )
+    assert compute_engine.compute.instances() is not None
+
+    compute_engine = jam.libs.compute_engine.ComputeEngine(
+        project='jam-project', gce_zone='europe-west1-b', discovery_cache=cache,
+        http=http_sequence_factory([({'status': '200'}, 'file:tests/http/compute.instances.list.json')]),
+    )
+    assert set(compute_engine.instances.keys()) >= {'build1', 'master'}
@@ -0,0 +1,68 @@
+import mock
+import pytest
+import requests
+
+from jam.libs.affinity import AffinityIndex
+from jam.libs.jenkins import Jenkins
+
+
+NOW = 1528100000
+JOB_URL = 'http://jenkins/job/project/'
+OTHER_JOB_URL = 'http://jenkins/job/other/'
+
+
+def get_item(job_url=JOB_URL):
+    return {'task': {'name': job_url.rstrip('/').rsplit('/', 1)[-1], 'url': job_url}}
+
+
+def get_jenkins(history):
+    jenkins = mock.Mock(spec=Jenkins)
+    jenkins.get_build_history.return_value = history
+    return jenkins
+
+
+def get_affinity(history, **kwargs):
+    affinity = AffinityIndex(**kwargs)
+    affinity.refresh(get_jenkins(history), now=NOW)
+    return affinity
+
+
+def test_preferred_nodes_are_the_most_recent_builders():
+    affinity = get_affinity([
+        (JOB_URL, 'build1', NOW - 300), (JOB_URL, 'build2', NOW - 100), (JOB_URL, 'build1', NOW - 200),
+        (OTHER_JOB_URL, 'build3', NOW - 100),
+    ])
+    assert affinity.get_preferred_nodes(get_item()) == ('build2', 'build1')
+    assert affinity.get_preferred_nodes({'task': {}}) == ()
+
+
+def test_refresh_is_rate_limited():
+    affinity = get_affinity([(JOB_URL, 'build1', NOW)], refresh_interval=60)
+    jenkins = get_jenkins([(JOB_URL, 'build2', NOW)])
+    affinity.refresh(jenkins, now=NOW + 30)
+    jenkins.get_build_history.assert_not_called()
+    affinity.refresh(jenkins, now=NOW + 60)
+    assert affinity.get_preferred_nodes(get_item()) == ('build2',)
+
+
+@pytest.mark.parametrize(['error'], [
+    pytest.param(requests.ConnectionError(), id='unreachable'),
+    pytest.param(ValueError('Expecting value: line 1 column 1 (char 0)'), id='not-json'),
+    pytest.param(KeyError('jobs'), id='unexpected-json'),
+])
+def test_refresh_keeps_the_index_when_jenkins_fails(error):
+    affinity = get_affinity([(JOB_URL, 'build1', NOW)], refresh_interval=0)
+    jenkins = get_jenkins([])
+    jenkins.get_build_history.side_effect = error
+    affinity.refresh(jenkins, now=NOW + 1)
+    assert affinity.get_preferred_nodes(get_item()) == ('build1',)
+
+
+def test_last_warm_node_of_active_jobs_is_protected():
+    affinity = get_affinity([
+        (JOB_URL, 'build1', NOW - 100), (JOB_URL, 'build2', NOW - 50),
+        (OTHER_JOB_URL, 'build3', NOW - 7200),
+    ], active_period=3600)
+    assert affinity.get_protected_nodes(['build1', 'build2', 'build3'], now=NOW) == {'build2'}
+    assert affinity.get_protected_nodes(['build1', 'build3'], now=NOW) == {'build1'}
+    assert affinity.get_protected_nodes(['build3'], now=NOW) == set()
@@ -0,0 +1,64 @@
+import json
+
+import pytest
+
+from jam.libs.demand import DemandEstimate, QueueItemState, classify, get_required_label
+
+
+def get_item(**fields):
+    item = {
+        '_class': 'hudson.model.Queue$BuildableItem',
+        'blocked': False,
+        'buildable': True,
+        'pending': False,
+        'stuck': False,
+        'why': 'Waiting for next available executor on ‘linux’',
+    }
+    item.update(fields)
+    return item
+
+
+@pytest.mark.parametrize(['item', 'expected_state'], [
+    pytest.param(get_item(), QueueItemState.WAITING_FOR_EXECUTOR, id='waiting-for-executor'),
+    pytest.param(get_item(why='All nodes of label ‘linux’ are offline'), QueueItemState.WAITING_FOR_EXECUTOR,
+                 id='nodes-offline'),
+    pytest.param(get_item(_class='hudson.model.Queue$BlockedItem', blocked=True, buildable=False,
+                          why='Build #66 is already in progress (ETA:2 hr 25 min)'),
+                 QueueItemState.BLOCKED, id='blocked'),
+    pytest.param(get_item(_class='hudson.model.Queue$WaitingItem', buildable=False, why='In the quiet period.'),
+                 QueueItemState.QUIET_PERIOD, id='quiet-period'),
+    pytest.param(get_item(pending=True), QueueItemState.PENDING, id='pending'),
+    pytest.param(get_item(why='There are no nodes with the label ‘windows’', stuck=True),
+                 QueueItemState.UNSERVABLE, id='unknown-label'),
+    pytest.param(get_item(why='Jenkins doesn’t have label ‘windows’'), QueueItemState.UNSERVABLE, id='no-label'),
+    pytest.param({'task': {}}, QueueItemState.WAITING_FOR_EXECUTOR, id='minimal'),
+])
+def test_classify(item, expected_state):
+    assert classify(item) is expected_state
+
+
+@pytest.mark.parametrize(['queue_file', 'expected_servable'], [
+    pytest.param('tests/http/jenkins.queue.0.json', 0, id='no-job'),
+    pytest.param('tests/http/jenkins.queue.3.json', 3, id='three-jobs'),
+])
+def test_demand_estimate_from_queue(queue_file, expected_servable):
+    demand = DemandEstimate.estimate(json.load(open(queue_file))['items'])
+    assert len(demand.servable) == expected_servable
+    assert len(demand.get_items(QueueItemState.BLOCKED)) == 1
+
+
+def test_demand_estimate_str():
+    demand = DemandEstimate.estimate([get_item(), get_item(), get_item(pending=True)])
+    assert str(demand) == '2 waiting_for_executor, 1 pending'
+
+
+@pytest.mark.parametrize(['why', 'expected_label'], [
+    pytest.param('Waiting for next available executor on ‘linux’', 'linux', id='busy'),
+    pytest.param('All nodes of label ‘windows’ are offline', 'windows', id='offline'),
+    pytest.param('There are no nodes with the label ‘mac’', 'mac', id='unknown'),
+    pytest.param('‘build1’ is offline', 'build1', id='node'),
+    pytest.param('Jenkins is reserved for jobs with matching label expression; build1 is offline', None, id='any'),
+    pytest.param(None, None, id='no-reason'),
+])
+def test_get_required_label(why, expected_label):
+    assert get_required_label(get_item(why=why)) == expected_label
@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+from jam.libs.forecast import EwmaModel, QueueForecaster, SeasonalModel
+
+
+def get_items(*ids):
+    return [{'id': item_id} for item_id in ids]
+
+
+def test_ewma_model():
+    model = EwmaModel(time_constant=60)
+    assert model.predict(0, 300) == 0
+    model.update(10, 2, 10)
+    assert model.predict(10, 300) == pytest.approx(60)
+    for at in range(20, 1000, 10):
+        model.update(at, 0, 10)
+    assert model.predict(1000, 300) < 0.1
+
+
+def test_seasonal_model_remembers_the_hour():
+    model = SeasonalModel(time_constant=60)
+    hour = SeasonalModel.SLOT_DURATION
+    # One job per minute between 9:00 and 10:00, nothing the rest of the day.
+    for at in range(60, 24 * hour + 60, 60):
+        model.update(at, 1 if at // hour == 9 else 0, 60)
+    next_day = 24 * hour
+    assert model.predict(next_day + 9 * hour, 600) == pytest.approx(5)
+    assert model.predict(next_day + 12 * hour, 600) == pytest.approx(0)
+
+
+def test_seasonal_model_state():
+    model = SeasonalModel()
+    for at in range(0, 3 * SeasonalModel.SLOT_DURATION, 600):
+        model.update(at + 600, 3, 600)
+    restored = SeasonalModel()
+    restored.set_state(json.loads(json.dumps(model.get_state())))
+    assert restored.get_state() == model.get_state()
+    assert restored.predict(5000, 7200) == model.predict(5000, 7200)
+
+
+def test_forecaster_counts_arrivals():
+    forecaster = QueueForecaster(model=EwmaModel(), horizon=100)
+    forecaster.observe(get_items(1, 2, 3), at=0)
+    assert forecaster.predict(at=0) == 0
+    forecaster.observe(get_items(2, 3, 4, 5), at=10)
+    assert forecaster.predict(at=10) == pytest.approx(20)
+    assert forecaster.get_expected_jobs(at=10) == 20
+
+
+def test_forecaster_state_survives_restarts(tmpdir):
+    state_path = str(tmpdir.join('jam', 'forecast.json'))
+    forecaster = QueueForecaster(model=EwmaModel(), state_path=state_path)
+    forecaster.observe(get_items(), at=0)
+    forecaster.observe(get_items(1), at=10)
+    restarted = QueueForecaster(model=EwmaModel(), state_path=state_path)
+    assert restarted.predict(at=10) == forecaster.predict(at=10)
+
+
+@pytest.mark.parametrize(['content'], [
+    pytest.param('not json', id='corrupted'),
+    pytest.param('{"model": "seasonal", "state": {"rate": 1}}', id='other-model'),
+])
+def test_forecaster_ignores_unusable_state(tmpdir, content):
+    state_file = tmpdir.join('forecast.json')
+    state_file.write(content)
+    assert QueueForecaster(model=EwmaModel(), state_path=str(state_file)).predict(at=0) == 0
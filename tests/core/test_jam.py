@@ -1,12 +1,20 @@
 import collections
 import json
+import threading
 
 import mock
 import pytest
 import requests_mock
 
+import jam.libs.compute_engine
+from jam.libs.compute_engine import InstanceStatus
 import jam.libs.core
+import jam.libs.forecast
+import jam.libs.jenkins
+import jam.libs.policies
+import jam.libs.transitions
 import tests.conftest
+import tests.helpers.helpers_compute_engine
 import tests.helpers.helpers_jenkins
 
 
@@ -126,14 +134,25 @@ def helper_gce_mock(manager, nodes):
     manager.usable_node_names = [node.name for node in nodes]
     manager.compute_engine.http = tests.conftest.HttpMockIterableSequence([
         ({'status': '200'}, 'file:tests/http/compute-discovery.json'),
-    ] + [
-        ({'status': '200'}, f'file:tests/http/compute.instances.get.{node.name}-{node.gce_file_status}.json')
-        for node in nodes
+        ({'status': '200'}, tests.helpers.helpers_compute_engine.get_instance_list(
+            [f'tests/http/compute.instances.get.{node.name}-{node.gce_file_status}.json' for node in nodes]
+        )),
+        tests.helpers.helpers_compute_engine.get_batch_response(
+            [(node.name, 200, 'tests/http/compute.instances.start.build1.json') for node in nodes]
+        ),
     ])
 
 
 def helper_jenkins_mock(manager, nodes, rmock, num_jobs):
     tests.helpers.helpers_jenkins.inject_crumb_issuer(rmock, 200)
+    rmock.register_uri('GET', f'{manager.jenkins_url}/computer/api/json', [
+        {
+            'json': tests.helpers.helpers_jenkins.get_computer_set(
+                [f'tests/http/jenkins.{node.name}.{node.jenkins_file_status}.json' for node in nodes]
+            ),
+            'status_code': 200
+        },
+    ])
     for node in nodes:
         rmock.register_uri('GET', f'{manager.jenkins_url}/computer/{node.name}/api/json', [
             {
@@ -200,6 +219,7 @@ def test_scale_up(jenkins_agent_manager, node1, node2, num_jobs):
         with mock.patch('jam.libs.core.Node.on') as mocked_on:
 
             jenkins_agent_manager.scale_up()
+            jenkins_agent_manager.wait_for_transitions()
             if can_scale_up:
                 mocked_on.assert_called()
                 assert mocked_on.call_count == how_many_up
@@ -228,8 +248,261 @@ def test_scale_down(jenkins_agent_manager, node1, node2, num_jobs):
         with mock.patch('jam.libs.core.Node.off') as mocked_off:
 
             jenkins_agent_manager.scale_down()
+            jenkins_agent_manager.wait_for_transitions()
             if how_many_down > 0:
                 mocked_off.assert_called()
                 assert mocked_off.call_count == how_many_down
             else:
                 mocked_off.assert_not_called()
+
+
+@pytest.mark.parametrize(['node1'], params_node1)
+@pytest.mark.parametrize(['node2'], params_node2)
+@pytest.mark.parametrize(['num_jobs'], params_num_job)
+def test_balance_nodes_reads_the_fleet_once(jenkins_agent_manager, node1, node2, num_jobs):
+    nodes = [node for node in [node1, node2] if node.name is not None]
+    helper_gce_mock(manager=jenkins_agent_manager, nodes=nodes)
+
+    with requests_mock.mock() as rmock:
+        helper_jenkins_mock(manager=jenkins_agent_manager, nodes=nodes, rmock=rmock, num_jobs=num_jobs)
+        with mock.patch('jam.libs.core.Node.on'), mock.patch('jam.libs.core.Node.off'), \
+                mock.patch('jam.libs.compute_engine.ComputeEngineInstance.refresh') as mocked_refresh:
+            jenkins_agent_manager.balance_nodes()
+            jenkins_agent_manager.wait_for_transitions()
+        mocked_refresh.assert_not_called()
+        paths = [request.path for request in rmock.request_history]
+        assert paths.count('/computer/api/json') == (1 if nodes else 0)
+        assert paths.count('/queue/api/json') == 1
+        assert not any(path.startswith('/computer/build') for path in paths)
+
+
+def test_snapshot_unknown_instance(jenkins_agent_manager):
+    nodes = [NodeDataTest(name='build1', gce_file_status='running', jenkins_file_status='idle')]
+    helper_gce_mock(manager=jenkins_agent_manager, nodes=[])
+    jenkins_agent_manager.usable_node_names = ['build1']
+
+    with requests_mock.mock() as rmock:
+        helper_jenkins_mock(manager=jenkins_agent_manager, nodes=nodes, rmock=rmock, num_jobs=0)
+        snapshot = jenkins_agent_manager.take_snapshot()
+    assert snapshot.nodes[0].status is jam.libs.core.NodeStatus.UNKNOWN
+    assert not any([snapshot.idle_nodes, snapshot.busy_nodes, snapshot.offline_nodes,
+                    snapshot.starting_nodes, snapshot.stopping_nodes])
+
+
+def test_balance_nodes_does_not_wait_for_transitions(jenkins_agent_manager):
+    nodes = [NodeDataTest(name='build1', gce_file_status='terminated', jenkins_file_status='offline-terminated')]
+    jenkins_agent_manager.usable_node_names = ['build1']
+    instance_list = tests.helpers.helpers_compute_engine.get_instance_list(
+        ['tests/http/compute.instances.get.build1-terminated.json']
+    )
+    jenkins_agent_manager.compute_engine.http = tests.conftest.HttpMockIterableSequence([
+        ({'status': '200'}, 'file:tests/http/compute-discovery.json'),
+        ({'status': '200'}, instance_list),
+        tests.helpers.helpers_compute_engine.get_batch_response(
+            [('build1', 200, 'tests/http/compute.instances.start.build1.json')]
+        ),
+        ({'status': '200'}, instance_list),
+    ])
+    switched_on = threading.Event()
+    release = threading.Event()
+
+    def slow_on(operation=None, deadline=None):
+        switched_on.set()
+        release.wait(timeout=5)
+
+    with requests_mock.mock() as rmock:
+        helper_jenkins_mock(manager=jenkins_agent_manager, nodes=nodes, rmock=rmock, num_jobs=2)
+        with mock.patch('jam.libs.core.Node.on', side_effect=slow_on) as mocked_on:
+            jenkins_agent_manager.balance_nodes()
+            assert switched_on.wait(timeout=5)
+            assert list(jenkins_agent_manager.transition_pool.in_flight) == ['build1']
+
+            # The next tick accounts for the node being switched on, and does not switch it on again.
+            jenkins_agent_manager.balance_nodes()
+            assert list(jenkins_agent_manager.starting_nodes) == ['build1']
+            assert mocked_on.call_count == 1
+
+            release.set()
+            jenkins_agent_manager.wait_for_transitions()
+            assert not jenkins_agent_manager.transition_pool.in_flight
+
+
+def test_switch_on_resumes_suspended_nodes(jenkins_agent_manager):
+    jenkins_agent_manager.compute_engine.http = tests.conftest.HttpMockIterableSequence([
+        ({'status': '200'}, 'file:tests/http/compute-discovery.json'),
+    ])
+    build1, build2 = jenkins_agent_manager.nodes['build1'], jenkins_agent_manager.nodes['build2']
+    build1.instance.update_info(json.loads(tests.helpers.helpers_compute_engine.get_instance_with_status(
+        'tests/http/compute.instances.get.build1-terminated.json', 'SUSPENDED',
+    )))
+    build2.instance.update_info(json.load(open('tests/http/compute.instances.get.build2-terminated.json')))
+    operation = json.load(open('tests/http/compute.instances.start.build1.json'))
+    compute_engine = jenkins_agent_manager.compute_engine
+    with mock.patch.object(compute_engine, 'start_many', return_value={
+        'build2': jam.libs.compute_engine.BatchResult(response=operation, error=None),
+    }) as mocked_start_many, mock.patch.object(compute_engine, 'resume_many', return_value={
+        'build1': jam.libs.compute_engine.BatchResult(response=operation, error=None),
+    }) as mocked_resume_many, mock.patch('jam.libs.core.Node.on') as mocked_on:
+        jenkins_agent_manager.switch_on([build1, build2])
+        jenkins_agent_manager.wait_for_transitions()
+    mocked_resume_many.assert_called_once_with([build1.instance], wait=False)
+    mocked_start_many.assert_called_once_with([build2.instance], wait=False)
+    assert mocked_on.call_count == 2
+
+
+def get_node_snapshot(name, status, instance_status, is_idle=False, transition=None, is_drained=False):
+    return jam.libs.core.NodeSnapshot(
+        name=name, status=status, is_idle=is_idle, labels=frozenset(), transition=transition,
+        instance_status=instance_status, is_drained=is_drained,
+    )
+
+
+@pytest.mark.parametrize(['warm_idle_nodes', 'should_scale_up'], [
+    pytest.param(1, False, id='pool-full'),
+    pytest.param(2, True, id='pool-missing-one'),
+])
+def test_balance_nodes_keeps_warm_idle_nodes(jenkins_agent_manager, warm_idle_nodes, should_scale_up):
+    nodes = [
+        NodeDataTest(name='build1', gce_file_status='running', jenkins_file_status='idle'),
+        NodeDataTest(name='build2', gce_file_status='terminated', jenkins_file_status='offline-terminated'),
+    ]
+    jenkins_agent_manager.warm_pool = jam.libs.core.WarmPool(idle=warm_idle_nodes)
+    helper_gce_mock(manager=jenkins_agent_manager, nodes=nodes)
+    with requests_mock.mock() as rmock:
+        helper_jenkins_mock(manager=jenkins_agent_manager, nodes=nodes, rmock=rmock, num_jobs=0)
+        with mock.patch('jam.libs.core.Jam.scale_up') as mocked_scale_up, \
+                mock.patch('jam.libs.core.Jam.scale_down') as mocked_scale_down:
+            jenkins_agent_manager.balance_nodes()
+    mocked_scale_down.assert_not_called()
+    assert mocked_scale_up.called is should_scale_up
+
+
+@pytest.mark.parametrize(['expected_jobs', 'should_scale_up'], [
+    pytest.param(1, False, id='idle-node-is-enough'),
+    pytest.param(2, True, id='one-more-node'),
+])
+def test_balance_nodes_anticipates_expected_jobs(jenkins_agent_manager, expected_jobs, should_scale_up):
+    nodes = [
+        NodeDataTest(name='build1', gce_file_status='running', jenkins_file_status='idle'),
+        NodeDataTest(name='build2', gce_file_status='terminated', jenkins_file_status='offline-terminated'),
+    ]
+    jenkins_agent_manager.forecaster = mock.Mock(spec=jam.libs.forecast.QueueForecaster)
+    jenkins_agent_manager.forecaster.get_expected_jobs.return_value = expected_jobs
+    helper_gce_mock(manager=jenkins_agent_manager, nodes=nodes)
+    with requests_mock.mock() as rmock:
+        helper_jenkins_mock(manager=jenkins_agent_manager, nodes=nodes, rmock=rmock, num_jobs=0)
+        with mock.patch('jam.libs.core.Jam.scale_up') as mocked_scale_up, \
+                mock.patch('jam.libs.core.Jam.scale_down') as mocked_scale_down:
+            jenkins_agent_manager.balance_nodes()
+    jenkins_agent_manager.forecaster.observe.assert_called_once_with([])
+    mocked_scale_down.assert_not_called()
+    assert mocked_scale_up.called is should_scale_up
+
+
+def test_lift_stale_drains(jenkins_agent_manager):
+    jenkins_agent_manager.compute_engine.http = tests.conftest.HttpMockIterableSequence([
+        ({'status': '200'}, 'file:tests/http/compute-discovery.json'),
+    ])
+    jenkins_agent_manager.snapshot = jam.libs.core.FleetSnapshot(nodes=(
+        get_node_snapshot('build1', jam.libs.core.NodeStatus.UNKNOWN, InstanceStatus.RUNNING, is_drained=True),
+        get_node_snapshot('build2', jam.libs.core.NodeStatus.SWITCHING_OFF, InstanceStatus.RUNNING, is_drained=True,
+                          transition=jam.libs.transitions.TransitionAction.OFF),
+    ), jobs=(), taken_at=None)
+    with mock.patch('jam.libs.jenkins.JenkinsAgent.undrain', autospec=True) as mocked_undrain:
+        jenkins_agent_manager.lift_stale_drains()
+    assert [call[0][0].name for call in mocked_undrain.call_args_list] == ['build1']
+
+
+def test_scale_down_suspends_nodes_for_the_warm_pool(jenkins_agent_manager):
+    jenkins_agent_manager.compute_engine.http = tests.conftest.HttpMockIterableSequence([
+        ({'status': '200'}, 'file:tests/http/compute-discovery.json'),
+    ])
+    jenkins_agent_manager.warm_pool = jam.libs.core.WarmPool(suspended=1)
+    jenkins_agent_manager.snapshot = jam.libs.core.FleetSnapshot(nodes=(
+        get_node_snapshot('build1', jam.libs.core.NodeStatus.ON, InstanceStatus.RUNNING, is_idle=True),
+        get_node_snapshot('build2', jam.libs.core.NodeStatus.ON, InstanceStatus.RUNNING, is_idle=True),
+    ), jobs=(), taken_at=None)
+    with mock.patch.object(jenkins_agent_manager.transition_pool, 'submit') as mocked_submit:
+        jenkins_agent_manager.scale_down()
+    actions = sorted(call[0][1].value for call in mocked_submit.call_args_list)
+    assert actions == ['off', 'suspend']
+
+
+@pytest.mark.parametrize(['warm_suspended_nodes', 'expected_prewarmed'], [
+    pytest.param(0, [], id='no-pool'),
+    pytest.param(1, [], id='pool-full'),
+    pytest.param(2, ['build1'], id='pool-missing-one'),
+    pytest.param(3, ['build1'], id='not-enough-nodes'),
+])
+def test_refill_warm_pool(jenkins_agent_manager, warm_suspended_nodes, expected_prewarmed):
+    jenkins_agent_manager.compute_engine.http = tests.conftest.HttpMockIterableSequence([
+        ({'status': '200'}, 'file:tests/http/compute-discovery.json'),
+    ])
+    jenkins_agent_manager.warm_pool = jam.libs.core.WarmPool(suspended=warm_suspended_nodes)
+    jenkins_agent_manager.snapshot = jam.libs.core.FleetSnapshot(nodes=(
+        get_node_snapshot('build1', jam.libs.core.NodeStatus.OFF, InstanceStatus.TERMINATED),
+        get_node_snapshot('build2', jam.libs.core.NodeStatus.OFF, InstanceStatus.SUSPENDED),
+    ), jobs=(), taken_at=None)
+    with mock.patch('jam.libs.core.Node.prewarm') as mocked_prewarm:
+        jenkins_agent_manager.refill_warm_pool()
+        assert sorted(jenkins_agent_manager.transition_pool.in_flight) == expected_prewarmed
+        jenkins_agent_manager.wait_for_transitions()
+    assert mocked_prewarm.call_count == len(expected_prewarmed)
+
+
+def test_scale_up_resumes_suspended_nodes_first(jenkins_agent_manager):
+    jenkins_agent_manager.compute_engine.http = tests.conftest.HttpMockIterableSequence([
+        ({'status': '200'}, 'file:tests/http/compute-discovery.json'),
+    ])
+    jenkins_agent_manager.snapshot = jam.libs.core.FleetSnapshot(nodes=(
+        get_node_snapshot('build1', jam.libs.core.NodeStatus.OFF, InstanceStatus.TERMINATED),
+        get_node_snapshot('build2', jam.libs.core.NodeStatus.OFF, InstanceStatus.SUSPENDED),
+    ), jobs=({'id': 1},), taken_at=None)
+    with mock.patch('jam.libs.core.Jam.switch_on') as mocked_switch_on:
+        jenkins_agent_manager.scale_up()
+    assert [node.name for node in mocked_switch_on.call_args[0][0]] == ['build2']
+
+
+def test_scale_down_follows_the_scale_down_policy(jenkins_agent_manager):
+    jenkins_agent_manager.compute_engine.http = tests.conftest.HttpMockIterableSequence([
+        ({'status': '200'}, 'file:tests/http/compute-discovery.json'),
+    ])
+    jenkins_agent_manager.scale_down_policy = jam.libs.policies.ScaleDownPolicy(cooldown=60)
+    jenkins_agent_manager.scale_down_policy.record_scale_up()
+    jenkins_agent_manager.snapshot = jam.libs.core.FleetSnapshot(nodes=(
+        get_node_snapshot('build1', jam.libs.core.NodeStatus.ON, InstanceStatus.RUNNING, is_idle=True),
+    ), jobs=(), taken_at=None)
+    with mock.patch.object(jenkins_agent_manager.transition_pool, 'submit') as mocked_submit:
+        jenkins_agent_manager.scale_down()
+    mocked_submit.assert_not_called()
+
+
+def test_balance_nodes_ignores_jobs_that_an_agent_cannot_serve(jenkins_agent_manager):
+    nodes = [NodeDataTest(name='build1', gce_file_status='terminated', jenkins_file_status='offline-terminated')]
+    helper_gce_mock(manager=jenkins_agent_manager, nodes=nodes)
+    queue = json.load(open('tests/http/jenkins.queue.3.json'))
+    queue['items'][1].update(pending=True)
+    queue['items'][2].update(why='There are no nodes with the label ‘windows’')
+    queue['items'][3].update({'_class': 'hudson.model.Queue$WaitingItem', 'buildable': False})
+    with requests_mock.mock() as rmock:
+        helper_jenkins_mock(manager=jenkins_agent_manager, nodes=nodes, rmock=rmock, num_jobs=0)
+        rmock.register_uri('GET', f'{jenkins_agent_manager.jenkins_url}/queue/api/json', json=queue)
+        with mock.patch('jam.libs.core.Jam.scale_up') as mocked_scale_up:
+            jenkins_agent_manager.balance_nodes()
+    assert jenkins_agent_manager.snapshot.jobs == ()
+    mocked_scale_up.assert_not_called()
+
+
+def test_scale_up_only_starts_nodes_with_the_required_label(jenkins_agent_manager):
+    jenkins_agent_manager.compute_engine.http = tests.conftest.HttpMockIterableSequence([
+        ({'status': '200'}, 'file:tests/http/compute-discovery.json'),
+    ])
+    jenkins_agent_manager.snapshot = jam.libs.core.FleetSnapshot(nodes=(
+        get_node_snapshot('build1', jam.libs.core.NodeStatus.OFF, InstanceStatus.TERMINATED)._replace(
+            labels=frozenset(['linux'])),
+        get_node_snapshot('build2', jam.libs.core.NodeStatus.OFF, InstanceStatus.TERMINATED)._replace(
+            labels=frozenset(['windows'])),
+    ), jobs=({'why': 'All nodes of label ‘windows’ are offline'},), taken_at=None)
+    with mock.patch('jam.libs.core.Jam.switch_on') as mocked_switch_on:
+        jenkins_agent_manager.scale_up()
+    assert [node.name for node in mocked_switch_on.call_args[0][0]] == ['build2']
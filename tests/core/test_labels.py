@@ -0,0 +1,57 @@
+import collections
+
+import pytest
+
+from jam.libs.labels import LabelExpressionError, LabelIndex, compile_expression
+
+
+@pytest.fixture
+def index():
+    return LabelIndex(collections.OrderedDict([
+        ('linux-docker', {'linux', 'docker', 'x86'}),
+        ('linux-podman-arm', {'linux', 'podman', 'arm'}),
+        ('linux-bare', {'linux', 'x86'}),
+        ('windows', {'windows', 'x86', 'build agent'}),
+    ]))
+
+
+@pytest.mark.parametrize(['expression', 'expected_names'], [
+    pytest.param('linux', ['linux-docker', 'linux-podman-arm', 'linux-bare'], id='atom'),
+    pytest.param('mac', [], id='unknown-atom'),
+    pytest.param('!linux', ['windows'], id='not'),
+    pytest.param('linux && x86', ['linux-docker', 'linux-bare'], id='and'),
+    pytest.param('docker || podman', ['linux-docker', 'linux-podman-arm'], id='or'),
+    pytest.param('linux && (docker || podman) && !arm', ['linux-docker'], id='combined'),
+    pytest.param('linux&&!x86', ['linux-podman-arm'], id='no-spaces'),
+    pytest.param('docker || podman && arm', ['linux-docker', 'linux-podman-arm'], id='and-binds-tighter'),
+    pytest.param('linux -> docker', ['linux-docker', 'windows'], id='implies'),
+    pytest.param('linux->docker', ['linux-docker', 'windows'], id='implies-no-spaces'),
+    pytest.param('linux-docker', [], id='dashed-atom'),
+    pytest.param('linux <-> x86', ['linux-docker', 'linux-bare'], id='iff'),
+    pytest.param('"build agent"', ['windows'], id='quoted'),
+    pytest.param('!!windows', ['windows'], id='double-not'),
+])
+def test_evaluate(index, expression, expected_names):
+    assert index.get_names(compile_expression(expression).evaluate(index)) == expected_names
+
+
+@pytest.mark.parametrize(['expression'], [
+    pytest.param('', id='empty'),
+    pytest.param('linux &&', id='missing-operand'),
+    pytest.param('(linux', id='missing-parenthesis'),
+    pytest.param('linux)', id='extra-parenthesis'),
+    pytest.param('linux docker', id='missing-operator'),
+    pytest.param('linux < docker', id='unknown-operator'),
+])
+def test_invalid_expression(expression):
+    with pytest.raises(LabelExpressionError):
+        compile_expression(expression)
+
+
+def test_expressions_are_compiled_once():
+    assert compile_expression('linux && docker') is compile_expression('linux && docker')
+
+
+def test_matches():
+    assert compile_expression('linux && !arm').matches({'linux', 'x86'})
+    assert not compile_expression('linux && !arm').matches({'linux', 'arm'})
@@ -4,12 +4,16 @@ import collections
 
 import mock
 import pytest
+import requests
 import requests_mock
 
 import jam.libs.compute_engine
 import jam.libs.core
 import jam.libs.jenkins
+import jam.libs.readiness
+import jam.libs.utils
 import tests.conftest
+import tests.helpers.helpers_compute_engine
 import tests.helpers.helpers_jenkins
 import tests.helpers.helpers_core
 
@@ -110,24 +114,25 @@ def test_nodes(jenkins_agent_manager, node1, node2):
     nodes = [node1, node2]
     jenkins_agent_manager.compute_engine.http = tests.conftest.HttpMockIterableSequence([
         ({'status': '200'}, 'file:tests/http/compute-discovery.json'),
-    ] + [
-        (
-            {'status': '200'},
-            f"file:tests/http/compute.instances.get.{node['data'].name}-{node['data'].gce_file_status}.json"
-        )
-        for node in nodes
+        ({'status': '200'}, tests.helpers.helpers_compute_engine.get_instance_list([
+            f"tests/http/compute.instances.get.{node['data'].name}-{node['data'].gce_file_status}.json"
+            for node in nodes
+        ])),
     ])
     with requests_mock.mock() as rmock:
         tests.helpers.helpers_jenkins.inject_crumb_issuer(rmock, 200)
-        for node in nodes:
-            rmock.register_uri('GET', f"{jenkins_agent_manager.jenkins_url}/computer/{node['data'].name}/api/json", [
-                {
-                    'json': json.load(open(
-                        f"tests/http/jenkins.{node['data'].name}.{node['data'].jenkins_file_status}.json"
-                    )),
-                    'status_code': 200
-                },
-            ])
+        rmock.register_uri('GET', f"{jenkins_agent_manager.jenkins_url}/computer/api/json", [
+            {
+                'json': tests.helpers.helpers_jenkins.get_computer_set([
+                    f"tests/http/jenkins.{node['data'].name}.{node['data'].jenkins_file_status}.json"
+                    for node in nodes
+                ]),
+                'status_code': 200
+            },
+        ])
+        rmock.register_uri('GET', f"{jenkins_agent_manager.jenkins_url}/queue/api/json", [
+            {'json': json.load(open('tests/http/jenkins.queue.0.json')), 'status_code': 200},
+        ])
         expected = {
             'idle_nodes': frozenset(node['data'].name for node in nodes if node['expected'].idle_nodes),
             'busy_nodes': frozenset(node['data'].name for node in nodes if node['expected'].busy_nodes),
@@ -187,6 +192,29 @@ def test_set_an_offline_node_on(jenkins_agent_manager):
         assert node.status is jam.libs.core.NodeStatus.ON
 
 
+def test_set_an_already_started_node_on(jenkins_agent_manager):
+    jenkins_agent_manager.compute_engine.http = tests.conftest.HttpMockIterableSequence([
+        ({'status': '200'}, 'file:tests/http/compute-discovery.json'),
+        ({'status': '200'}, 'file:tests/http/compute.operations.get-start-running.json'),
+        ({'status': '200'}, 'file:tests/http/compute.operations.get-start-done.json'),
+        ({'status': '200'}, 'file:tests/http/compute.instances.get.build1-running.json'),
+    ])
+
+    with requests_mock.mock() as rmock, tests.helpers.helpers_core.no_pause():
+        node = jenkins_agent_manager.nodes['build1']
+        tests.helpers.helpers_jenkins.inject_crumb_issuer(rmock, 200)
+        rmock.register_uri('GET', f'{jenkins_agent_manager.jenkins_url}/computer/build1/api/json', [
+            {
+                'json': json.load(open('tests/http/jenkins.build1.idle.json')),
+                'status_code': 200
+            },
+        ])
+        with mock.patch('jam.libs.compute_engine.ComputeEngineInstance.start') as mocked_start:
+            node.on(operation=json.load(open('tests/http/compute.instances.start.build1.json')))
+            mocked_start.assert_not_called()
+        assert node.status is jam.libs.core.NodeStatus.ON
+
+
 def test_set_an_online_node_on_does_nothing(jenkins_agent_manager):
     jenkins_agent_manager.compute_engine.http = tests.conftest.HttpMockIterableSequence([
         ({'status': '200'}, 'file:tests/http/compute-discovery.json'),
@@ -229,7 +257,13 @@ def test_set_an_online_node_off(jenkins_agent_manager):
                 'status_code': 200
             },
             {
-                'json': json.load(open('tests/http/jenkins.build1.idle.json')),
+                'json': tests.helpers.helpers_jenkins.get_drained_agent('tests/http/jenkins.build1.idle.json'),
+                'status_code': 200
+            },
+            {
+                'json': tests.helpers.helpers_jenkins.get_drained_agent(
+                    'tests/http/jenkins.build1.idle.json', reason='jam.stop',
+                ),
                 'status_code': 200
             },
             {
@@ -237,6 +271,12 @@ def test_set_an_online_node_off(jenkins_agent_manager):
                 'status_code': 200
             },
         ])
+        rmock.register_uri('POST', f'{node.agent.url}/toggleOffline', [
+            {
+                'headers': {'Location': f'{node.agent.url}/log'},
+                'status_code': 302,
+            },
+        ])
         rmock.register_uri('POST', f'{node.agent.url}/doDisconnect?offlineMessage=jam.stop', [
             {
                 'headers': {'Location': f'{node.agent.url}/log'},
@@ -253,6 +293,45 @@ def test_set_an_online_node_off(jenkins_agent_manager):
         assert node.status is jam.libs.core.NodeStatus.ON
         node.off()
         assert node.status is jam.libs.core.NodeStatus.OFF
+    assert [request.path_url.split('/')[-1] for request in rmock.request_history if request.method == 'POST'] == [
+        'toggleOffline?offlineMessage=jam.drain', 'doDisconnect?offlineMessage=jam.stop', 'toggleOffline',
+    ]
+
+
+def test_set_a_node_off_cancels_the_drain_when_a_build_landed(jenkins_agent_manager):
+    jenkins_agent_manager.compute_engine.http = tests.conftest.HttpMockIterableSequence([
+        ({'status': '200'}, 'file:tests/http/compute-discovery.json'),
+    ])
+
+    with requests_mock.mock() as rmock, tests.helpers.helpers_core.no_pause():
+        node = jenkins_agent_manager.nodes['build1']
+        tests.helpers.helpers_jenkins.inject_crumb_issuer(rmock, 200)
+        rmock.register_uri('GET', f'{jenkins_agent_manager.jenkins_url}/computer/build1/api/json', [
+            {
+                'json': json.load(open('tests/http/jenkins.build1.idle.json')),
+                'status_code': 200
+            },
+            {
+                'json': tests.helpers.helpers_jenkins.get_drained_agent('tests/http/jenkins.build1.busy.json'),
+                'status_code': 200
+            },
+        ])
+        rmock.register_uri('POST', f'{node.agent.url}/toggleOffline', [
+            {
+                'text': '',
+                'status_code': 200,
+            },
+        ])
+
+        with mock.patch('jam.libs.compute_engine.ComputeEngineInstance.stop') as mocked_stop, \
+                mock.patch('jam.libs.compute_engine.ComputeEngineInstance.suspend') as mocked_suspend, \
+                pytest.raises(jam.libs.core.DrainCancelled):
+            node.off()
+        mocked_stop.assert_not_called()
+        mocked_suspend.assert_not_called()
+    assert [request.path_url.split('/')[-1] for request in rmock.request_history if request.method == 'POST'] == [
+        'toggleOffline?offlineMessage=jam.drain', 'toggleOffline',
+    ]
 
 
 def test_set_an_offline_node_off_does_nothing(jenkins_agent_manager):
@@ -276,3 +355,234 @@ def test_set_an_offline_node_off_does_nothing(jenkins_agent_manager):
             node.off()
             mocked_stop.assert_not_called()
         assert node.status is jam.libs.core.NodeStatus.OFF
+
+
+def test_set_an_online_node_off_with_suspend(jenkins_agent_manager):
+    jenkins_agent_manager.suspended_node_names = frozenset(['build1'])
+    jenkins_agent_manager.compute_engine.http = tests.conftest.HttpMockIterableSequence([
+        ({'status': '200'}, tests.helpers.helpers_compute_engine.get_discovery(
+            tests.helpers.helpers_compute_engine.SUSPEND,
+        )),
+        ({'status': '200'}, 'file:tests/http/compute.instances.get.build1-running.json'),
+        ({'status': '200'}, 'file:tests/http/compute.instances.stop.build1.json'),
+        ({'status': '200'}, 'file:tests/http/compute.operations.get-stop-done.json'),
+        ({'status': '200'}, tests.helpers.helpers_compute_engine.get_instance_with_status(
+            'tests/http/compute.instances.get.build1-terminated.json', 'SUSPENDED',
+        )),
+    ])
+
+    with requests_mock.mock() as rmock, tests.helpers.helpers_core.no_pause():
+        node = jenkins_agent_manager.nodes['build1']
+        assert node.power_mode is jam.libs.compute_engine.PowerMode.SUSPEND
+        tests.helpers.helpers_jenkins.inject_crumb_issuer(rmock, 200)
+        rmock.register_uri('GET', f'{jenkins_agent_manager.jenkins_url}/computer/build1/api/json', [
+            {
+                'json': json.load(open('tests/http/jenkins.build1.idle.json')),
+                'status_code': 200
+            },
+            {
+                'json': tests.helpers.helpers_jenkins.get_drained_agent('tests/http/jenkins.build1.idle.json'),
+                'status_code': 200
+            },
+            {
+                'json': tests.helpers.helpers_jenkins.get_drained_agent(
+                    'tests/http/jenkins.build1.idle.json', reason='jam.stop',
+                ),
+                'status_code': 200
+            },
+            {
+                'json': json.load(open('tests/http/jenkins.build1.offline-terminated.json')),
+                'status_code': 200
+            },
+        ])
+        rmock.register_uri('POST', f'{node.agent.url}/toggleOffline', [
+            {
+                'headers': {'Location': f'{node.agent.url}/log'},
+                'status_code': 302,
+            },
+        ])
+        rmock.register_uri('POST', f'{node.agent.url}/doDisconnect?offlineMessage=jam.stop', [
+            {
+                'headers': {'Location': f'{node.agent.url}/log'},
+                'status_code': 302,
+            },
+        ])
+        rmock.register_uri('GET', f'{node.agent.url}/log', [
+            {
+                'text': '<html><head/><body>Some mocked shortened response!</body></html>',
+                'status_code': 200,
+            },
+        ])
+
+        with mock.patch('jam.libs.compute_engine.ComputeEngineInstance.stop') as mocked_stop:
+            node.off()
+            mocked_stop.assert_not_called()
+        assert node.instance.status is jam.libs.compute_engine.InstanceStatus.SUSPENDED
+        assert node.status is jam.libs.core.NodeStatus.OFF
+
+
+def test_set_a_suspended_node_on(jenkins_agent_manager):
+    jenkins_agent_manager.compute_engine.http = tests.conftest.HttpMockIterableSequence([
+        ({'status': '200'}, tests.helpers.helpers_compute_engine.get_discovery(
+            tests.helpers.helpers_compute_engine.RESUME,
+        )),
+        ({'status': '200'}, tests.helpers.helpers_compute_engine.get_instance_with_status(
+            'tests/http/compute.instances.get.build1-terminated.json', 'SUSPENDED',
+        )),
+        ({'status': '200'}, 'file:tests/http/compute.instances.start.build1.json'),
+        ({'status': '200'}, 'file:tests/http/compute.operations.get-start-done.json'),
+        ({'status': '200'}, 'file:tests/http/compute.instances.get.build1-running.json'),
+    ])
+
+    with requests_mock.mock() as rmock, tests.helpers.helpers_core.no_pause():
+        node = jenkins_agent_manager.nodes['build1']
+        assert node.power_mode is jam.libs.compute_engine.PowerMode.STOP
+        tests.helpers.helpers_jenkins.inject_crumb_issuer(rmock, 200)
+        rmock.register_uri('GET', f'{jenkins_agent_manager.jenkins_url}/computer/build1/api/json', [
+            {
+                'json': json.load(open('tests/http/jenkins.build1.idle.json')),
+                'status_code': 200
+            },
+        ])
+
+        with mock.patch('jam.libs.compute_engine.ComputeEngineInstance.start') as mocked_start:
+            node.on()
+            mocked_start.assert_not_called()
+        assert node.status is jam.libs.core.NodeStatus.ON
+
+
+@pytest.mark.parametrize(['statuses', 'should_start'], [
+    pytest.param(['TERMINATED', 'RUNNING', 'RUNNING', 'SUSPENDED'], True, id='terminated'),
+    pytest.param(['PROVISIONING', 'RUNNING', 'RUNNING', 'SUSPENDED'], False, id='provisioning'),
+])
+def test_prewarm_a_node(jenkins_agent_manager, statuses, should_start):
+    jenkins_agent_manager.compute_engine.http = tests.conftest.HttpMockIterableSequence([
+        ({'status': '200'}, 'file:tests/http/compute-discovery.json'),
+    ])
+    node = jenkins_agent_manager.nodes['build1']
+    with mock.patch('jam.libs.compute_engine.ComputeEngineInstance.status', new_callable=mock.PropertyMock,
+                    side_effect=[jam.libs.compute_engine.InstanceStatus(status) for status in statuses]), \
+            mock.patch('jam.libs.compute_engine.ComputeEngineInstance.start') as mocked_start, \
+            mock.patch('jam.libs.compute_engine.ComputeEngineInstance.suspend') as mocked_suspend, \
+            mock.patch('jam.libs.compute_engine.ComputeEngineInstance.wait_for_status'), \
+            mock.patch('jam.libs.jenkins.JenkinsAgent.force_launch') as mocked_force_launch:
+        node.prewarm()
+    assert mocked_start.called is should_start
+    mocked_suspend.assert_called_once_with(deadline=None)
+    mocked_force_launch.assert_not_called()
+
+
+def test_prewarm_a_node_waits_for_the_boot(jenkins_agent_manager):
+    jenkins_agent_manager.compute_engine.http = tests.conftest.HttpMockIterableSequence([
+        ({'status': '200'}, 'file:tests/http/compute-discovery.json'),
+    ])
+    node = jenkins_agent_manager.nodes['build1']
+    node.readiness = mock.Mock(spec=jam.libs.readiness.ReadinessDetector)
+    calls = mock.Mock()
+    node.readiness.wait_for_boot.side_effect = lambda instance, deadline: calls.wait_for_boot()
+    with mock.patch('jam.libs.compute_engine.ComputeEngineInstance.status', new_callable=mock.PropertyMock,
+                    side_effect=[jam.libs.compute_engine.InstanceStatus(status)
+                                 for status in ['TERMINATED', 'RUNNING', 'RUNNING']]), \
+            mock.patch('jam.libs.compute_engine.ComputeEngineInstance.start'), \
+            mock.patch('jam.libs.compute_engine.ComputeEngineInstance.suspend', side_effect=calls.suspend), \
+            mock.patch('jam.libs.compute_engine.ComputeEngineInstance.wait_for_status'):
+        node.prewarm()
+    assert calls.mock_calls == [mock.call.wait_for_boot(), mock.call.suspend(deadline=None)]
+
+
+@pytest.mark.parametrize(['last_known_status', 'tail_console'], [
+    pytest.param('TERMINATED', True, id='booting'),
+    pytest.param('SUSPENDED', False, id='resuming'),
+])
+def test_set_a_node_on_with_readiness_detector(jenkins_agent_manager, last_known_status, tail_console):
+    jenkins_agent_manager.compute_engine.http = tests.conftest.HttpMockIterableSequence([
+        ({'status': '200'}, 'file:tests/http/compute-discovery.json'),
+    ])
+    node = jenkins_agent_manager.nodes['build1']
+    node.readiness = mock.Mock(spec=jam.libs.readiness.ReadinessDetector)
+    with mock.patch('jam.libs.compute_engine.ComputeEngineInstance.last_known_status', new_callable=mock.PropertyMock,
+                    return_value=jam.libs.compute_engine.InstanceStatus(last_known_status)), \
+            mock.patch('jam.libs.compute_engine.ComputeEngineInstance.wait_for_operation'), \
+            mock.patch('jam.libs.compute_engine.ComputeEngineInstance.wait_for_status'), \
+            mock.patch('jam.libs.jenkins.JenkinsAgent.is_drained', new_callable=mock.PropertyMock,
+                       return_value=False), \
+            mock.patch('jam.libs.jenkins.JenkinsAgent.force_launch') as mocked_force_launch:
+        node.on(operation={'name': 'operation-start'})
+    mocked_force_launch.assert_not_called()
+    node.readiness.bring_online.assert_called_once_with(node.instance, node.agent, tail_console=tail_console,
+                                                        deadline=None)
+
+
+@pytest.mark.parametrize(['is_online', 'status', 'should_stop'], [
+    pytest.param(False, 'RUNNING', True, id='agent-offline'),
+    pytest.param(False, 'TERMINATED', False, id='instance-off'),
+    pytest.param(True, 'RUNNING', False, id='agent-online'),
+])
+def test_set_a_node_on_stops_the_instance_when_giving_up(jenkins_agent_manager, is_online, status, should_stop):
+    jenkins_agent_manager.compute_engine.http = tests.conftest.HttpMockIterableSequence([
+        ({'status': '200'}, 'file:tests/http/compute-discovery.json'),
+    ])
+    node = jenkins_agent_manager.nodes['build1']
+    with mock.patch('jam.libs.compute_engine.ComputeEngineInstance.status', new_callable=mock.PropertyMock,
+                    return_value=jam.libs.compute_engine.InstanceStatus(status)), \
+            mock.patch('jam.libs.compute_engine.ComputeEngineInstance.wait_for_operation'), \
+            mock.patch('jam.libs.compute_engine.ComputeEngineInstance.wait_for_status'), \
+            mock.patch('jam.libs.compute_engine.ComputeEngineInstance.stop') as mocked_stop, \
+            mock.patch('jam.libs.jenkins.JenkinsAgent.is_drained', new_callable=mock.PropertyMock,
+                       return_value=False), \
+            mock.patch('jam.libs.jenkins.JenkinsAgent.is_online', new_callable=mock.PropertyMock,
+                       return_value=is_online), \
+            mock.patch('jam.libs.jenkins.JenkinsAgent.force_launch',
+                       side_effect=jam.libs.utils.DeadlineExceeded('too long')):
+        with pytest.raises(jam.libs.utils.DeadlineExceeded):
+            node.on(operation={'name': 'operation-start'})
+    if should_stop:
+        mocked_stop.assert_called_once_with(wait=False)
+    else:
+        mocked_stop.assert_not_called()
+
+
+def test_set_a_node_off_cancels_the_drain_when_it_did_not_take(jenkins_agent_manager):
+    jenkins_agent_manager.compute_engine.http = tests.conftest.HttpMockIterableSequence([
+        ({'status': '200'}, 'file:tests/http/compute-discovery.json'),
+    ])
+
+    with requests_mock.mock() as rmock, tests.helpers.helpers_core.no_pause():
+        node = jenkins_agent_manager.nodes['build1']
+        tests.helpers.helpers_jenkins.inject_crumb_issuer(rmock, 200)
+        rmock.register_uri('GET', f'{jenkins_agent_manager.jenkins_url}/computer/build1/api/json', [
+            {
+                'json': json.load(open('tests/http/jenkins.build1.idle.json')),
+                'status_code': 200
+            },
+        ])
+        rmock.register_uri('POST', f'{node.agent.url}/toggleOffline', [
+            {
+                'text': '',
+                'status_code': 200,
+            },
+        ])
+
+        with mock.patch('jam.libs.compute_engine.ComputeEngineInstance.stop') as mocked_stop, \
+                pytest.raises(jam.libs.core.DrainCancelled):
+            node.off()
+        mocked_stop.assert_not_called()
+    assert [request.path_url.split('/')[-1] for request in rmock.request_history if request.method == 'POST'] == [
+        'toggleOffline?offlineMessage=jam.drain',
+    ]
+
+
+def test_set_a_node_off_undrains_when_the_agent_cannot_be_stopped(jenkins_agent_manager):
+    jenkins_agent_manager.compute_engine.http = tests.conftest.HttpMockIterableSequence([
+        ({'status': '200'}, 'file:tests/http/compute-discovery.json'),
+    ])
+    node = jenkins_agent_manager.nodes['build1']
+    with mock.patch('jam.libs.jenkins.JenkinsAgent.is_online', new_callable=mock.PropertyMock, return_value=True), \
+            mock.patch('jam.libs.core.Node.drain'), \
+            mock.patch('jam.libs.jenkins.JenkinsAgent.stop', side_effect=requests.ConnectionError('boom')), \
+            mock.patch('jam.libs.jenkins.JenkinsAgent.undrain') as mocked_undrain, \
+            mock.patch('jam.libs.compute_engine.ComputeEngineInstance.stop') as mocked_stop, \
+            pytest.raises(requests.ConnectionError):
+        node.off()
+    mocked_undrain.assert_called_once_with()
+    mocked_stop.assert_not_called()
@@ -0,0 +1,128 @@
+import datetime
+
+import pytest
+
+from jam.libs.core import FleetSnapshot, NodeSnapshot, NodeStatus
+from jam.libs.policies import BootTimeSelectionPolicy, Quarantine, ScaleDownPolicy
+from jam.libs.transitions import TransitionAction, TransitionCancelled, TransitionResult, TransitionSummary
+
+
+NOW = datetime.datetime(2019, 3, 1, 12, 0, 0)
+
+
+def get_snapshot(taken_at=NOW, started_at=None, **idle_nodes):
+    return FleetSnapshot(nodes=tuple(
+        NodeSnapshot(name=name, status=NodeStatus.ON, is_idle=is_idle, labels=frozenset(), transition=None,
+                     started_at=started_at)
+        for name, is_idle in idle_nodes.items()
+    ), jobs=(), taken_at=taken_at)
+
+
+def test_nodes_are_stoppable_after_min_idle_time():
+    policy = ScaleDownPolicy(min_idle_time=60, cooldown=0, min_run_time=0)
+    policy.observe(get_snapshot(build1=True, build2=False))
+    policy.observe(get_snapshot(taken_at=NOW + datetime.timedelta(seconds=30), build1=True, build2=True))
+    snapshot = get_snapshot(taken_at=NOW + datetime.timedelta(seconds=60), build1=True, build2=True)
+    policy.observe(snapshot)
+    assert list(policy.get_stoppable_nodes(snapshot, now=snapshot.taken_at)) == ['build1']
+    assert list(policy.get_stoppable_nodes(snapshot, now=NOW + datetime.timedelta(seconds=90))) == ['build1', 'build2']
+
+
+def test_idle_time_is_reset_when_node_gets_busy():
+    policy = ScaleDownPolicy(min_idle_time=60, cooldown=0, min_run_time=0)
+    policy.observe(get_snapshot(build1=True))
+    policy.observe(get_snapshot(taken_at=NOW + datetime.timedelta(seconds=30), build1=False))
+    snapshot = get_snapshot(taken_at=NOW + datetime.timedelta(seconds=60), build1=True)
+    policy.observe(snapshot)
+    assert not policy.get_stoppable_nodes(snapshot, now=snapshot.taken_at)
+
+
+def test_unobserved_nodes_are_not_stoppable():
+    policy = ScaleDownPolicy(min_idle_time=60, cooldown=0, min_run_time=0)
+    assert not policy.get_stoppable_nodes(get_snapshot(build1=True), now=NOW)
+
+
+@pytest.mark.parametrize(['elapsed', 'expected'], [
+    pytest.param(30, [], id='cooling-down'),
+    pytest.param(60, ['build1'], id='cooled-down'),
+])
+def test_no_scale_down_right_after_scale_up(elapsed, expected):
+    policy = ScaleDownPolicy(min_idle_time=0, cooldown=60, min_run_time=0)
+    policy.record_scale_up(at=NOW)
+    snapshot = get_snapshot(build1=True)
+    assert list(policy.get_stoppable_nodes(snapshot, now=NOW + datetime.timedelta(seconds=elapsed))) == expected
+
+
+@pytest.mark.parametrize(['running_for', 'expected'], [
+    pytest.param(30, [], id='billing-window'),
+    pytest.param(60, ['build1'], id='billing-window-over'),
+])
+def test_billing_window(running_for, expected):
+    policy = ScaleDownPolicy(min_idle_time=0, cooldown=0, min_run_time=60)
+    started_at = NOW.astimezone(datetime.timezone.utc) - datetime.timedelta(seconds=running_for)
+    snapshot = get_snapshot(started_at=started_at, build1=True)
+    assert list(policy.get_stoppable_nodes(snapshot, now=NOW)) == expected
+
+
+def get_fleet(taken_at, **statuses):
+    return FleetSnapshot(nodes=tuple(
+        NodeSnapshot(name=name, status=status, is_idle=True, labels=frozenset(), transition=None)
+        for name, status in statuses.items()
+    ), jobs=(), taken_at=taken_at)
+
+
+def test_boot_time_is_measured_until_the_agent_is_online():
+    policy = BootTimeSelectionPolicy(smoothing=0.5)
+    policy.observe(get_fleet(NOW, fast=NodeStatus.SWITCHING_ON, slow=NodeStatus.SWITCHING_ON))
+    policy.observe(get_fleet(NOW + datetime.timedelta(seconds=30), fast=NodeStatus.ON, slow=NodeStatus.SWITCHING_ON))
+    policy.observe(get_fleet(NOW + datetime.timedelta(seconds=90), fast=NodeStatus.ON, slow=NodeStatus.ON))
+    assert policy.boot_times == {'fast': 30, 'slow': 90}
+    policy.observe(get_fleet(NOW, failed=NodeStatus.SWITCHING_ON))
+    policy.observe(get_fleet(NOW + datetime.timedelta(seconds=10), failed=NodeStatus.OFF))
+    assert 'failed' not in policy.boot_times
+    policy.record_boot('fast', 50)
+    assert policy.boot_times['fast'] == 40
+
+
+def test_fastest_nodes_get_started_first():
+    policy = BootTimeSelectionPolicy()
+    policy.boot_times.update(fast=30, slow=90)
+    nodes = get_fleet(NOW, slow=NodeStatus.OFF, unknown=NodeStatus.OFF, fast=NodeStatus.OFF).nodes
+    assert [node.name for node in policy.sort_to_start(nodes)] == ['fast', 'unknown', 'slow']
+
+
+def test_expensive_then_slow_nodes_get_stopped_first():
+    policy = BootTimeSelectionPolicy(costs={'expensive': 3})
+    policy.boot_times.update(fast=30, slow=90, expensive=10)
+    nodes = get_fleet(NOW, fast=NodeStatus.ON, slow=NodeStatus.ON, expensive=NodeStatus.ON).nodes
+    assert [node.name for node in policy.sort_to_stop(nodes)] == ['expensive', 'slow', 'fast']
+
+
+def get_summary(*failed, succeeded=()):
+    return TransitionSummary(results=tuple(
+        TransitionResult(name=name, action=TransitionAction.ON, error=RuntimeError('boom'), duration=None)
+        for name in failed
+    ) + tuple(
+        TransitionResult(name=name, action=TransitionAction.ON, error=None, duration=None) for name in succeeded
+    ))
+
+
+def test_nodes_failing_in_a_row_get_quarantined():
+    quarantine = Quarantine(max_failures=2, period=600)
+    quarantine.record_transitions(get_summary('build1', 'build2'), now=NOW)
+    quarantine.record_transitions(get_summary('build1', succeeded=['build2']), now=NOW)
+    quarantine.record_transitions(get_summary('build2'), now=NOW)
+    assert quarantine.get_quarantined_nodes(now=NOW) == {'build1'}
+    assert quarantine.get_quarantined_nodes(now=NOW + datetime.timedelta(seconds=599)) == {'build1'}
+    assert quarantine.get_quarantined_nodes(now=NOW + datetime.timedelta(seconds=600)) == set()
+
+
+def test_cancelled_transitions_do_not_reset_the_failures():
+    quarantine = Quarantine(max_failures=2, period=600)
+    quarantine.record_transitions(get_summary('build1'), now=NOW)
+    quarantine.record_transitions(TransitionSummary(results=(
+        TransitionResult(name='build1', action=TransitionAction.OFF, error=TransitionCancelled('busy'), duration=None),
+    )), now=NOW)
+    assert quarantine.get_quarantined_nodes(now=NOW) == set()
+    quarantine.record_transitions(get_summary('build1'), now=NOW)
+    assert quarantine.get_quarantined_nodes(now=NOW) == {'build1'}
@@ -0,0 +1,261 @@
+import time
+
+import pytest
+
+from jam.libs.affinity import AffinityIndex
+from jam.libs.compute_engine import InstanceStatus
+from jam.libs.core import FleetSnapshot, NodeSnapshot, NodeStatus
+from jam.libs.policies import BootTimeSelectionPolicy
+from jam.libs.pools import CapacityPlanner, LabelPool, merge_pools
+
+
+def get_node(name, status, labels, is_idle=True, instance_status=None, executors=1, busy_executors=None):
+    if busy_executors is None:
+        busy_executors = 0 if is_idle else executors
+    return NodeSnapshot(name=name, status=status, is_idle=is_idle, labels=frozenset(labels), transition=None,
+                        instance_status=instance_status, executors=executors, busy_executors=busy_executors)
+
+
+def get_job(label=None):
+    if label is None:
+        return {'why': 'Waiting for next available executor'}
+    return {'why': f'All nodes of label ‘{label}’ are offline'}
+
+
+def get_snapshot(nodes, jobs):
+    return FleetSnapshot(nodes=tuple(nodes), jobs=tuple(jobs), taken_at=None)
+
+
+@pytest.mark.parametrize(['value', 'expected'], [
+    pytest.param('linux', LabelPool('linux', 0, None), id='label'),
+    pytest.param('linux:2', LabelPool('linux', 2, None), id='min'),
+    pytest.param('linux:1:3', LabelPool('linux', 1, 3), id='min-max'),
+    pytest.param('linux::3', LabelPool('linux', 0, 3), id='max'),
+])
+def test_parse_label_pool(value, expected):
+    assert LabelPool.parse(value) == expected
+
+
+@pytest.mark.parametrize(['value'], [
+    pytest.param('', id='empty'),
+    pytest.param('linux:3:1', id='inconsistent'),
+    pytest.param('linux:1:2:3', id='too-many-bounds'),
+    pytest.param('linux:x', id='not-a-number'),
+])
+def test_parse_label_pool_fails(value):
+    with pytest.raises(ValueError):
+        LabelPool.parse(value)
+
+
+def test_plan_starts_only_nodes_able_to_run_the_job():
+    snapshot = get_snapshot([
+        get_node('linux1', NodeStatus.ON, ['linux']),
+        get_node('linux2', NodeStatus.OFF, ['linux']),
+        get_node('windows1', NodeStatus.OFF, ['windows']),
+    ], [get_job('windows')])
+    plan = CapacityPlanner().plan(snapshot)
+    assert plan.to_start == ('windows1',)
+    assert plan.spare == ('linux1',)
+    assert not plan.unserved
+
+
+def test_plan_serves_labelled_jobs_first():
+    snapshot = get_snapshot([
+        get_node('linux1', NodeStatus.ON, ['linux']),
+        get_node('linux2', NodeStatus.OFF, ['linux']),
+    ], [get_job(), get_job('linux')])
+    plan = CapacityPlanner().plan(snapshot)
+    assert list(plan.assignments) == ['linux1']
+    assert plan.assignments['linux1'] == (get_job('linux'),)
+    assert plan.to_start == ('linux2',)
+
+
+def test_plan_unserved_label():
+    snapshot = get_snapshot([get_node('linux1', NodeStatus.OFF, ['linux'])], [get_job('mac')])
+    plan = CapacityPlanner().plan(snapshot)
+    assert plan.to_start == ()
+    assert plan.unserved == ('mac',)
+    assert plan.missing == 1
+
+
+def test_plan_resumes_suspended_nodes_first():
+    snapshot = get_snapshot([
+        get_node('linux1', NodeStatus.OFF, ['linux'], instance_status=InstanceStatus.TERMINATED),
+        get_node('linux2', NodeStatus.OFF, ['linux'], instance_status=InstanceStatus.SUSPENDED),
+    ], [get_job('linux')])
+    assert CapacityPlanner().plan(snapshot).to_start == ('linux2',)
+
+
+def test_plan_pool_max():
+    snapshot = get_snapshot([
+        get_node('linux1', NodeStatus.ON, ['linux'], is_idle=False),
+        get_node('linux2', NodeStatus.OFF, ['linux']),
+        get_node('linux3', NodeStatus.OFF, ['linux']),
+    ], [get_job('linux'), get_job('linux')])
+    plan = CapacityPlanner(pools=[LabelPool('linux', 0, 2)]).plan(snapshot)
+    assert len(plan.to_start) == 1
+    assert plan.unserved == ('linux',)
+
+
+def test_plan_pool_min():
+    snapshot = get_snapshot([
+        get_node('windows1', NodeStatus.ON, ['windows']),
+        get_node('windows2', NodeStatus.OFF, ['windows']),
+        get_node('windows3', NodeStatus.OFF, ['windows']),
+        get_node('linux1', NodeStatus.ON, ['linux']),
+    ], [])
+    plan = CapacityPlanner(pools=[LabelPool('windows', 2)]).plan(snapshot)
+    assert len(plan.to_start) == 1
+    assert plan.spare == ('linux1',)
+
+
+def test_plan_warm_idle_nodes():
+    snapshot = get_snapshot([
+        get_node('linux1', NodeStatus.ON, ['linux']),
+        get_node('linux2', NodeStatus.SWITCHING_ON, ['linux']),
+        get_node('linux3', NodeStatus.ON, ['linux']),
+    ], [get_job()])
+    plan = CapacityPlanner(warm_idle=1).plan(snapshot)
+    assert plan.to_start == ()
+    assert len(plan.spare) == 1
+    assert 'linux2' not in plan.spare
+
+
+def test_plan_label_expression():
+    snapshot = get_snapshot([
+        get_node('linux1', NodeStatus.OFF, ['linux', 'arm']),
+        get_node('linux2', NodeStatus.OFF, ['linux', 'docker']),
+    ], [get_job('linux && !arm'), get_job('linux &&')])
+    plan = CapacityPlanner().plan(snapshot)
+    assert plan.to_start == ('linux2',)
+    assert plan.unserved == ('linux &&',)
+
+
+def test_plan_counts_executors():
+    snapshot = get_snapshot([
+        get_node('linux1', NodeStatus.OFF, ['linux'], executors=4),
+        get_node('linux2', NodeStatus.OFF, ['linux'], executors=4),
+    ], [get_job('linux')] * 5)
+    plan = CapacityPlanner().plan(snapshot)
+    assert sorted(plan.to_start) == ['linux1', 'linux2']
+
+
+def test_plan_packs_jobs_on_partially_busy_nodes():
+    snapshot = get_snapshot([
+        get_node('linux1', NodeStatus.ON, ['linux'], is_idle=False, executors=4, busy_executors=2),
+        get_node('linux2', NodeStatus.ON, ['linux'], executors=2),
+        get_node('linux3', NodeStatus.OFF, ['linux'], executors=2),
+    ], [get_job('linux')] * 3)
+    plan = CapacityPlanner().plan(snapshot)
+    assert plan.assignments == {'linux1': (get_job('linux'),) * 2, 'linux2': (get_job('linux'),)}
+    assert plan.to_start == ()
+    assert plan.spare == ()
+
+
+def test_plan_fully_busy_nodes_are_not_spare():
+    snapshot = get_snapshot([
+        get_node('linux1', NodeStatus.ON, ['linux'], is_idle=False, executors=2, busy_executors=2),
+        get_node('linux2', NodeStatus.ON, ['linux'], executors=2),
+    ], [])
+    assert CapacityPlanner().plan(snapshot).spare == ('linux2',)
+
+
+def test_plan_expected_jobs():
+    snapshot = get_snapshot([
+        get_node('linux1', NodeStatus.ON, ['linux']),
+        get_node('linux2', NodeStatus.ON, ['linux']),
+        get_node('linux3', NodeStatus.OFF, ['linux']),
+    ], [get_job('linux')])
+    plan = CapacityPlanner(expected_jobs=2).plan(snapshot)
+    assert list(plan.assignments.values()) == [(get_job('linux'),)]
+    assert plan.spare == ()
+    assert len(plan.to_start) == 1
+
+
+def test_plan_pool_of_any_node():
+    snapshot = get_snapshot([
+        get_node('linux1', NodeStatus.ON, ['linux']),
+        get_node('linux2', NodeStatus.OFF, ['linux']),
+        get_node('windows1', NodeStatus.OFF, ['windows']),
+    ], [])
+    plan = CapacityPlanner(pools=[LabelPool(label=None, min_nodes=2)]).plan(snapshot)
+    assert len(plan.to_start) == 1
+    assert plan.spare == ()
+
+
+def test_plan_surge():
+    snapshot = get_snapshot([
+        get_node('linux1', NodeStatus.OFF, ['linux']),
+        get_node('linux2', NodeStatus.OFF, ['linux']),
+        get_node('windows1', NodeStatus.OFF, ['windows']),
+    ], [get_job('linux')])
+    plan = CapacityPlanner(surge=['linux']).plan(snapshot)
+    assert sorted(plan.to_start) == ['linux1', 'linux2']
+
+
+def test_plan_follows_the_selection_policy():
+    policy = BootTimeSelectionPolicy(costs={'linux2': 2})
+    policy.boot_times.update(linux3=60, linux4=20)
+    snapshot = get_snapshot([
+        get_node('linux1', NodeStatus.ON, ['linux']),
+        get_node('linux2', NodeStatus.ON, ['linux']),
+        get_node('linux3', NodeStatus.OFF, ['linux']),
+        get_node('linux4', NodeStatus.OFF, ['linux']),
+    ], [get_job('linux')] * 2 + [get_job('windows')])
+    plan = CapacityPlanner(selection_policy=policy).plan(snapshot)
+    assert list(plan.assignments) == ['linux1', 'linux2']
+    assert plan.to_start == ()
+    plan = CapacityPlanner(selection_policy=policy).plan(snapshot._replace(jobs=(get_job('linux'),) * 3))
+    assert plan.to_start == ('linux4',)
+    plan = CapacityPlanner(selection_policy=policy).plan(snapshot._replace(jobs=(get_job('linux'),)))
+    assert plan.spare == ('linux2',)
+
+
+def test_plan_follows_workspace_affinity():
+    affinity = AffinityIndex()
+    affinity.builders = {'http://jenkins/job/project/': ('linux3',)}
+    affinity.last_builds = {'http://jenkins/job/project/': time.time()}
+    job = dict(get_job('linux'), task={'url': 'http://jenkins/job/project/'})
+    snapshot = get_snapshot([
+        get_node('linux1', NodeStatus.OFF, ['linux']),
+        get_node('linux2', NodeStatus.OFF, ['linux']),
+        get_node('linux3', NodeStatus.OFF, ['linux']),
+    ], [job])
+    assert CapacityPlanner(affinity=affinity).plan(snapshot).to_start == ('linux3',)
+    snapshot = get_snapshot([
+        get_node('linux1', NodeStatus.ON, ['linux']),
+        get_node('linux3', NodeStatus.ON, ['linux']),
+    ], [])
+    assert CapacityPlanner(affinity=affinity).plan(snapshot).spare == ('linux1',)
+
+
+def test_plan_leaves_excluded_nodes_alone():
+    snapshot = get_snapshot([
+        get_node('linux1', NodeStatus.SWITCHING_ON, ['linux']),
+        get_node('linux2', NodeStatus.OFF, ['linux']),
+        get_node('linux3', NodeStatus.OFF, ['linux']),
+    ], [get_job('linux')])
+    assert CapacityPlanner().plan(snapshot).to_start == ()
+    assert CapacityPlanner(excluded={'linux1', 'linux2'}).plan(snapshot).to_start == ('linux3',)
+
+
+def test_plan_pool_min_keeps_the_nodes_the_selection_policy_prefers():
+    policy = BootTimeSelectionPolicy(costs={'linux1': 2})
+    snapshot = get_snapshot([
+        get_node('linux1', NodeStatus.ON, ['linux']),
+        get_node('linux2', NodeStatus.ON, ['linux']),
+        get_node('linux3', NodeStatus.ON, ['linux']),
+    ], [])
+    plan = CapacityPlanner(pools=[LabelPool(label='linux', min_nodes=2)], selection_policy=policy).plan(snapshot)
+    assert plan.spare == ('linux1',)
+
+
+@pytest.mark.parametrize(['pools', 'expected'], [
+    pytest.param([LabelPool('linux', 2, None), LabelPool('linux', 4, 6)], (LabelPool('linux', 4, 6),), id='min'),
+    pytest.param([LabelPool('linux', 2, 5), LabelPool('linux', 1, 3)], (LabelPool('linux', 2, 3),), id='max'),
+    pytest.param([LabelPool('linux', 4, None), LabelPool('linux', 0, 2)], (LabelPool('linux', 2, 2),), id='conflict'),
+    pytest.param([LabelPool('linux', 1), LabelPool(None, 1)], (LabelPool('linux', 1), LabelPool(None, 1)),
+                 id='other-labels'),
+])
+def test_merge_pools(pools, expected):
+    assert merge_pools(pools) == expected
@@ -0,0 +1,107 @@
+import mock
+import pytest
+
+import jam.libs.compute_engine
+import jam.libs.jenkins
+from jam.libs.readiness import ReadinessDetector
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    fake_clock = FakeClock()
+    with mock.patch('jam.libs.readiness.time', fake_clock):
+        yield fake_clock
+
+
+def get_instance(outputs):
+    instance = mock.Mock(spec=jam.libs.compute_engine.ComputeEngineInstance)
+    instance.get_serial_port_output.side_effect = outputs
+    return instance
+
+
+def get_agent(clock, online_at, offline_cause=None):
+    agent = mock.Mock(spec=jam.libs.jenkins.JenkinsAgent)
+    agent.name = 'build1'
+    agent.WAIT_TIME_FORCE_LAUNCH = jam.libs.jenkins.JenkinsAgent.WAIT_TIME_FORCE_LAUNCH
+    agent.offline_cause_reason = offline_cause
+    launches = []
+    agent.launch.side_effect = lambda: launches.append(clock.now)
+    type(agent).is_online = mock.PropertyMock(side_effect=lambda: bool(launches) and clock.now >= online_at)
+    return agent, launches
+
+
+def test_agent_is_launched_as_soon_as_the_marker_shows_up(clock):
+    instance = get_instance(
+        [{'contents': 'Booting\n', 'next': '8'}] * 2 + [{'contents': 'Startup finished in 5s\n', 'next': '31'}]
+    )
+    agent, launches = get_agent(clock, online_at=5)
+    ReadinessDetector().bring_online(instance, agent)
+    assert launches == [4]
+    assert clock.now == 5
+    assert [call[1]['start'] for call in instance.get_serial_port_output.call_args_list] == [None, '8', '8']
+
+
+def test_agent_is_still_launched_without_marker(clock):
+    instance = get_instance(lambda start, port: {'contents': 'Booting\n', 'next': '8'})
+    agent, launches = get_agent(clock, online_at=0, offline_cause='hudson.slaves.OfflineCause$LaunchFailed')
+    ReadinessDetector(boot_timeout=20).bring_online(instance, agent)
+    assert launches == [0]
+    assert clock.now == 15
+    assert instance.get_serial_port_output.call_count == 9
+
+
+def test_serial_console_is_given_up_after_the_boot_timeout(clock):
+    instance = get_instance(lambda start, port: {'contents': '', 'next': '0'})
+    agent, launches = get_agent(clock, online_at=100, offline_cause='hudson.slaves.OfflineCause$LaunchFailed')
+    ReadinessDetector(boot_timeout=20).bring_online(instance, agent)
+    assert clock.now == 105
+    assert instance.get_serial_port_output.call_count == 12
+
+
+def test_resumed_instance_does_not_tail_the_console(clock):
+    instance = get_instance([])
+    agent, launches = get_agent(clock, online_at=0, offline_cause='hudson.slaves.OfflineCause$ChannelTermination')
+    ReadinessDetector().bring_online(instance, agent, tail_console=False)
+    instance.get_serial_port_output.assert_not_called()
+    assert launches == [0]
+
+
+def test_unreadable_serial_console(clock):
+    instance = get_instance(jam.libs.compute_engine.ComputeEngineError('boom'))
+    agent, launches = get_agent(clock, online_at=0, offline_cause='hudson.slaves.OfflineCause$LaunchFailed')
+    ReadinessDetector().bring_online(instance, agent)
+    assert launches == [0]
+
+
+def test_serial_console_is_given_up_for_good_when_denied(clock):
+    instance = get_instance(jam.libs.compute_engine.PermissionDenied('forbidden'))
+    detector = ReadinessDetector()
+    for _ in range(2):
+        agent, launches = get_agent(clock, online_at=0, offline_cause='hudson.slaves.OfflineCause$LaunchFailed')
+        detector.bring_online(instance, agent)
+        assert len(launches) == 1
+    assert instance.get_serial_port_output.call_count == 1
+
+
+@pytest.mark.parametrize(['outputs', 'booted', 'duration'], [
+    pytest.param([{'contents': 'Booting\n', 'next': '8'}, {'contents': 'Startup finished in 5s\n', 'next': '31'}],
+                 True, 2, id='booted'),
+    pytest.param(lambda start, port: {'contents': '', 'next': '0'}, False, 22, id='timeout'),
+    pytest.param(jam.libs.compute_engine.PermissionDenied('forbidden'), False, 0, id='denied'),
+])
+def test_wait_for_boot(clock, outputs, booted, duration):
+    instance = get_instance(outputs)
+    instance.name = 'build1'
+    assert ReadinessDetector(boot_timeout=20).wait_for_boot(instance) is booted
+    assert clock.now == duration
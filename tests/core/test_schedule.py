@@ -0,0 +1,92 @@
+import datetime
+
+import pytest
+
+from jam.libs.core import FleetSnapshot, NodeSnapshot, NodeStatus
+from jam.libs.pools import CapacityPlanner, LabelPool
+from jam.libs.schedule import CapacityFloor, CapacitySchedule, parse_days
+from jam.libs.transitions import TransitionAction, TransitionResult, TransitionSummary
+
+
+# A Monday.
+MONDAY = datetime.date(2018, 6, 4)
+
+
+def at(day, hour, minute=0):
+    return datetime.datetime.combine(MONDAY + datetime.timedelta(days=day), datetime.time(hour, minute))
+
+
+@pytest.mark.parametrize(['value', 'expected'], [
+    pytest.param('*', {0, 1, 2, 3, 4, 5, 6}, id='every-day'),
+    pytest.param('mon-fri', {0, 1, 2, 3, 4}, id='range'),
+    pytest.param('Sat,sun', {5, 6}, id='list'),
+    pytest.param('fri-mon', {4, 5, 6, 0}, id='wrapping-range'),
+])
+def test_parse_days(value, expected):
+    assert parse_days(value) == expected
+
+
+def test_parse_capacity_floor():
+    assert CapacityFloor.parse('6 mon-fri 08:45-18:00 linux && docker') == CapacityFloor(
+        min_nodes=6, days=parse_days('mon-fri'), start=datetime.time(8, 45), end=datetime.time(18),
+        label='linux && docker',
+    )
+
+
+@pytest.mark.parametrize(['value'], [
+    pytest.param('6 mon-fri', id='no-window'),
+    pytest.param('6 monday 08:45-18:00', id='bad-day'),
+    pytest.param('6 mon-fri 8h45-18h00', id='bad-time'),
+    pytest.param('-1 mon-fri 08:45-18:00', id='negative'),
+])
+def test_parse_invalid_capacity_floor(value):
+    with pytest.raises(ValueError):
+        CapacityFloor.parse(value)
+
+
+@pytest.mark.parametrize(['when', 'lead_time', 'expected'], [
+    pytest.param(at(0, 8, 44), 0, False, id='before'),
+    pytest.param(at(0, 8, 45), 0, True, id='start'),
+    pytest.param(at(0, 8, 40), 5, True, id='lead-time'),
+    pytest.param(at(4, 17, 59), 0, True, id='friday'),
+    pytest.param(at(0, 18), 0, False, id='end'),
+    pytest.param(at(5, 9), 0, False, id='weekend'),
+])
+def test_capacity_floor_is_active(when, lead_time, expected):
+    floor = CapacityFloor.parse('6 mon-fri 08:45-18:00')
+    assert floor.is_active(when, lead_time=datetime.timedelta(minutes=lead_time)) is expected
+
+
+@pytest.mark.parametrize(['when', 'expected'], [
+    pytest.param(at(4, 23), True, id='friday-night'),
+    pytest.param(at(5, 1), True, id='saturday-morning'),
+    pytest.param(at(5, 23), False, id='saturday-night'),
+])
+def test_capacity_floor_over_midnight(when, expected):
+    assert CapacityFloor.parse('2 fri 22:00-02:00').is_active(when) is expected
+
+
+def test_schedule_lead_time_is_measured():
+    schedule = CapacitySchedule(floors=[CapacityFloor.parse('6 mon-fri 08:45-18:00')], boot_time=60)
+    assert schedule.get_pools(at(0, 8, 40)) == []
+    schedule.record_transitions(TransitionSummary(results=(
+        TransitionResult(name='build1', action=TransitionAction.ON, error=None, duration=datetime.timedelta(minutes=6)),
+        TransitionResult(name='build2', action=TransitionAction.ON, error=ValueError(),
+                         duration=datetime.timedelta(minutes=30)),
+        TransitionResult(name='build3', action=TransitionAction.OFF, error=None,
+                         duration=datetime.timedelta(minutes=30)),
+    )))
+    assert schedule.lead_time == datetime.timedelta(minutes=6)
+    assert schedule.get_pools(at(0, 8, 40)) == [LabelPool(label=None, min_nodes=6)]
+
+
+def test_overlapping_floors_do_not_add_up():
+    schedule = CapacitySchedule(floors=[
+        CapacityFloor.parse('4 mon-fri 08:00-18:00'), CapacityFloor.parse('4 mon-fri 12:00-20:00'),
+    ], boot_time=0)
+    snapshot = FleetSnapshot(nodes=tuple(
+        NodeSnapshot(name=f'build{i}', status=NodeStatus.OFF, is_idle=True, labels=frozenset(), transition=None)
+        for i in range(6)
+    ), jobs=(), taken_at=None)
+    assert len(schedule.get_pools(at(0, 13))) == 2
+    assert len(CapacityPlanner(pools=schedule.get_pools(at(0, 13))).plan(snapshot).to_start) == 4
@@ -0,0 +1,59 @@
+import pytest
+
+from jam.libs.slo import WaitTimeSlo, get_age, get_percentile
+
+
+NOW = 1528100000
+
+
+def get_item(age, label=None):
+    item = {'inQueueSince': (NOW - age) * 1000, 'why': 'Waiting for next available executor'}
+    if label is not None:
+        item['why'] = f'Waiting for next available executor on ‘{label}’'
+    return item
+
+
+def test_get_age():
+    assert get_age(get_item(30), NOW) == 30
+    assert get_age({}, NOW) == 0
+
+
+@pytest.mark.parametrize(['values', 'percentile', 'expected'], [
+    pytest.param([], 90, 0, id='empty'),
+    pytest.param([5], 90, 5, id='single'),
+    pytest.param(list(range(1, 11)), 90, 9, id='p90'),
+    pytest.param(list(range(10, 0, -1)), 50, 5, id='p50-unsorted'),
+    pytest.param(list(range(1, 11)), 100, 10, id='max'),
+])
+def test_get_percentile(values, percentile, expected):
+    assert get_percentile(values, percentile) == expected
+
+
+@pytest.mark.parametrize(['kwargs'], [
+    pytest.param({'target': 0}, id='no-target'),
+    pytest.param({'target': 60, 'percentile': 0}, id='no-percentile'),
+    pytest.param({'target': 60, 'surge_threshold': 1}, id='threshold-at-target'),
+])
+def test_inconsistent_slo(kwargs):
+    with pytest.raises(ValueError):
+        WaitTimeSlo(**kwargs)
+
+
+def test_prioritize():
+    items = [get_item(10), get_item(50), get_item(30)]
+    assert WaitTimeSlo(target=60).prioritize(items, NOW) == [items[1], items[2], items[0]]
+
+
+@pytest.mark.parametrize(['ages', 'expected'], [
+    pytest.param([10, 20], 0, id='far-from-target'),
+    pytest.param([30, 45, 45, 45], 2, id='approaching-target'),
+    pytest.param([60, 90, 120], 3, id='over-target'),
+])
+def test_surge(ages, expected):
+    assert WaitTimeSlo(target=60).get_surge([get_item(age) for age in ages], NOW) == [None] * expected
+
+
+def test_surge_goes_where_it_hurts():
+    items = [get_item(10, 'windows'), get_item(20, 'windows'), get_item(70, 'linux'), get_item(5, 'linux')]
+    assert WaitTimeSlo(target=60, percentile=50).get_surge(items, NOW) == []
+    assert WaitTimeSlo(target=60).get_surge(items, NOW) == ['linux', 'linux']
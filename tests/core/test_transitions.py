@@ -0,0 +1,175 @@
+import threading
+import time
+
+import mock
+import pytest
+
+from jam.libs.core import DrainCancelled
+from jam.libs.transitions import TransitionAction, TransitionPool, perform_transition
+from jam.libs.utils import Deadline, DeadlineExceeded
+
+
+class FakeNode(object):
+    def __init__(self, name, duration=0., error=None, barrier=None):
+        self.name = name
+        self.duration = duration
+        self.error = error
+        self.barrier = barrier
+        self.calls = []
+
+    def __switch(self, action):
+        self.calls.append(action)
+        if self.barrier is not None:
+            self.barrier.wait(timeout=5)
+        time.sleep(self.duration)
+        if self.error is not None:
+            raise self.error
+
+    def on(self, deadline=None):
+        self.__switch('on')
+
+    def off(self, deadline=None):
+        self.__switch('off')
+
+
+class StuckNode(FakeNode):
+    def __init__(self, name):
+        super().__init__(name)
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def on(self, deadline=None):
+        self.calls.append('on')
+        self.started.set()
+        self.release.wait(timeout=5)
+
+
+def test_perform_transition_ok():
+    node = FakeNode('build1')
+    result = perform_transition(node, TransitionAction.ON)
+    assert node.calls == ['on']
+    assert result.name == 'build1'
+    assert result.action is TransitionAction.ON
+    assert result.error is None
+
+
+def test_perform_transition_error_is_collected():
+    error = RuntimeError('boom')
+    result = perform_transition(FakeNode('build1', error=error), 'off')
+    assert result.action is TransitionAction.OFF
+    assert result.error is error
+
+
+def test_pool_runs_transitions_concurrently():
+    barrier = threading.Barrier(3)
+    nodes = [FakeNode(f'build{i}', barrier=barrier) for i in range(3)]
+    summary = TransitionPool(max_workers=3).run(nodes, TransitionAction.ON)
+    assert [result.name for result in summary.results] == ['build0', 'build1', 'build2']
+    assert list(summary.succeeded) == ['build0', 'build1', 'build2']
+    assert not summary.failed
+
+
+def test_pool_collects_errors_per_node():
+    nodes = [FakeNode('build1'), FakeNode('build2', error=RuntimeError('boom')), FakeNode('build3')]
+    summary = TransitionPool(max_workers=2).run(nodes, TransitionAction.OFF)
+    assert list(summary.succeeded) == ['build1', 'build3']
+    assert list(summary.failed) == ['build2']
+    assert str(summary) == '2 succeeded (build1, build3), 1 failed (build2)'
+
+
+def test_pool_reports_cancelled_transitions_apart():
+    nodes = [FakeNode('build1'), FakeNode('build2', error=DrainCancelled('busy')), FakeNode('build3')]
+    summary = TransitionPool(max_workers=2).run(nodes, TransitionAction.OFF)
+    assert list(summary.succeeded) == ['build1', 'build3']
+    assert not summary.failed
+    assert list(summary.cancelled) == ['build2']
+    assert str(summary) == '2 succeeded (build1, build3), 0 failed (), 1 cancelled (build2)'
+
+
+def test_pool_nothing_to_do():
+    assert TransitionPool().run([], TransitionAction.ON).results == ()
+
+
+def test_pool_needs_a_worker():
+    with pytest.raises(ValueError):
+        TransitionPool(max_workers=0)
+
+
+def test_pool_submit_returns_immediately():
+    release = threading.Event()
+    node = FakeNode('build1')
+    node.on = lambda deadline=None: release.wait(timeout=5)
+    pool = TransitionPool(max_workers=1)
+    transition = pool.submit(node, TransitionAction.ON)
+    assert transition.name == 'build1'
+    assert list(pool.in_flight) == ['build1']
+    assert pool.collect().results == ()
+    assert pool.submit(node, TransitionAction.OFF) is transition
+    release.set()
+    summary = pool.wait()
+    assert list(summary.succeeded) == ['build1']
+    assert not pool.in_flight
+    pool.shutdown()
+
+
+def test_pool_cancels_stuck_transitions():
+    node = StuckNode('build1')
+    pool = TransitionPool(max_workers=1, timeout=0.01)
+    transition = pool.submit(node, TransitionAction.ON)
+    assert node.started.wait(timeout=5)
+    time.sleep(0.05)
+    assert pool.collect().results == ()
+    with mock.patch.object(TransitionPool, 'WATCHDOG_GRACE', 0):
+        summary = pool.collect()
+    assert list(summary.failed) == ['build1']
+    assert isinstance(summary.failed['build1'].error, DeadlineExceeded)
+    assert not pool.in_flight
+    assert transition.deadline.cancelled
+    assert list(pool.switching) == ['build1']
+    assert pool.submit(node, TransitionAction.ON) is transition
+    node.release.set()
+    transition.future.result(timeout=5)
+    assert pool.collect().results == ()
+    assert not pool.switching
+    assert node.calls == ['on']
+    pool.shutdown()
+
+
+def test_pool_cancelled_queued_transitions_never_run():
+    stuck, queued = StuckNode('build1'), FakeNode('build2')
+    pool = TransitionPool(max_workers=1)
+    pool.submit(stuck, TransitionAction.ON)
+    pool.submit(queued, TransitionAction.ON)
+    assert stuck.started.wait(timeout=5)
+    assert isinstance(pool.cancel('build2').error, DeadlineExceeded)
+    assert list(pool.switching) == ['build1']
+    stuck.release.set()
+    assert list(pool.wait().succeeded) == ['build1']
+    pool.shutdown()
+    assert queued.calls == []
+
+
+def test_pool_deadline_starts_with_the_worker():
+    stuck, queued = StuckNode('build1'), FakeNode('build2')
+    pool = TransitionPool(max_workers=1, timeout=0.01)
+    pool.submit(stuck, TransitionAction.ON)
+    transition = pool.submit(queued, TransitionAction.ON)
+    assert stuck.started.wait(timeout=5)
+    time.sleep(0.05)
+    assert transition.deadline.started_at is None
+    with mock.patch.object(TransitionPool, 'WATCHDOG_GRACE', 0):
+        assert list(pool.collect().failed) == ['build1']
+    assert list(pool.wait().succeeded) == ['build2']
+    assert queued.calls == ['on']
+    assert list(pool.switching) == ['build1']
+    stuck.release.set()
+    pool.shutdown()
+
+
+def test_perform_transition_cancelled_before_starting():
+    deadline = Deadline()
+    deadline.cancel()
+    node = FakeNode('build1')
+    result = perform_transition(node, TransitionAction.ON, deadline=deadline)
+    assert node.calls == []
+    assert isinstance(result.error, DeadlineExceeded)
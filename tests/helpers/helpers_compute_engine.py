@@ -1,5 +1,9 @@
+import collections
 import contextlib
+import copy
 import datetime
+import functools
+import json
 
 import jam.libs.compute_engine
 
@@ -10,6 +14,96 @@ def make_info_instantly_stale(instance):
     )
 
 
+ExtraMethod = collections.namedtuple('ExtraMethod', ['resource', 'name', 'like', 'path'])
+
+
+@functools.lru_cache(maxsize=1)
+def load_discovery():
+    with open('tests/http/compute-discovery.json', 'r') as f:
+        return json.load(f)
+
+
+def get_discovery(*extra_methods):
+    """Builds the discovery document, with methods that the recorded one does not know about.
+
+    :param ExtraMethod extra_methods: The methods to add, each one built like an existing method of the resource.
+    :return str: The discovery document, serialized.
+    """
+    discovery = copy.deepcopy(load_discovery())
+    for extra_method in extra_methods:
+        methods = discovery['resources'][extra_method.resource]['methods']
+        method = copy.deepcopy(methods[extra_method.like])
+        method.update(
+            id=f'compute.{extra_method.resource}.{extra_method.name}', path=extra_method.path, httpMethod='POST'
+        )
+        methods[extra_method.name] = method
+    return json.dumps(discovery)
+
+
+def get_instance_with_status(instance_file, status):
+    """Builds the response of the ``instances().get()`` API for an instance with another status.
+
+    :param str instance_file: Path to the file holding the instance's response.
+    :param str status: The status of the instance.
+    :return str: The ``compute#instance`` representation, serialized.
+    """
+    with open(instance_file, 'r') as f:
+        instance = json.load(f)
+    instance['status'] = status
+    return json.dumps(instance)
+
+
+SUSPEND = ExtraMethod(resource='instances', name='suspend', like='stop',
+                      path='{project}/zones/{zone}/instances/{instance}/suspend')
+RESUME = ExtraMethod(resource='instances', name='resume', like='start',
+                     path='{project}/zones/{zone}/instances/{instance}/resume')
+
+
+def get_instance_list(instance_files, next_page_token=None):
+    """Builds the response of the ``instances().list()`` API from the responses of the individual instances.
+
+    :param list(str) instance_files: Paths to the files holding the individual instances' responses.
+    :param str next_page_token: The token of the next page of results, if any.
+    :return str: The ``compute#instanceList`` representation, serialized.
+    """
+    instance_list = {
+        'kind': 'compute#instanceList',
+        'id': 'projects/jam-project/zones/europe-west1-b/instances',
+        'selfLink': 'https://www.googleapis.com/compute/v1/projects/jam-project/zones/europe-west1-b/instances',
+    }
+    if instance_files:
+        instance_list['items'] = [json.load(open(instance_file)) for instance_file in instance_files]
+    if next_page_token is not None:
+        instance_list['nextPageToken'] = next_page_token
+    return json.dumps(instance_list)
+
+
+def get_batch_response(responses):
+    """Builds the response of a batch request.
+
+    :param list(tuple) responses: For each request of the batch, its id, its HTTP status and the path to the file
+        holding its response.
+    :return tuple: The headers and the content of the response.
+    """
+    boundary = 'batch_jam'
+    parts = []
+    for request_id, status, response_file in responses:
+        with open(response_file, 'r') as f:
+            body = f.read()
+        parts.append(
+            f'--{boundary}\r\n'
+            f'Content-Type: application/http\r\n'
+            f'Content-ID: <response-jam+{request_id}>\r\n'
+            f'\r\n'
+            f'HTTP/1.1 {status} {"OK" if status == 200 else "Error"}\r\n'
+            f'Content-Type: application/json; charset=UTF-8\r\n'
+            f'\r\n'
+            f'{body}\r\n'
+        )
+    headers = {'status': '200', 'content-type': f'multipart/mixed; boundary={boundary}'}
+    return headers, ''.join(parts) + f'--{boundary}--\r\n'
+
+
 @contextlib.contextmanager
 def no_pause():
     saved_wait_op = jam.libs.compute_engine.TIME_SLEEP_WAIT_FOR_OPERATION
@@ -3,6 +3,7 @@ import contextlib
 import mock
 
 import jam.libs.core
+import jam.libs.policies
 import tests.helpers.helpers_compute_engine
 
 
@@ -14,6 +15,7 @@ def get_jam():
         project='jam-project',
         gce_zone='europe-west1-b',
         usable_nodes=['build1', 'build2'],
+        scale_down_policy=jam.libs.policies.ScaleDownPolicy(min_idle_time=0, cooldown=0, min_run_time=0),
     )
     return manager
 
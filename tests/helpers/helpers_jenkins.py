@@ -9,6 +9,18 @@ def get_base_url():
     return 'mock://jenkins.mydomain.com:8080'
 
 
+def get_computer_set(agent_files):
+    """Builds the response of the ``computer/api/json`` API from the responses of the individual agents.
+
+    :param list(str) agent_files: Paths to the files holding the individual agents' responses.
+    :return dict: The ``hudson.model.ComputerSet`` representation.
+    """
+    return {
+        '_class': 'hudson.model.ComputerSet',
+        'computer': [json.load(open(agent_file)) for agent_file in agent_files],
+    }
+
+
 def headers_to_dict(header_file):
     """Reads from a header file and generates a ``dict`` from it.
 
@@ -52,3 +64,19 @@ def inject_crumb_issuer(rmock, status_code):
                 ),
             },
         ])
+
+
+def get_drained_agent(agent_file, reason='jam.drain'):
+    """Builds the response of an agent that has been drained, from the response of the agent.
+
+    :param str agent_file: Path to the file holding the agent's response.
+    :param str reason: The offline message, ``jam.stop`` once the drained agent has been disconnected.
+    :return dict: The ``hudson.slaves.SlaveComputer`` representation, temporarily offline.
+    """
+    return dict(
+        json.load(open(agent_file)),
+        offline=True,
+        temporarilyOffline=True,
+        offlineCause={'_class': 'hudson.slaves.OfflineCause$UserCause'},
+        offlineCauseReason=reason,
+    )
@@ -34,3 +34,63 @@ def test_api_call_no_settings(api_call):
     del api_call.api_settings
     with pytest.raises(AttributeError):
         api_call('get', 'some/api')
+
+
+def test_crumb_is_cached_across_calls(base_url, api_call, crumb_url):
+    with requests_mock.mock() as rmock:
+        tests.helpers.helpers_jenkins.inject_crumb_issuer(rmock, 200)
+        rmock.register_uri('GET', f'{base_url}/some/api', [
+            {'json': {}, 'status_code': 200},
+        ])
+        for _ in range(3):
+            assert api_call('get', 'some/api').json() == {}
+        assert [request.url for request in rmock.request_history].count(crumb_url) == 1
+
+
+def test_crumb_is_issued_again_when_forbidden(base_url, api_call, crumb_url):
+    with requests_mock.mock() as rmock:
+        tests.helpers.helpers_jenkins.inject_crumb_issuer(rmock, 200)
+        rmock.register_uri('GET', f'{base_url}/some/api', [
+            {'json': {}, 'status_code': 200},
+            {'json': {}, 'status_code': 403},
+            {'json': {}, 'status_code': 200},
+        ])
+        assert api_call('get', 'some/api').status_code == 200
+        assert api_call('get', 'some/api').status_code == 200
+        assert [request.url for request in rmock.request_history].count(crumb_url) == 2
+
+
+def test_crumb_is_issued_again_when_session_is_replaced(base_url, api_call, crumb_url):
+    with requests_mock.mock() as rmock:
+        tests.helpers.helpers_jenkins.inject_crumb_issuer(rmock, 200)
+        rmock.register_uri('GET', f'{base_url}/some/api', [
+            {'json': {}, 'status_code': 200},
+        ])
+        api_call('get', 'some/api')
+        api_call.api_settings.session.reset()
+        api_call('get', 'some/api')
+        assert [request.url for request in rmock.request_history].count(crumb_url) == 2
+
+
+def test_session_is_kept_across_calls(base_url, api_call):
+    with requests_mock.mock() as rmock:
+        tests.helpers.helpers_jenkins.inject_crumb_issuer(rmock, 200)
+        rmock.register_uri('GET', f'{base_url}/some/api', [
+            {'json': {}, 'status_code': 200},
+        ])
+        api_call('get', 'some/api')
+        session = api_call.api_settings.session.session
+        api_call('get', 'some/api')
+        assert api_call.api_settings.session.session is session
+
+
+def test_calls_time_out(base_url, api_call):
+    with requests_mock.mock() as rmock:
+        tests.helpers.helpers_jenkins.inject_crumb_issuer(rmock, 200)
+        rmock.register_uri('GET', f'{base_url}/some/api', [
+            {'json': {}, 'status_code': 200},
+        ])
+        api_call('get', 'some/api')
+        timeout = api_call.api_settings.session.timeout
+        assert timeout is not None
+        assert [request.timeout for request in rmock.request_history] == [timeout, timeout]
@@ -14,6 +14,14 @@ def test_jenkins_get_agent(jenkins):
     assert agent.name == 'build1'
 
 
+def test_jenkins_agents_share_the_session(jenkins):
+    agent1 = jenkins.get_agent('build1')
+    agent2 = jenkins.get_agent('build2')
+    assert agent1.api_settings.session is jenkins.api_session
+    assert agent2.api_settings.session is jenkins.api_session
+    assert jenkins.get_agent('build1') is agent1
+
+
 def test_jenkins_get_jobs_fail(jenkins):
     with requests_mock.mock() as rmock:
         tests.helpers.helpers_jenkins.inject_crumb_issuer(rmock, 403)
@@ -58,3 +66,89 @@ def test_jenkins_get_jobs_one_item_in_queue(jenkins, base_url):
         ])
         jobs = jenkins.jobs
         assert len(jobs) == 1
+
+
+def test_jenkins_refresh_agents(jenkins, base_url):
+    build1 = jenkins.get_agent('build1')
+    build2 = jenkins.get_agent('build2')
+    with requests_mock.mock() as rmock:
+        tests.helpers.helpers_jenkins.inject_crumb_issuer(rmock, 200)
+        rmock.register_uri('GET', f'{base_url}/computer/api/json', [
+            {
+                'json': tests.helpers.helpers_jenkins.get_computer_set([
+                    'tests/http/jenkins.build1.busy.json',
+                    'tests/http/jenkins.build2.offline-terminated.json',
+                ]),
+                'status_code': 200
+            },
+        ])
+        jenkins.refresh_agents()
+
+        assert not build1.is_idle and build1.is_online
+        assert build1.labels == {'agent', 'build1', 'windows-agent'}
+        assert build2.is_offline
+        assert rmock.call_count == 2
+
+
+def test_jenkins_refresh_agents_ignores_unknown_agents(jenkins, base_url):
+    build3 = jenkins.get_agent('build3')
+    with requests_mock.mock() as rmock:
+        tests.helpers.helpers_jenkins.inject_crumb_issuer(rmock, 200)
+        rmock.register_uri('GET', f'{base_url}/computer/api/json', [
+            {
+                'json': tests.helpers.helpers_jenkins.get_computer_set(['tests/http/jenkins.build1.busy.json']),
+                'status_code': 200
+            },
+        ])
+        jenkins.refresh_agents()
+        assert build3.info == {}
+
+
+def test_jenkins_refresh_agents_fail(jenkins):
+    jenkins.get_agent('build1')
+    with requests_mock.mock() as rmock:
+        tests.helpers.helpers_jenkins.inject_crumb_issuer(rmock, 403)
+        with pytest.raises(requests.ConnectionError):
+            jenkins.refresh_agents()
+
+
+def test_jenkins_get_build_history(jenkins, base_url):
+    with requests_mock.mock() as rmock:
+        tests.helpers.helpers_jenkins.inject_crumb_issuer(rmock, 200)
+        rmock.register_uri('GET', f'{base_url}/api/json', [
+            {
+                'json': {'jobs': [
+                    {'url': f'{base_url}/job/freestyle/', 'builds': [
+                        {'builtOn': 'build1', 'timestamp': 1528100000000},
+                        {'builtOn': '', 'timestamp': 1528000000000},
+                    ]},
+                    {'url': f'{base_url}/job/pipeline/', 'builds': [{'timestamp': 1528100000000}]},
+                    {'url': f'{base_url}/job/never-built/', 'builds': []},
+                    {'url': f'{base_url}/job/folder/', 'jobs': [
+                        {'url': f'{base_url}/job/folder/job/nested/', 'builds': [
+                            {'builtOn': 'build2', 'timestamp': 1528200000000},
+                        ]},
+                    ]},
+                ]},
+                'status_code': 200
+            },
+        ])
+        history = jenkins.get_build_history(depth=3, folder_depth=1)
+        assert rmock.last_request.qs['tree'] == [
+            'jobs[url,builds[builton,timestamp]{0,3},jobs[url,builds[builton,timestamp]{0,3}]]'
+        ]
+    assert history == [
+        (f'{base_url}/job/freestyle/', 'build1', 1528100000),
+        (f'{base_url}/job/folder/job/nested/', 'build2', 1528200000),
+    ]
+
+
+@pytest.mark.parametrize(['info', 'expected'], [
+    pytest.param({'temporarilyOffline': True, 'offlineCauseReason': 'jam.drain'}, True, id='drained'),
+    pytest.param({'temporarilyOffline': True, 'offlineCauseReason': 'jam.stop'}, True, id='stopped'),
+    pytest.param({'temporarilyOffline': True, 'offlineCauseReason': 'maintenance'}, False, id='someone-else'),
+    pytest.param({'temporarilyOffline': False, 'offlineCauseReason': ''}, False, id='online'),
+    pytest.param({}, False, id='unknown'),
+])
+def test_agent_get_is_drained(info, expected):
+    assert jam.libs.jenkins.JenkinsAgent.get_is_drained(info) is expected
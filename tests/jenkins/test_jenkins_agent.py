@@ -6,6 +6,7 @@ import requests
 import requests_mock
 
 import jam.libs.jenkins
+from jam.libs.utils import Deadline, DeadlineExceeded
 import tests.helpers.helpers_jenkins
 
 
@@ -128,6 +129,19 @@ def test_force_launch(jenkins_agent):
             assert jenkins_agent.is_online
 
 
+def test_force_launch_deadline(jenkins_agent):
+    deadline = Deadline()
+    deadline.cancel()
+    with requests_mock.mock() as rmock:
+        tests.helpers.helpers_jenkins.inject_crumb_issuer(rmock, 200)
+        rmock.register_uri('GET', f'{jenkins_agent.url}/api/json', [
+            {'json': json.load(open('tests/http/jenkins.build1.offline-terminated.json')), 'status_code': 200},
+        ])
+        with pytest.raises(DeadlineExceeded, match='agent build1 to be online'):
+            jenkins_agent.force_launch(deadline=deadline)
+        assert not any(request.method == 'POST' for request in rmock.request_history)
+
+
 def test_launch(jenkins_agent):
     with mock.patch('jam.libs.jenkins.JenkinsAgent.WAIT_TIME_FORCE_LAUNCH', 0):
         with mock.patch.object(jam.libs.jenkins.JenkinsAgent, 'api_call') as mock_api_call:
@@ -142,6 +156,49 @@ def test_stop(jenkins_agent):
         mock_api_call.assert_called_once_with('post', 'doDisconnect?offlineMessage=jam.stop')
 
 
+def test_drain_and_undrain(jenkins_agent):
+    with requests_mock.mock() as rmock:
+        tests.helpers.helpers_jenkins.inject_crumb_issuer(rmock, 200)
+        rmock.register_uri('GET', f'{jenkins_agent.url}/api/json', [
+            {'json': tests.helpers.helpers_jenkins.get_drained_agent('tests/http/jenkins.build1.idle.json'),
+             'status_code': 200},
+        ])
+        rmock.register_uri('POST', f'{jenkins_agent.url}/toggleOffline', [{'text': '', 'status_code': 200}])
+        jenkins_agent.drain()
+        jenkins_agent.undrain()
+    assert [request.path_url.split('/')[-1] for request in rmock.request_history if request.method == 'POST'] == [
+        'toggleOffline?offlineMessage=jam.drain', 'toggleOffline',
+    ]
+
+
+def test_undrain_leaves_other_offline_marks(jenkins_agent):
+    with requests_mock.mock() as rmock:
+        tests.helpers.helpers_jenkins.inject_crumb_issuer(rmock, 200)
+        rmock.register_uri('GET', f'{jenkins_agent.url}/api/json', [
+            {'json': json.load(open('tests/http/jenkins.build1.temporarilyoffline.json')), 'status_code': 200},
+        ])
+        jenkins_agent.undrain()
+    assert not any(request.method == 'POST' for request in rmock.request_history)
+
+
+def test_drain_fails(jenkins_agent):
+    with requests_mock.mock() as rmock:
+        tests.helpers.helpers_jenkins.inject_crumb_issuer(rmock, 200)
+        rmock.register_uri('POST', f'{jenkins_agent.url}/toggleOffline', [{'text': 'oops', 'status_code': 500}])
+        with pytest.raises(requests.HTTPError):
+            jenkins_agent.drain()
+
+
+@pytest.mark.parametrize(['reason', 'expected'], [
+    pytest.param('jam.drain', True, id='drained'),
+    pytest.param('testing purposes', False, id='temporarily-offline'),
+])
+def test_is_drained(jenkins_agent, reason, expected):
+    info = json.load(open('tests/http/jenkins.build1.temporarilyoffline.json'))
+    jenkins_agent.update_info(dict(info, offlineCauseReason=reason))
+    assert jenkins_agent.is_drained is expected
+
+
 def test_labels_several(jenkins_agent):
     with requests_mock.mock() as rmock:
         tests.helpers.helpers_jenkins.inject_crumb_issuer(rmock, 200)
@@ -170,3 +227,30 @@ def test_labels_none(jenkins_agent):
         assert jenkins_agent.labels == set()
         jenkins_agent.refresh()
         assert jenkins_agent.labels == set()
+
+
+def test_status_is_not_refreshed_while_fresh(jenkins_agent):
+    with requests_mock.mock() as rmock:
+        tests.helpers.helpers_jenkins.inject_crumb_issuer(rmock, 200)
+        rmock.register_uri('GET', f'{jenkins_agent.url}/api/json', [
+            {'json': json.load(open('tests/http/jenkins.build1.idle.json')), 'status_code': 200},
+            {'json': json.load(open('tests/http/jenkins.build1.busy.json')), 'status_code': 200},
+        ])
+        assert jenkins_agent.is_idle
+        assert jenkins_agent.is_idle
+        jenkins_agent.invalidate()
+        assert not jenkins_agent.is_idle
+
+
+@pytest.mark.parametrize(['info', 'expected'], [
+    pytest.param({'numExecutors': 4, 'idle': False,
+                  'executors': [{'idle': True}, {'idle': False}, {'idle': False}, {'idle': True}]},
+                 (4, 2), id='executors'),
+    pytest.param({'numExecutors': 2, 'idle': False, 'executors': [{}, {}]}, (2, 2), id='busy-without-details'),
+    pytest.param({'numExecutors': 2, 'idle': True, 'executors': [{}, {}]}, (2, 0), id='idle-without-details'),
+    pytest.param({}, (1, 0), id='nothing'),
+])
+def test_executor_count(info, expected):
+    count = jam.libs.jenkins.ExecutorCount.from_info(info)
+    assert count == expected
+    assert count.free == expected[0] - expected[1]
@@ -34,8 +34,91 @@ def test_args_ok(argv):
     args = jam.startup.parse_args()
     assert ['build1', 'build2'] == args.nodes
     assert 'europe-west1-b' == args.gce_zone
+    assert args.max_parallel_transitions == 4
+    assert args.instance_fields == 'name,status,selfLink,lastStartTimestamp'
+    assert args.instance_filter is None
+    assert args.discovery_cache_ttl == 86400
+    assert args.suspended_nodes == []
+    assert (args.warm_idle_nodes, args.warm_suspended_nodes) == (0, 0)
+    assert (args.min_idle_time, args.scale_up_cooldown, args.min_run_time) == (120, 60, 60)
+    assert args.label_pools == []
+    assert (args.forecast_model, args.forecast_horizon) == (None, 300)
+    assert jam.startup.build_forecaster(args) is None
+    assert (args.capacity_floors, args.boot_time) == ([], 180)
+    assert jam.startup.build_schedule(args) is None
+    assert jam.startup.build_slo(args) is None
+    assert isinstance(jam.startup.build_selection_policy(args), jam.libs.policies.BootTimeSelectionPolicy)
+    assert jam.startup.build_affinity(args) is None
+    assert jam.startup.build_readiness(args).boot_timeout == 600
+    assert args.transition_timeout == 900
+    assert (args.quarantine_failures, args.quarantine_period) == (3, 1800)
     assert set(vars(args).keys()) == {'project', 'jenkins_api_token', 'jenkins_url', 'gce_zone', 'nodes',
-                                      'jenkins_username'}
+                                      'jenkins_username', 'max_parallel_transitions', 'instance_fields',
+                                      'instance_filter', 'discovery_cache_dir', 'discovery_cache_ttl',
+                                      'suspended_nodes', 'warm_idle_nodes', 'warm_suspended_nodes',
+                                      'min_idle_time', 'scale_up_cooldown', 'min_run_time', 'label_pools',
+                                      'forecast_model', 'forecast_horizon', 'forecast_state', 'capacity_floors',
+                                      'boot_time', 'wait_time_target', 'wait_time_percentile',
+                                      'selection_policy', 'node_costs', 'workspace_affinity',
+                                      'affinity_refresh_interval', 'affinity_active_period', 'boot_marker',
+                                      'boot_marker_timeout', 'transition_timeout', 'quarantine_failures',
+                                      'quarantine_period'}
+
+
+def test_args_label_pools(argv):
+    sys.argv[1:] = argv + ['--label-pool=windows:1:2', '--label-pool=linux', 'build1', 'build2']
+    args = jam.startup.parse_args()
+    assert args.label_pools == [
+        jam.libs.pools.LabelPool(label='windows', min_nodes=1, max_nodes=2),
+        jam.libs.pools.LabelPool(label='linux', min_nodes=0, max_nodes=None),
+    ]
+
+
+def test_args_forecast(argv, tmpdir):
+    state_path = str(tmpdir.join('forecast.json'))
+    sys.argv[1:] = argv + ['--forecast-model=seasonal', '--forecast-horizon=600', f'--forecast-state={state_path}',
+                           'build1']
+    forecaster = jam.startup.build_forecaster(jam.startup.parse_args())
+    assert isinstance(forecaster.model, jam.libs.forecast.SeasonalModel)
+    assert (forecaster.horizon, forecaster.state_path) == (600, state_path)
+
+
+def test_args_capacity_floors(argv):
+    sys.argv[1:] = argv + ['--capacity-floor=6 mon-fri 08:45-18:00', '--capacity-floor=2 * 00:00-00:00 linux',
+                           'build1']
+    schedule = jam.startup.build_schedule(jam.startup.parse_args())
+    assert [(floor.min_nodes, floor.label) for floor in schedule.floors] == [(6, None), (2, 'linux')]
+
+
+def test_args_wait_time_slo(argv):
+    sys.argv[1:] = argv + ['--wait-time-target=60', '--wait-time-percentile=95', 'build1']
+    slo = jam.startup.build_slo(jam.startup.parse_args())
+    assert (slo.target, slo.percentile) == (60, 95)
+
+
+def test_args_selection_policy(argv):
+    sys.argv[1:] = argv + ['--node-cost=build1=2.5', '--node-cost=build2=1', 'build1', 'build2']
+    assert jam.startup.build_selection_policy(jam.startup.parse_args()).costs == {'build1': 2.5, 'build2': 1}
+    sys.argv[1:] = argv + ['--selection-policy=random', 'build1']
+    assert isinstance(jam.startup.build_selection_policy(jam.startup.parse_args()),
+                      jam.libs.policies.RandomSelectionPolicy)
+
+
+def test_args_workspace_affinity(argv):
+    sys.argv[1:] = argv + ['--workspace-affinity', '--affinity-active-period=600', 'build1']
+    affinity = jam.startup.build_affinity(jam.startup.parse_args())
+    assert (affinity.refresh_interval, affinity.active_period) == (300, 600)
+
+
+def test_args_no_boot_marker(argv):
+    sys.argv[1:] = argv + ['--boot-marker=', 'build1']
+    assert jam.startup.build_readiness(jam.startup.parse_args()) is None
+
+
+def test_args_quarantine(argv):
+    sys.argv[1:] = argv + ['--quarantine-failures=2', '--quarantine-period=600', 'build1']
+    quarantine = jam.startup.build_quarantine(jam.startup.parse_args())
+    assert (quarantine.max_failures, quarantine.period.total_seconds()) == (2, 600)
 
 
 def test_args_no_node(argv, capsys):
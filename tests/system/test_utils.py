@@ -1,7 +1,9 @@
+import mock
 import pytest
 
 import jam.libs
 import jam.libs.utils
+from jam.libs.utils import Deadline, DeadlineExceeded
 
 
 @pytest.mark.parametrize(['dicts', 'expected_dict'], [
@@ -33,3 +35,44 @@ import jam.libs.utils
 ])
 def test_merge_dicts(dicts, expected_dict):
     assert jam.libs.utils.merge_dicts(*dicts) == expected_dict
+
+
+def test_deadline():
+    with mock.patch('jam.libs.utils.time.monotonic', return_value=100):
+        deadline = Deadline(10)
+        deadline.check('nothing')
+    with mock.patch('jam.libs.utils.time.monotonic', return_value=105):
+        assert (deadline.remaining, deadline.get_sleep(2), deadline.get_sleep(30)) == (5, 2, 5)
+        assert not deadline.expired
+    with mock.patch('jam.libs.utils.time.monotonic', return_value=115):
+        assert deadline.expired and not deadline.overdue(10)
+        with pytest.raises(DeadlineExceeded, match='Still waiting for something after 10s'):
+            deadline.check('something')
+    with mock.patch('jam.libs.utils.time.monotonic', return_value=121):
+        assert deadline.overdue(10)
+
+
+def test_deadline_forever_until_cancelled():
+    deadline = Deadline()
+    assert (deadline.remaining, deadline.get_sleep(30)) == (None, 30)
+    assert not deadline.expired and not deadline.overdue(0)
+    deadline.cancel()
+    assert deadline.expired
+    with pytest.raises(DeadlineExceeded, match='Cancelled while waiting for something'):
+        deadline.check('something')
+
+
+def test_deadline_not_started():
+    deadline = Deadline(0, started=False)
+    deadline.check('something')
+    assert not deadline.expired and not deadline.overdue(0)
+    deadline.start()
+    assert deadline.expired
+
+
+def test_write_atomically(tmpdir):
+    path = str(tmpdir.join('cache', 'state.json'))
+    jam.libs.utils.write_atomically(path, '{}')
+    jam.libs.utils.write_atomically(path, '{"a": 4}')
+    assert open(path).read() == '{"a": 4}'
+    assert tmpdir.join('cache').listdir() == [tmpdir.join('cache', 'state.json')]